@@ -2,245 +2,374 @@
 
 import os
 import json
-import sys
+import time
 import asyncio
-import tempfile
+import socket
+import hashlib
 import logging
+import secrets
 from datetime import datetime
+from contextlib import asynccontextmanager
+from collections import OrderedDict
 from fastapi import HTTPException
-from config import AGENTS_DIR, API_BASE_URL, AUTH_TOKEN, DEFAULT_MODEL
+from config import AGENTS_DIR, API_BASE_URL, AUTH_TOKEN, DEFAULT_MODEL, AGENT_SESSIONS
+from config import COMPLETION_CACHE, COMPLETION_CACHE_DIR, COMPLETION_CACHE_ENTRIES, GATEWAY_URL
+from config import COMPLETION_CACHE_MAX_MB, COMPLETION_CACHE_TTL
+from config import AGENT_COMPLETION_CONCURRENCY, AGENT_TOKEN_BUDGET_FACTOR, AGENT_TURN_TIMEOUT
+from config import SESSION_IDLE_TTL, STATE_SWEEP_SECONDS
+from execution_backends import backend_for_agent, warm_execution_backends, close_execution_backends
+from session_reaper import SessionReaper
+from state_store import store
+from auth import gateway_key
+from agent_runtime import protocol
+from agent_runtime.tracing import NOOP_SPAN
+from sse import TokenCoalescer, new_message_event
+from tokenizer import TokenCounter, count_message_tokens
+from metrics import registry, Gauge
+from metrics import agent_start_seconds, agent_worker_acquire_seconds, agent_start_failures
+from metrics import agent_first_token_seconds, agent_turn_seconds, agent_tokens_per_second
+from metrics import agent_prompt_tokens, agent_completion_tokens, sessions_reaped
+import tracing
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Keep track of running agent processes - keyed by user token
-user_agent_processes = {}
+# Keep track of running agent processes - keyed by user token, least recently used first
+user_agent_processes = OrderedDict()
+
+# This backend process, recorded in the state store as the owner of the sessions it holds workers for
+OWNER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+# Background task releasing sessions that another backend process has taken over
+_sweep_task = None
+
+# Locks making session creation single-flight: process key -> [lock, requests holding or waiting for it]
+_creating = {}
+
+
+# Connection settings for the Environment, sent once per worker
+def environment_config():
+    return {
+        # Through the backend's LLM gateway when one is configured
+        "api_base_url": GATEWAY_URL or API_BASE_URL,
+        # Agents using the gateway get its key, the gateway adds the upstream credential
+        "auth_token": gateway_key() if GATEWAY_URL else AUTH_TOKEN,
+        "default_model": DEFAULT_MODEL,
+        # Workers see the cache directory at the same path, see the backends' mounts
+        "completion_cache": {
+            "dir": COMPLETION_CACHE_DIR, "entries": COMPLETION_CACHE_ENTRIES,
+            "max_bytes": COMPLETION_CACHE_MAX_MB * 2 ** 20, "ttl": COMPLETION_CACHE_TTL,
+        } if COMPLETION_CACHE else None,
+        "max_concurrency": AGENT_COMPLETION_CONCURRENCY,
+    }
+
+
+# Prepare every agent's backend so the first request finds a warm worker
+async def warm_agent_pools():
+    """Warm container pools, the fork server and other backends in the background"""
+    global _sweep_task
+    session_reaper.start()
+    if store.shared and AGENT_SESSIONS:
+        _sweep_task = asyncio.create_task(release_moved_sessions())
+    if COMPLETION_CACHE:
+        os.makedirs(COMPLETION_CACHE_DIR, exist_ok=True)
+    await warm_execution_backends()
+
+
+async def shutdown_agent_pools():
+    """Stop live sessions, pooled containers, the fork server and other backend resources"""
+    if _sweep_task and not _sweep_task.done():
+        _sweep_task.cancel()
+        await asyncio.gather(_sweep_task, return_exceptions=True)
+    await session_reaper.stop()
+    await close_execution_backends()
+
+
+# Digest of a message list, used to check that a session's history is a prefix of a request
+def messages_digest(messages):
+    return hashlib.sha256(json.dumps(messages, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+# State store key of a session's shared record
+def session_key(process_key):
+    return f"session:{process_key}"
+
+
+# Shared record of a session: who holds its worker and what the worker has seen
+def session_record(session):
+    return {
+        "owner": OWNER_ID,
+        "worker": session["worker_name"],
+        "agent": session["agent_name"],
+        "backend": session["backend"].name,
+        "started_at": session["started_at"].isoformat(),
+        "last_message_time": session["last_message_time"].isoformat(),
+        "message_count": session["message_count"],
+    }
+
+
+# Reuse the live worker of a (user, agent) session
+async def claim_session(process_key, version):
+    """Return the session for this key with its turn lock held, or None if a new one is needed"""
+    session = user_agent_processes.get(process_key)
+    if not AGENT_SESSIONS or session is None:
+        return None
+
+    await session["lock"].acquire()
+
+    # The session may have been torn down while we waited for the lock
+    if user_agent_processes.get(process_key) is not session:
+        session["lock"].release()
+        return await claim_session(process_key, version)
+
+    # A dead worker or an outdated agent cannot continue the session
+    if not session["worker"].is_alive() or session["version"] != version:
+        logger.info(f"Replacing session worker: {session['worker_name']}")
+        await close_session(process_key, session)
+        return None
+
+    # Another backend process served a turn of this session since; its history is newer
+    if store.shared:
+        try:
+            record = await store.get(session_key(process_key))
+        except Exception as e:
+            # Without the store the local worker is the best guess
+            logger.error(f"Error checking session ownership: {str(e)}")
+            record = None
+        if record is not None and record["owner"] != OWNER_ID:
+            logger.info(f"Session moved to {record['owner']}, replacing worker: {session['worker_name']}")
+            await close_session(process_key, session)
+            return None
+
+    return session
+
+
+# Serialize the creation of a session, so concurrent first turns share one worker
+@asynccontextmanager
+async def creation_lock(process_key):
+    entry = _creating.setdefault(process_key, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            del _creating[process_key]
 
 
-# Function to inject Environment module into agent file
-async def create_agent_entrypoint(agent_path, messages, max_tokens):
-    """Create a temporary Python file that injects the Environment class into the agent"""
+# Build the job for one turn, containing only what the worker has not seen yet
+def build_session_job(session, messages, max_tokens):
+    job = {"params": {"max_tokens": max_tokens}}
 
-    # Ensure the AUTH_TOKEN is properly JSON serialized
-    auth_token_json = json.dumps(AUTH_TOKEN)
+    count = session["message_count"]
+    if count and len(messages) >= count and messages_digest(messages[:count]) == session["history_digest"]:
+        job["messages"] = messages[count:]
+    else:
+        # History was edited or the session is new, start over with the full conversation
+        job["reset"] = True
+        job["messages"] = messages
 
-    env_module = f"""# Injected Environment module
-import os
-import json
-import sys
-import asyncio
-from typing import List, Dict, Any, Optional
-from openai import OpenAI
-
-class Environment:
-    def __init__(self):
-        self.messages = {json.dumps(messages)}
-        self.api_base_url = "{API_BASE_URL}"
-        self.auth_token = {auth_token_json}  # Properly JSON serialized token
-        self.default_model = "{DEFAULT_MODEL}"
-        self.max_tokens = {max_tokens}
-        self.is_done = False
-        self.current_reply = ""
-
-        # Initialize OpenAI client
-        self.client = OpenAI(
-            api_key="dummy",  # Will be overridden by auth header
-            base_url=self.api_base_url
-        )
+    session["message_count"] = len(messages)
+    session["history_digest"] = messages_digest(messages)
 
-    def list_messages(self):
-        \"\"\"Return the list of messages to be processed\"\"\"
-        return self.messages
-
-    def completion(self, messages, model=None, temperature=0.7, frequency_penalty=0, n=1, stream=True, max_tokens=None):
-        \"\"\"Make a completion request to the OpenAI API\"\"\"
-        # Create custom headers with auth token
-        headers = {{"Authorization": f"Bearer {{self.auth_token}}"}}
-
-        response = self.client.chat.completions.create(
-            model=model or self.default_model,
-            messages=messages,
-            temperature=temperature,
-            frequency_penalty=frequency_penalty,
-            n=n,
-            stream=stream,
-            max_tokens=max_tokens or self.max_tokens,
-            extra_headers=headers
-        )
+    if not session["configured"]:
+        job["config"] = environment_config()
+        session["configured"] = True
 
-        # If streaming, process the stream
-        collected_content = ""
-        if stream:
-            for chunk in response:
-                if chunk.choices and len(chunk.choices) > 0 and chunk.choices[0].delta.content:
-                    content = chunk.choices[0].delta.content
-                    collected_content += content
-                    # Print with DATA: prefix and JSON encode to preserve all characters
-                    # This ensures newlines are properly preserved
-                    print(f"DATA:{{json.dumps(content)}}", flush=True)
-
-            self.current_reply = collected_content
-            return collected_content
-        else:
-            # For non-streaming, return the complete response
-            content = response.choices[0].message.content
-            self.current_reply = content
-            print(f"DATA:{{json.dumps(content)}}", flush=True)
-            return content
+    return job
 
-    def add_reply(self, reply):
-        \"\"\"Add a new message to the chat from the AI\"\"\"
-        # If reply is provided, use it; otherwise use the stored current_reply
-        content = reply if reply else self.current_reply
 
-        if content and not content.isspace():
-            # JSON encode to preserve all characters including newlines
-            print(f"NEW_MESSAGE:{{json.dumps(content)}}", flush=True)
-            print(f"DEBUG: Sent new message: {{content[:30]}}", flush=True)
+# End of a turn: keep the session for the next one, or tear it down
+async def finish_turn(process_key, session, turn_complete):
+    if AGENT_SESSIONS and turn_complete and session["worker"].is_alive():
+        session_reaper.touch(process_key)
+        try:
+            await store.set(session_key(process_key), session_record(session), ttl=SESSION_IDLE_TTL)
+        except Exception as e:
+            logger.error(f"Error updating session record {process_key}: {str(e)}")
+        session["lock"].release()
+        return
 
-        # Store this as the current reply
-        self.current_reply = content
+    # Interrupted turns leave the worker mid-run, it cannot be reused
+    await close_session(process_key, session)
 
-    def mark_done(self):
-        \"\"\"Mark the agent as done with processing\"\"\"
-        self.is_done = True
-        print("DONE", flush=True)
 
-# Instantiate Environment
-env = Environment()
+# Forget a session and stop its worker
+async def close_session(process_key, session):
+    if user_agent_processes.get(process_key) is session:
+        user_agent_processes.pop(process_key)
+    await stop_session(session)
 
-# Now run the agent code directly
-{open(agent_path, 'r').read()}
-"""
 
-    # Create a temporary file for the entrypoint
-    fd, temp_path = tempfile.mkstemp(suffix='.py', prefix='agent_')
-    with os.fdopen(fd, 'w') as f:
-        f.write(env_module)
+# Stop the worker of a session that is no longer in user_agent_processes
+async def stop_session(session):
+    await session["backend"].release(session["worker"])
 
-    return temp_path
+    if session["lock"].locked():
+        session["lock"].release()
+
+    # Drop the shared record unless another process owns the session by now
+    try:
+        key = session_key(session["process_key"])
+        record = await store.get(key)
+        if record is not None and record["owner"] == OWNER_ID:
+            await store.delete(key)
+    except Exception as e:
+        logger.error(f"Error removing session record {session['process_key']}: {str(e)}")
+
+
+# Reaps idle sessions and evicts the least recently used ones over the cap
+session_reaper = SessionReaper(user_agent_processes, stop_session)
+
+
+# Live sessions by agent and backend, counted at scrape time
+@registry.collector
+def session_metrics():
+    live = Gauge("agent_sessions_live", "Sessions holding a live worker", ("agent", "backend"))
+    for session in list(user_agent_processes.values()):
+        live.inc(agent=session["agent_name"], backend=session["backend"].name)
+    return [live]
+
+
+# Release idle sessions whose user went on with another backend process
+async def release_moved_sessions():
+    """Every STATE_SWEEP_SECONDS, stop the workers of sessions another process now owns"""
+    while True:
+        await asyncio.sleep(STATE_SWEEP_SECONDS)
+        idle = [(key, session) for key, session in user_agent_processes.items() if not session["lock"].locked()]
+        if not idle:
+            continue
+        try:
+            records = await store.get_many([session_key(key) for key, _ in idle])
+        except Exception as e:
+            logger.error(f"Error checking session ownership: {str(e)}")
+            continue
+
+        for (process_key, session), record in zip(idle, records):
+            if record is None or record["owner"] == OWNER_ID:
+                continue
+            # Picked up for a turn here while the records were read
+            if user_agent_processes.get(process_key) is not session or session["lock"].locked():
+                continue
+            logger.info(f"Releasing session moved to {record['owner']}: {process_key}")
+            sessions_reaped.inc(reason="moved")
+            user_agent_processes.pop(process_key)
+            asyncio.create_task(stop_session(session))
+
+
+# Acquire a worker for a new session and track it, turn lock held
+async def create_session(backend, agent_name, version, token, process_key):
+    acquire_started = time.monotonic()
+    with tracing.span("worker.acquire", backend=backend.name):
+        worker = await backend.acquire(agent_name, version, dedicated=AGENT_SESSIONS, affinity=process_key)
+    agent_worker_acquire_seconds.observe(time.monotonic() - acquire_started, agent=agent_name, backend=backend.name)
+
+    session = {
+        "worker_name": worker.name,
+        "worker": worker,
+        "backend": backend,
+        "version": version,
+        "started_at": datetime.now(),
+        "token": token,
+        "agent_name": agent_name,
+        "process_key": process_key,
+        "last_message_time": datetime.now(),
+        # One turn at a time per session
+        "lock": asyncio.Lock(),
+        # What the worker already holds, so only new input is sent
+        "message_count": 0,
+        "history_digest": None,
+        "configured": False,
+    }
+    await session["lock"].acquire()
+    session_reaper.track(process_key, session)
+    return session
 
 
 # Function to start agent process
-async def start_agent_process(agent_name, messages, max_tokens, token):
-    """Start the agent process and return a reference to it"""
+async def start_agent_process(agent_name, messages, max_tokens, token, traceparent=None):
+    """Start the agent process and return its session, turn lock held; the worker's spans join `traceparent`"""
     agent_path = os.path.join(AGENTS_DIR, agent_name, "agent.py")
 
     if not os.path.exists(agent_path):
         logger.error(f"Agent file not found: {agent_path}")
         raise HTTPException(status_code=404, detail=f"Agent {agent_name} not found")
 
+    started = time.monotonic()
+    backend = None
     try:
-        # Create entrypoint with injected Environment
-        entrypoint_path = await create_agent_entrypoint(agent_path, messages, max_tokens)
-
-        # Check if we should use Docker
-        docker_path = os.path.join(AGENTS_DIR, agent_name, "Dockerfile")
-        use_docker = os.path.exists(docker_path)
-
-        # Create a process key based on user token and agent
-        process_key = f"{token}_{agent_name}"
-
-        if use_docker:
-            # Create a requirements.txt file with necessary packages
-            req_fd, req_path = tempfile.mkstemp(suffix='.txt', prefix='agent_req_')
-            with os.fdopen(req_fd, 'w') as f:
-                f.write("openai==1.2.0\nhttpx==0.27.2\n")
-
-            # Generate a unique container name for this user and agent
-            container_name = f"agent-{agent_name}-{token[:8]}"
-
-            # Check if container already exists and remove it first
-            os.system(f"docker rm -f {container_name} > /dev/null 2>&1")
-
-            # Prepare Docker command - make sure to install required packages
-            # Using a non-root user inside the container
-            cmd = [
-                "docker", "run",
-                "--name", container_name,
-                "-d",  # Run in detached mode for persistence
-                "-i",  # Keep STDIN open
-                "-v", f"{os.path.abspath(entrypoint_path)}:/app/entrypoint.py",
-                "-v", f"{os.path.abspath(req_path)}:/app/requirements.txt",
-                "-w", "/app",
-            ]
-
-            # Check if image exists
-            image_exists = os.system(f"docker image inspect agent-{agent_name}:latest > /dev/null 2>&1") == 0
-
-            if image_exists:
-                # Use existing image
-                cmd.append(f"agent-{agent_name}:latest")
-            else:
-                # If image doesn't exist, use python base and install requirements
-                cmd.append("python:3.9-slim")
-
-                # Build the image in background
-                logger.info(f"Building Docker image for agent: {agent_name}")
-                build_cmd = f"docker build -t agent-{agent_name}:latest {os.path.dirname(docker_path)} &"
-                os.system(build_cmd)
-
-            # Add command to install packages and run the entrypoint in persistent mode
-            # Using PYTHONWARNINGS=ignore to suppress Python warnings
-            cmd.extend([
-                "bash", "-c",
-                "export PYTHONWARNINGS=ignore && pip install --quiet --no-warn-script-location --no-cache-dir -r requirements.txt 2>/dev/null && PYTHONWARNINGS=ignore python /app/entrypoint.py"
-            ])
-
-            logger.info(f"Starting agent container: {container_name}")
-
-            # Start the Docker container in background mode
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-
-            # Wait for container to start
-            await asyncio.sleep(2)
-
-            # Store reference to the container
-            user_agent_processes[process_key] = {
-                "container_name": container_name,
-                "entrypoint": entrypoint_path,
-                "requirements": req_path,
-                "started_at": datetime.now(),
-                "token": token,
-                "agent_name": agent_name,
-                "last_message_time": datetime.now()
-            }
-
-        else:
-            # For non-Docker execution, we'll need a different approach for persistence
-            cmd = [sys.executable, entrypoint_path]
-            logger.info(f"Starting direct Python agent: {' '.join(cmd)}")
-
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-
-            # Store reference
-            user_agent_processes[process_key] = {
-                "process": process,
-                "entrypoint": entrypoint_path,
-                "started_at": datetime.now(),
-                "token": token,
-                "agent_name": agent_name,
-                "last_message_time": datetime.now()
-            }
-
-        return process_key
+        # Docker, local fork server or namespace sandbox, per agent.json and config
+        backend = backend_for_agent(agent_name)
+
+        # Create a process key based on user token and agent; without sessions every run has its own worker
+        process_key = f"{token}_{agent_name}" if AGENT_SESSIONS else f"{token}_{agent_name}_{secrets.token_hex(8)}"
+
+        version = await backend.version(agent_name)
+        session = await claim_session(process_key, version)
+        reused = session is not None
+        if session is None:
+            async with creation_lock(process_key):
+                # A concurrent request may have created the session while we waited
+                session = await claim_session(process_key, version)
+                reused = session is not None
+                if session is None:
+                    session = await create_session(backend, agent_name, version, token, process_key)
+
+        job = build_session_job(session, messages, max_tokens)
+        if traceparent:
+            job["params"]["traceparent"] = traceparent
+        logger.info(f"Dispatching {len(job['messages'])} new messages to worker: {session['worker_name']}")
+        try:
+            if not reused:
+                # From now on this process owns the session; a stale worker elsewhere is released
+                await store.set(session_key(process_key), session_record(session), ttl=SESSION_IDLE_TTL)
+            await session["worker"].send_job(job)
+        except Exception:
+            await close_session(process_key, session)
+            raise
+
+        agent_start_seconds.observe(
+            time.monotonic() - started, agent=agent_name, backend=backend.name, session="reused" if reused else "new"
+        )
+        tracing.annotate(backend=backend.name, session="reused" if reused else "new", worker=session["worker_name"])
+        return session
 
     except Exception as e:
         logger.error(f"Error starting agent process: {str(e)}")
+        agent_start_failures.inc(agent=agent_name, backend=backend.name if backend else "")
         raise HTTPException(status_code=500, detail=f"Failed to start agent: {str(e)}")
 
 
+# Map agent error output to a message for the client
+def agent_error_message(error_str):
+    if "No module named" in error_str:
+        return 'Missing Python module in agent container. Check logs for details.'
+    elif "FileNotFoundError" in error_str:
+        return 'File not found in agent container. Check logs for details.'
+    elif "openai.BadRequestError" in error_str or "Invalid JSON" in error_str:
+        return 'API request error. Check token format and permissions.'
+    elif "ConnectionError" in error_str:
+        return 'Connection error. Check network settings and API endpoints.'
+    else:
+        return 'Agent execution error. Check logs for details.'
+
+
+# Record the metrics of a finished turn
+def record_turn_metrics(agent_name, backend_name, outcome, started, first_token_at, prompt_tokens, completion_tokens):
+    now = time.monotonic()
+    labels = {"agent": agent_name, "backend": backend_name}
+    agent_turn_seconds.observe(now - started, outcome=outcome, **labels)
+    agent_prompt_tokens.inc(prompt_tokens, **labels)
+    agent_completion_tokens.inc(completion_tokens, **labels)
+    # A rate needs some streaming time to mean anything
+    if first_token_at is not None and completion_tokens > 1 and now - first_token_at > 0.01:
+        agent_tokens_per_second.observe(completion_tokens / (now - first_token_at), **labels)
+
+
 # Function to stream from agent process
-async def stream_from_agent(agent_name, messages, max_tokens=4000, token=None):
+async def stream_from_agent(agent_name, messages, max_tokens=4000, token=None, trace=None):
     """
     Stream from the agent process with max length handling.
 
@@ -249,195 +378,180 @@ async def stream_from_agent(agent_name, messages, max_tokens=4000, token=None):
         messages: List of message objects to send to the agent
         max_tokens: Maximum number of tokens to generate
         token: User's authentication token for persistent sessions
+        trace: Span of the request; the turn's spans, the worker's included, go under it
     """
     # Send debug event
     debug_msg = f"Starting agent {agent_name} with {len(messages)} messages"
     logger.info(debug_msg)
     yield f"event: debug\ndata: {debug_msg}\n\n"
 
+    process_info = None
+    turn_complete = False
+    # Turn metrics, recorded once the stream ends however it ends
+    started = time.monotonic()
+    first_token_at = None
+    outcome = "disconnected"
+    prompt_tokens = count_message_tokens(messages)
+    completion_tokens = TokenCounter()
+    # Output tokens are counted as they stream; the turn is stopped past its
+    # token budget (a multiple of max_tokens) or wall-clock budget
+    token_budget = int((max_tokens or 0) * AGENT_TOKEN_BUDGET_FACTOR)
+
+    def usage():
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens.total(),
+            "total_tokens": prompt_tokens + completion_tokens.total(),
+        }
+
+    first_frame_span = stream_span = NOOP_SPAN
+    total_chars = 0
     try:
         if token:
             # Start a new agent process for this request
-            process_key = await start_agent_process(agent_name, messages, max_tokens, token)
-            process_info = user_agent_processes[process_key]
-
-            # If using Docker
-            if "container_name" in process_info:
-                container_name = process_info["container_name"]
-
-                # Add a small delay to ensure the container is fully started
-                await asyncio.sleep(1)
-
-                # Execute command to get output from the container
-                cmd = [
-                    "docker", "logs",
-                    "-f",  # Follow log output
-                    container_name
-                ]
-
-                logger.info(f"Following container logs: {container_name}")
-
-                # Start the logs process
-                process = await asyncio.create_subprocess_exec(
-                    *cmd,
-                    stdout=asyncio.subprocess.PIPE,
-                    stderr=asyncio.subprocess.PIPE
+            # Getting the worker ready is traced under agent.start, its run under the request
+            with tracing.use(trace), tracing.span("agent.start", agent=agent_name):
+                process_info = await start_agent_process(
+                    agent_name, messages, max_tokens, token, traceparent=trace.traceparent() if trace else None
                 )
 
-                # Process streaming output
-                total_chars = 0
-                current_message = ""
+            # From the job handed over to the first frame back, then the whole turn
+            first_frame_span = tracing.start_span("agent.first_frame", parent=trace)
+            stream_span = tracing.start_span("agent.stream", parent=trace, agent=agent_name)
+
+            # Every backend runs the same runtime, so all workers are read as one frame stream
+            process = process_info["worker"]
+            logger.info(f"Reading output of worker: {process.name}")
+
+            # Set once the runtime reports READY again, i.e. the turn is over
+            turn_complete = False
+            # Set when the turn is cut short for exceeding its budget
+            budget_exceeded = None
+
+            # Tokens go out in batches, see TokenCoalescer
+            coalescer = TokenCoalescer()
+
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + AGENT_TURN_TIMEOUT if AGENT_TURN_TIMEOUT > 0 else None
+
+            while True:
+                if deadline is not None and loop.time() >= deadline:
+                    budget_exceeded = f"Agent exceeded its time budget of {AGENT_TURN_TIMEOUT:g}s"
+                    break
+
+                frame = process.frames.next_frame()
+                if frame is None:
+                    # Nothing buffered: hold pending tokens only until their window runs
+                    # out, and never wait past the deadline
+                    waits = [deadline - loop.time()] if deadline is not None else []
+                    if coalescer.tokens:
+                        waits.append(coalescer.remaining())
+                    try:
+                        if waits:
+                            frame = await asyncio.wait_for(process.read_frame(), max(min(waits), 0))
+                        else:
+                            frame = await process.read_frame()
+                    except asyncio.TimeoutError:
+                        event = coalescer.flush()
+                        if event:
+                            yield event
+                        continue
+
+                first_frame_span.end()
+
+                if frame is not None and frame[0] == protocol.TOKEN:
+                    content = frame[1].decode('utf-8')
+                    total_chars += len(content)
+                    if first_token_at is None:
+                        first_token_at = time.monotonic()
+                        agent_first_token_seconds.observe(
+                            first_token_at - started, agent=agent_name, backend=process_info["backend"].name
+                        )
+
+                    # Log every 500 characters
+                    if total_chars % 500 < len(content):
+                        logger.info(f"Streamed {total_chars} characters so far")
+
+                    # Data events update the existing bubble
+                    event = coalescer.add(content)
+                    if event:
+                        yield event
+
+                    if completion_tokens.add(content) > token_budget > 0:
+                        budget_exceeded = f"Agent exceeded its budget of {token_budget} tokens"
+                        break
+                    continue
+
+                # Pending tokens go out before whatever comes next
+                event = coalescer.flush()
+                if event:
+                    yield event
+
+                # The worker closed its stdout
+                if frame is None:
+                    break
+
+                kind, payload = frame
+                if kind == protocol.MESSAGE:
+                    content = payload.decode('utf-8')
+                    logger.info(f"New separate message: {content[:80]}")
+
+                    # Send as a new message event - this creates a separate chat bubble
+                    yield new_message_event(content)
+                    total_chars += len(content)
+
+                elif kind == protocol.GENERATED:
+                    # Completions sent as messages or only returned to the agent count like streamed ones
+                    if completion_tokens.add_complete(payload.decode('utf-8')) > token_budget > 0:
+                        budget_exceeded = f"Agent exceeded its budget of {token_budget} tokens"
+                        break
 
-                # Buffered line handling
-                buffer = ""
-                # Track if we're processing unprefixed data as part of output
-                is_unprefixed_data = False
-                # Track the last output line to detect sequences of unprefixed lines
-                last_line = None
+                elif kind == protocol.LOG:
+                    logger.info(f"Agent log: {payload.decode('utf-8', errors='replace')[:200]}")
 
-                # Define a task to read stderr
-                stderr_task = asyncio.create_task(process.stderr.read())
+                elif kind == protocol.SPAN:
+                    # Finished in the worker, exported with the backend's own spans
+                    tracing.exporter.export(json.loads(payload))
 
-                # Read stdout
-                while True:
-                    # Read a line from the process stdout
-                    line_bytes = await process.stdout.readline()
+                elif kind == protocol.TOOL:
+                    # Passed through as is, the runtime already encoded it as JSON
+                    yield f"event: tool\ndata: {payload.decode('utf-8')}\n\n"
 
-                    # Check if we've reached EOF
-                    if not line_bytes:
-                        break
+                elif kind == protocol.ERROR:
+                    # The agent raised, the runtime reports it and stays up for the next turn
+                    error_str = payload.decode('utf-8', errors='replace')
+                    logger.error(f"Agent error: {error_str}")
+                    yield f"event: error\ndata: {json.dumps({'error': agent_error_message(error_str)})}\n\n"
 
-                    line_str = line_bytes.decode('utf-8').rstrip('\n')
-
-                    # Log the raw output
-                    logger.info(f"Raw agent output: {line_str[:80]}")
-
-                    # Parse different message types
-                    if line_str.startswith('NEW_MESSAGE:'):
-                        # Always handle new message events first and immediately
-                        try:
-                            # Extract and decode JSON content
-                            json_content = line_str[12:]
-                            content = json.loads(json_content)
-                            logger.info(f"New separate message (JSON decoded): {str(content)[:80]}")
-
-                            # Send as a new message event - this creates a separate chat bubble
-                            yield f"event: new_message\ndata: {json.dumps({'content': content})}\n\n"
-
-                            # Update total characters count
-                            total_chars += len(str(content))
-
-                            # Reset unprefixed data flag
-                            is_unprefixed_data = False
-                            last_line = line_str
-                        except json.JSONDecodeError as e:
-                            logger.error(f"JSON decode error in NEW_MESSAGE: {e}")
-                            # Fall back to raw content if JSON decode fails
-                            content = line_str[12:]
-                            yield f"event: new_message\ndata: {json.dumps({'content': content})}\n\n"
-
-                    elif line_str.startswith('DATA:'):
-                        try:
-                            # Extract and decode JSON content
-                            json_content = line_str[5:]
-                            content = json.loads(json_content)
-
-                            # Add newline if this is a continuing line after a previous unprefixed line
-                            if is_unprefixed_data and last_line and not last_line.startswith('DATA:'):
-                                current_message += '\n'
-
-                            current_message += content
-
-                            # Update total characters count
-                            total_chars += len(str(content))
-
-                            # Log every 500 characters
-                            if total_chars % 500 < len(str(content)):
-                                logger.info(f"Streamed {total_chars} characters so far")
-
-                            # Send content in SSE format - this updates the existing bubble
-                            yield f"data: {json.dumps({'content': content})}\n\n"
-
-                            # Reset unprefixed data flag
-                            is_unprefixed_data = False
-                            last_line = line_str
-                        except json.JSONDecodeError as e:
-                            logger.error(f"JSON decode error in DATA: {e}")
-                            # Fall back to raw content if JSON decode fails
-                            content = line_str[5:]
-                            current_message += content
-                            yield f"data: {json.dumps({'content': content})}\n\n"
-
-                    elif line_str.startswith('DEBUG:'):
-                        # Log debug output
-                        logger.info(f"Agent debug: {line_str[6:]}")
-                        is_unprefixed_data = False
-                        last_line = line_str
-
-                    elif line_str == "DONE":
-                        logger.info(f"Agent marked task as done")
-
-                        # Send a completion event to signal the frontend that the streaming is complete
-                        # This will "freeze" the current message so future streams don't overwrite it
-                        yield f"event: completion\ndata: {json.dumps({'status': 'complete', 'total_chars': total_chars})}\n\n"
-
-                        # Only stop following logs, container keeps running
-                        break
+                elif kind == protocol.READY:
+                    # The runtime is waiting for the next job, this turn is over
+                    turn_complete = True
+                    break
 
-                    else:
-                        # This is a line without a prefix - treat it as continuation of DATA
-                        # Only do this for non-empty lines that don't match other patterns
-                        if line_str and line_str.strip():
-                            logger.info(f"Processing unprefixed line as data: {line_str[:80]}")
-
-                            # If this is a sequence of unprefixed data (numbers, etc.)
-                            # add a newline if this isn't the first unprefixed line
-                            if is_unprefixed_data and last_line != line_str:
-                                current_message += '\n'
-
-                            # Add the content and track that we're in an unprefixed sequence
-                            content = line_str
-                            current_message += content
-                            is_unprefixed_data = True
-                            total_chars += len(content)
-
-                            # Send as a data event
-                            yield f"data: {json.dumps({'content': content})}\n\n"
-
-                            last_line = line_str
-
-                # Check if there were any errors
-                stderr_data = await stderr_task
-                if stderr_data:
-                    error_str = stderr_data.decode('utf-8')
-
-                    # Filter out pip warnings
-                    if not (
-                            "WARNING: Running pip as the 'root' user" in error_str or
-                            "--no-warn-script-location" in error_str
-                    ):
-                        logger.error(f"Agent error: {error_str}")
-
-                        # Handle different error types
-                        if "No module named" in error_str:
-                            yield f"event: error\ndata: {json.dumps({'error': 'Missing Python module in agent container. Check logs for details.'})}\n\n"
-                        elif "FileNotFoundError" in error_str:
-                            yield f"event: error\ndata: {json.dumps({'error': 'File not found in agent container. Check logs for details.'})}\n\n"
-                        elif "openai.BadRequestError" in error_str or "Invalid JSON" in error_str:
-                            yield f"event: error\ndata: {json.dumps({'error': 'API request error. Check token format and permissions.'})}\n\n"
-                        elif "ConnectionError" in error_str:
-                            yield f"event: error\ndata: {json.dumps({'error': 'Connection error. Check network settings and API endpoints.'})}\n\n"
-                        else:
-                            yield f"event: error\ndata: {json.dumps({'error': 'Agent execution error. Check logs for details.'})}\n\n"
+                elif kind == protocol.DONE:
+                    logger.info(f"Agent marked task as done")
 
-            else:
-                # Non-Docker persistent process
-                # Process output from regular process
-                process = process_info["process"]
+                    # Send a completion event to signal the frontend that the streaming is complete
+                    # This will "freeze" the current message so future streams don't overwrite it
+                    yield f"event: completion\ndata: {json.dumps({'status': 'complete', 'total_chars': total_chars, 'usage': usage()})}\n\n"
 
-                # Similar to above, but with process.stdout directly
-                # (Implementation skipped for brevity, similar to the Docker case)
-                pass
+                else:
+                    logger.warning(f"Unknown frame {kind!r} from worker {process.name}")
+
+            outcome = "complete" if turn_complete else "budget" if budget_exceeded else "error"
+            if budget_exceeded:
+                # The worker is torn down with the unfinished turn, see finish_turn
+                event = coalescer.flush()
+                if event:
+                    yield event
+                logger.warning(f"Stopping worker {process.name}: {budget_exceeded}")
+                yield f"event: error\ndata: {json.dumps({'error': budget_exceeded})}\n\n"
+
+            # The worker went away mid-turn, report what it printed
+            elif not turn_complete:
+                error_str = await process.stderr_output()
+                logger.error(f"Agent worker exited: {error_str}")
+                yield f"event: error\ndata: {json.dumps({'error': agent_error_message(error_str)})}\n\n"
 
         else:
             # For non-persistent mode (fall back to original implementation)
@@ -445,48 +559,25 @@ async def stream_from_agent(agent_name, messages, max_tokens=4000, token=None):
             pass
 
         # Send completion event
-        logger.info(f"Agent streaming completed. Total characters: {total_chars}")
-        yield f"event: completion\ndata: {json.dumps({'status': 'complete', 'total_chars': total_chars})}\n\n"
+        logger.info(f"Agent streaming completed. Total characters: {total_chars}, usage: {usage()}")
+        yield f"event: completion\ndata: {json.dumps({'status': 'complete', 'total_chars': total_chars, 'usage': usage()})}\n\n"
 
     except Exception as e:
+        outcome = "error"
         # Send error event
         error_message = str(e)
         logger.error(f"Error in agent streaming: {error_message}")
         yield f"event: error\ndata: {json.dumps({'error': error_message})}\n\n"
 
-
-# Background task to clean up old agent processes
-async def cleanup_old_processes():
-    """Clean up old agent processes and temporary files"""
-    now = datetime.now()
-    to_remove = []
-
-    for key, info in user_agent_processes.items():
-        # If process has been inactive for more than 24 hours, kill it
-        if (now - info["last_message_time"]).total_seconds() > 86400:  # 24 hours
-            logger.info(f"Cleaning up old agent process: {key}")
-            try:
-                # For Docker containers
-                if "container_name" in info:
-                    # Stop and remove the container
-                    container_name = info["container_name"]
-                    os.system(f"docker stop {container_name} && docker rm {container_name}")
-                else:
-                    # For regular processes
-                    info["process"].kill()
-                    await info["process"].wait()
-
-                # Clean up temporary files
-                if "entrypoint" in info and os.path.exists(info["entrypoint"]):
-                    os.unlink(info["entrypoint"])
-
-                if "requirements" in info and info["requirements"] and os.path.exists(info["requirements"]):
-                    os.unlink(info["requirements"])
-
-                to_remove.append(key)
-            except Exception as e:
-                logger.error(f"Error cleaning up process {key}: {str(e)}")
-
-    # Remove processed keys
-    for key in to_remove:
-        del user_agent_processes[key]
\ No newline at end of file
+    finally:
+        # Keep the session for the next turn, or release the worker when the
+        # turn did not finish (including when the client disconnected)
+        first_frame_span.end()
+        stream_span.set_attributes(outcome=outcome, chars=total_chars, completion_tokens=completion_tokens.total())
+        if outcome in ("error", "budget"):
+            stream_span.record_error(outcome)
+        stream_span.end()
+        if process_info:
+            record_turn_metrics(agent_name, process_info["backend"].name, outcome, started, first_token_at,
+                                prompt_tokens, completion_tokens.total())
+            await finish_turn(process_info["process_key"], process_info, turn_complete)
@@ -0,0 +1,5 @@
+# backend/agent_runtime/__init__.py
+
+# Runtime that runs inside agent containers. It is mounted read-only into every
+# container and must only depend on the standard library and the agent
+# dependencies (openai, httpx), never on backend modules.
@@ -0,0 +1,163 @@
+# backend/agent_runtime/completion_cache.py
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Caches by their settings, shared by every Environment of this process
+_caches = {}
+
+# Seconds between sweeps of a directory, across all processes sharing it
+SWEEP_INTERVAL = 60
+
+# Marker whose mtime records the last sweep of a directory
+SWEEP_MARKER = ".swept"
+
+
+def is_deterministic(temperature, n):
+    """Only greedy, single-choice completions are reproducible enough to cache"""
+    return not temperature and n == 1
+
+
+def completion_key(**params):
+    """Hash of everything that determines a completion: endpoint, model, messages and sampling params"""
+    data = json.dumps(params, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+class CompletionCache:
+    """Recorded completion streams, in an in-memory LRU backed by a shared directory
+
+    Entries are the list of streamed chunks, so a hit can be replayed chunk by
+    chunk. The directory may be shared by many workers: entries are written
+    to a temporary file and renamed into place, so readers never see a
+    partial one. A file's mtime is its last use; at most once a minute one
+    writer drops files unused for ttl seconds, then the least recently used
+    ones above max_bytes.
+    """
+
+    def __init__(self, directory=None, max_entries=256, max_bytes=0, ttl=0):
+        self.directory = directory
+        self.max_entries = max_entries
+        # Limits of the disk tier, 0 for none
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key):
+        """Recorded chunks for the key, or None"""
+        with self._lock:
+            chunks = self.entries.get(key)
+            if chunks is not None:
+                self.entries.move_to_end(key)
+                return chunks
+
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                chunks = json.load(f)["chunks"]
+            # Mark the entry as used, so the sweep keeps it
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            return None
+        self._remember(key, chunks)
+        return chunks
+
+    def put(self, key, chunks):
+        self._remember(key, chunks)
+        if not self.directory:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(path))
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({"chunks": chunks}, f, ensure_ascii=False)
+            os.replace(temp_path, path)
+        except OSError:
+            # The disk tier is best effort, the memory tier still has the entry
+            return
+        if (self.max_bytes or self.ttl) and self._sweep_due():
+            threading.Thread(target=self.sweep, daemon=True).start()
+
+    def _sweep_due(self):
+        """Claim the next sweep of the directory if the last one is long enough ago"""
+        marker = os.path.join(self.directory, SWEEP_MARKER)
+        try:
+            if time.time() - os.stat(marker).st_mtime < SWEEP_INTERVAL:
+                return False
+        except FileNotFoundError:
+            pass
+        except OSError:
+            return False
+        try:
+            with open(marker, 'a'):
+                pass
+            os.utime(marker)
+        except OSError:
+            return False
+        return True
+
+    def sweep(self):
+        """Drop disk entries unused for ttl seconds, then the least recently used above max_bytes"""
+        now = time.time()
+        files = []
+        try:
+            for shard in os.scandir(self.directory):
+                if not shard.is_dir():
+                    continue
+                for entry in os.scandir(shard.path):
+                    try:
+                        st = entry.stat()
+                        if entry.name.endswith('.tmp'):
+                            # Only left behind by writers that died
+                            if now - st.st_mtime > SWEEP_INTERVAL:
+                                os.remove(entry.path)
+                        elif self.ttl and now - st.st_mtime > self.ttl:
+                            os.remove(entry.path)
+                        elif entry.name.endswith('.json'):
+                            files.append((st.st_mtime, st.st_size, entry.path))
+                    except OSError:
+                        # Removed by another process meanwhile
+                        pass
+        except OSError:
+            return
+
+        if self.max_bytes:
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                total -= size
+
+    def _remember(self, key, chunks):
+        with self._lock:
+            self.entries[key] = chunks
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+def get_cache(settings):
+    """Process-wide cache for {"dir", "entries", "max_bytes", "ttl"} settings; None when caching is off"""
+    if not settings:
+        return None
+    key = (settings.get("dir"), settings.get("entries", 256), settings.get("max_bytes", 0), settings.get("ttl", 0))
+    cache = _caches.get(key)
+    if cache is None:
+        cache = _caches[key] = CompletionCache(*key)
+    return cache
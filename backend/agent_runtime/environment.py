@@ -0,0 +1,292 @@
+# backend/agent_runtime/environment.py
+
+import asyncio
+import weakref
+from openai import OpenAI, AsyncOpenAI
+from agent_runtime.protocol import FrameWriter
+from agent_runtime.tracing import NOOP_SPAN
+from agent_runtime.completion_cache import get_cache, completion_key, is_deterministic
+
+# OpenAI clients by base URL, kept for the life of the worker so every job
+# reuses the same keep-alive connections
+_clients = {}
+
+
+def _client(base_url):
+    client = _clients.get(base_url)
+    if client is None:
+        client = _clients[base_url] = OpenAI(
+            api_key="dummy",  # Will be overridden by auth header
+            base_url=base_url
+        )
+    return client
+
+
+# Async clients per event loop and base URL; their connections belong to the loop
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _async_client(base_url):
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get(base_url)
+    if client is None:
+        client = clients[base_url] = AsyncOpenAI(
+            api_key="dummy",  # Will be overridden by auth header
+            base_url=base_url
+        )
+    return client
+
+
+# Environment handed to agent code as the global `env`
+class Environment:
+    def __init__(self, messages=None, api_base_url=None, auth_token=None, default_model=None, max_tokens=4000,
+                 channel=None, completion_cache=None, max_concurrency=4, trace=None):
+        self.messages = messages or []
+        # FrameWriter carrying everything the agent reports back to the backend
+        self.channel = channel or FrameWriter(1)
+        self.api_base_url = api_base_url
+        self.auth_token = auth_token
+        self.default_model = default_model
+        self.max_tokens = max_tokens
+        self.is_done = False
+        self.current_reply = ""
+        # Opt-in cache of deterministic completions, see completion_cache
+        self.completion_cache = get_cache(completion_cache)
+        # Bound on concurrent calls made through acompletion and completion_many
+        self.max_concurrency = max_concurrency
+        self._semaphores = weakref.WeakKeyDictionary()
+        # Async calls in flight, whether one of them streams into the current reply, and the
+        # messages of calls that finished meanwhile, sent once it is done so replies never mix
+        self._inflight = 0
+        self._streaming = False
+        self._held_messages = []
+        # Span of this run; completions are traced under it and carry its trace to the LLM API
+        self.trace = trace or NOOP_SPAN
+
+        self.client = _client(self.api_base_url)
+
+    def list_messages(self):
+        """Return the list of messages to be processed"""
+        return self.messages
+
+    def completion(self, messages, model=None, temperature=0.7, frequency_penalty=0, n=1, stream=True, max_tokens=None):
+        """Make a completion request to the OpenAI API"""
+        model = model or self.default_model
+        max_tokens = max_tokens or self.max_tokens
+
+        with self.trace.child("llm.completion", model=model, stream=stream, n=n, max_tokens=max_tokens) as span:
+            cache_key = self._cache_key(messages, model, temperature, frequency_penalty, n, max_tokens)
+            chunks = self.completion_cache.get(cache_key) if cache_key else None
+            if chunks is not None:
+                # Replayed the way it was received, so a hit looks like a live completion
+                span.set_attribute("cached", True)
+                return self._emit(chunks if stream else ["".join(chunks)])
+
+            # Create custom headers with auth token
+            headers = self._headers(span)
+
+            response = self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                frequency_penalty=frequency_penalty,
+                n=n,
+                stream=stream,
+                max_tokens=max_tokens,
+                extra_headers=headers
+            )
+
+            # If streaming, process the stream
+            if stream:
+                chunks = []
+                for chunk in response:
+                    if chunk.choices and len(chunk.choices) > 0 and chunk.choices[0].delta.content:
+                        content = chunk.choices[0].delta.content
+                        chunks.append(content)
+                        self.channel.token(content)
+                collected_content = "".join(chunks)
+            else:
+                # For non-streaming, return the complete response
+                collected_content = response.choices[0].message.content
+                chunks = [collected_content] if collected_content else []
+                if collected_content:
+                    self.channel.token(collected_content)
+
+            # Only completions that finished get here, so partial streams are never cached
+            if cache_key:
+                self.completion_cache.put(cache_key, chunks)
+            span.set_attributes(cached=False, chunks=len(chunks), chars=len(collected_content or ""))
+            self.current_reply = collected_content
+            return collected_content
+
+    def _headers(self, span):
+        headers = {"Authorization": f"Bearer {self.auth_token}"}
+        if span:
+            headers["traceparent"] = span.traceparent()
+        return headers
+
+    def _cache_key(self, messages, model, temperature, frequency_penalty, n, max_tokens):
+        if not self.completion_cache or not is_deterministic(temperature, n):
+            return None
+        return completion_key(
+            api_base_url=self.api_base_url, model=model, messages=messages, temperature=temperature,
+            frequency_penalty=frequency_penalty, n=n, max_tokens=max_tokens
+        )
+
+    def _emit(self, chunks):
+        for content in chunks:
+            self.channel.token(content)
+        self.current_reply = "".join(chunks)
+        return self.current_reply
+
+    def _semaphore(self):
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    async def _acompletion_one(self, messages, model, temperature, frequency_penalty, max_tokens, output):
+        """One n=1 call; output is "stream" (tokens into the current reply), "message"
+        (a separate message once finished) or None (returned only)"""
+        if output == "stream" and self._inflight:
+            # Overlaps other calls, its tokens would land in the same reply: a message of its own instead
+            output = "message"
+        self._inflight += 1
+        if output == "stream":
+            self._streaming = True
+        try:
+            return await self._acompletion_call(messages, model, temperature, frequency_penalty, max_tokens, output)
+        finally:
+            self._inflight -= 1
+            if output == "stream":
+                self._streaming = False
+                while self._held_messages:
+                    self.channel.message(self._held_messages.pop(0))
+
+    async def _acompletion_call(self, messages, model, temperature, frequency_penalty, max_tokens, output):
+        with self.trace.child("llm.completion", model=model, stream=True, n=1, max_tokens=max_tokens) as span:
+            cache_key = self._cache_key(messages, model, temperature, frequency_penalty, 1, max_tokens)
+            chunks = self.completion_cache.get(cache_key) if cache_key else None
+            cached = chunks is not None
+
+            if chunks is None:
+                headers = self._headers(span)
+                async with self._semaphore():
+                    response = await _async_client(self.api_base_url).chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        temperature=temperature,
+                        frequency_penalty=frequency_penalty,
+                        n=1,
+                        stream=True,
+                        max_tokens=max_tokens,
+                        extra_headers=headers
+                    )
+                    chunks = []
+                    async for chunk in response:
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            content = chunk.choices[0].delta.content
+                            chunks.append(content)
+                            if output == "stream":
+                                self.channel.token(content)
+                if cache_key:
+                    self.completion_cache.put(cache_key, chunks)
+            elif output == "stream":
+                for content in chunks:
+                    self.channel.token(content)
+
+            content = "".join(chunks)
+            span.set_attributes(cached=cached, chunks=len(chunks), chars=len(content))
+            if output != "stream" and content:
+                # Not seen as tokens by the backend, but output all the same
+                self.channel.generated(content)
+            if output == "stream":
+                self.current_reply = content
+            elif output == "message" and content and not content.isspace():
+                if self._streaming:
+                    self._held_messages.append(content)
+                else:
+                    self.channel.message(content)
+            return content
+
+    async def acompletion(self, messages, model=None, temperature=0.7, frequency_penalty=0, n=1, stream=True,
+                          max_tokens=None):
+        """Async completion, at most max_concurrency in flight per Environment
+
+        With n > 1 the choices are requested as n parallel calls, which is
+        faster on providers that generate choices one after another, and a list
+        is returned. A single call streams into the current reply like
+        completion(); each of several choices, and a call made while others are
+        in flight, goes out as its own message once the streaming reply is done,
+        so concurrent output never interleaves. stream=False sends nothing.
+        """
+        model = model or self.default_model
+        max_tokens = max_tokens or self.max_tokens
+        if n == 1:
+            output = "stream" if stream else None
+            return await self._acompletion_one(messages, model, temperature, frequency_penalty, max_tokens, output)
+
+        output = "message" if stream else None
+        return list(await asyncio.gather(*[
+            self._acompletion_one(messages, model, temperature, frequency_penalty, max_tokens, output)
+            for _ in range(n)
+        ]))
+
+    def completion_many(self, requests, stream=False):
+        """Run several completions concurrently and return their replies in order
+
+        Each request is a list of messages or a dict of completion() arguments
+        ({"messages": [...], "temperature": 0, ...}). Calls run at most
+        max_concurrency at a time; with stream=True every reply is sent as its
+        own message as soon as it is complete. Takes about as long as the
+        slowest call. For agents that run their own event loop, gather
+        acompletion() calls instead.
+        """
+        async def run_all():
+            calls = []
+            for request in requests:
+                kwargs = {"messages": request} if isinstance(request, list) else dict(request)
+                n = kwargs.pop("n", 1)
+                kwargs.pop("stream", None)
+                if n != 1:
+                    calls.append(self.acompletion(n=n, stream=stream, **kwargs))
+                    continue
+                calls.append(self._acompletion_one(
+                    kwargs["messages"], kwargs.get("model") or self.default_model, kwargs.get("temperature", 0.7),
+                    kwargs.get("frequency_penalty", 0), kwargs.get("max_tokens") or self.max_tokens,
+                    "message" if stream else None
+                ))
+            try:
+                return list(await asyncio.gather(*calls))
+            finally:
+                # The clients of this loop go away with it
+                for client in _async_clients.pop(asyncio.get_running_loop(), {}).values():
+                    await client.close()
+
+        return asyncio.run(run_all())
+
+    def add_reply(self, reply):
+        """Add a new message to the chat from the AI"""
+        # If reply is provided, use it; otherwise use the stored current_reply
+        content = reply if reply else self.current_reply
+
+        if content and not content.isspace():
+            self.channel.message(content)
+            self.channel.log(f"Sent new message: {content[:30]}")
+
+        # Store this as the current reply
+        self.current_reply = content
+
+    def mark_done(self):
+        """Mark the agent as done with processing"""
+        self.is_done = True
+        self.channel.done()
+
+    def log(self, text):
+        """Send a diagnostic line to the backend log"""
+        self.channel.log(str(text))
+
+    def tool_event(self, name, data=None):
+        """Report a tool call or result; `data` must be JSON-serializable"""
+        self.channel.tool(name, data)
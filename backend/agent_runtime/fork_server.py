@@ -0,0 +1,95 @@
+# backend/agent_runtime/fork_server.py
+
+import os
+import sys
+import json
+import socket
+import signal
+import select
+import traceback
+from agent_runtime import runner
+from agent_runtime.protocol import SERVER_READY
+
+# Imported once here so every forked worker starts with them already loaded
+import httpx  # noqa: F401
+import openai  # noqa: F401
+
+# Largest request accepted on the control socket
+MAX_REQUEST_SIZE = 65536
+
+
+def handle_request(server, conn):
+    """Fork a worker wired to the stdin, stdout and stderr descriptors sent with the request"""
+    message, fds, _, _ = socket.recv_fds(conn, MAX_REQUEST_SIZE, 3)
+    try:
+        request = json.loads(message)
+        agent_path = request["agent_path"]
+        if len(fds) != 3:
+            raise ValueError(f"Expected 3 descriptors, got {len(fds)}")
+
+        # Compiled in the server so the child inherits the code object
+        runner.load_agent(agent_path)
+    except Exception as e:
+        for fd in fds:
+            os.close(fd)
+        conn.sendall((json.dumps({"error": str(e)}) + "\n").encode('utf-8'))
+        return
+
+    pid = os.fork()
+    if pid == 0:
+        exit_code = 0
+        try:
+            server.close()
+            conn.close()
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            for target, fd in enumerate(fds):
+                os.dup2(fd, target)
+                os.close(fd)
+            runner.serve(agent_path)
+        except BaseException:
+            traceback.print_exc()
+            exit_code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            # Never fall back into the server loop
+            os._exit(exit_code)
+
+    for fd in fds:
+        os.close(fd)
+    conn.sendall((json.dumps({"pid": pid}) + "\n").encode('utf-8'))
+
+
+def main(socket_path):
+    """Accept spawn requests on a Unix socket until the parent goes away"""
+    # Exited workers are reaped by the kernel; their pipes tell the backend they are gone
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    os.chmod(socket_path, 0o600)
+    server.listen(128)
+    print(SERVER_READY, flush=True)
+
+    while True:
+        readable, _, _ = select.select([server, sys.stdin], [], [])
+        # stdin is a pipe from the backend, EOF means the backend is gone
+        if sys.stdin in readable and not os.read(sys.stdin.fileno(), 1024):
+            server.close()
+            os.unlink(socket_path)
+            return
+        if server not in readable:
+            continue
+
+        conn, _ = server.accept()
+        with conn:
+            try:
+                handle_request(server, conn)
+            except Exception as e:
+                print(f"Spawn request failed: {e}", file=sys.stderr, flush=True)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1])
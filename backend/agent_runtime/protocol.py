@@ -0,0 +1,158 @@
+# backend/agent_runtime/protocol.py
+
+import io
+import os
+import sys
+import json
+import struct
+import threading
+
+# Frames written by the runtime on its stdout. Each frame is a one-byte kind
+# and a big-endian payload length, followed by the payload: UTF-8 text for
+# TOKEN, MESSAGE, GENERATED, LOG and ERROR, a JSON object for TOOL and SPAN, nothing
+# for READY and DONE. Nothing else is ever written to that descriptor.
+READY = b"R"  # waiting for a job; after a job it ends the turn
+TOKEN = b"T"  # streamed completion text, appended to the current reply
+MESSAGE = b"M"  # a separate chat message
+LOG = b"L"  # agent diagnostics, including anything the agent printed
+TOOL = b"U"  # a tool event reported by the agent: {"name": ..., "data": ...}
+DONE = b"D"  # the agent marked its task as done
+ERROR = b"E"  # the agent raised; traceback text
+SPAN = b"S"  # a finished trace span, see agent_runtime.tracing
+GENERATED = b"G"  # text of a completion not streamed as TOKEN frames, counted as output tokens
+
+HEADER = struct.Struct(">cI")
+
+# Larger lengths mean the stream is corrupt, not that a frame is that big
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+
+# Line printed by the fork server once it accepts spawn requests
+SERVER_READY = "READY"
+
+
+class ProtocolError(ValueError):
+    """The frame stream is corrupt"""
+
+
+def encode_frame(kind, payload=b""):
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    return HEADER.pack(kind, len(payload)) + payload
+
+
+class FrameDecoder:
+    """Incremental decoder: feed() raw bytes as they arrive, then take frames with next_frame()
+
+    Frames are sliced out of one growing buffer, which is compacted only once
+    most of it has been consumed, so a burst of small token frames costs a
+    single copy per frame.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.pos = 0
+
+    def feed(self, data):
+        if self.pos and self.pos * 2 >= len(self.buffer):
+            del self.buffer[:self.pos]
+            self.pos = 0
+        self.buffer += data
+
+    def next_frame(self):
+        """Return the next complete (kind, payload) frame, or None until more data arrives"""
+        if len(self.buffer) - self.pos < HEADER.size:
+            return None
+        kind, length = HEADER.unpack_from(self.buffer, self.pos)
+        if length > MAX_FRAME_SIZE:
+            raise ProtocolError(f"Frame of {length} bytes exceeds the {MAX_FRAME_SIZE} byte limit")
+
+        start = self.pos + HEADER.size
+        end = start + length
+        if len(self.buffer) < end:
+            return None
+        payload = bytes(self.buffer[start:end])
+        self.pos = end
+        return kind, payload
+
+    def pending(self):
+        """Number of buffered bytes not yet decoded into frames"""
+        return len(self.buffer) - self.pos
+
+
+class FrameWriter:
+    """Writes frames to a file descriptor; safe to share between agent threads"""
+
+    def __init__(self, fd):
+        self.fd = fd
+        self._lock = threading.Lock()
+
+    def write(self, kind, payload=b""):
+        data = memoryview(encode_frame(kind, payload))
+        with self._lock:
+            while data:
+                data = data[os.write(self.fd, data):]
+
+    def token(self, text):
+        self.write(TOKEN, text)
+
+    def message(self, text):
+        self.write(MESSAGE, text)
+
+    def log(self, text):
+        self.write(LOG, text)
+
+    def tool(self, name, data=None):
+        self.write(TOOL, json.dumps({"name": name, "data": data}))
+
+    def span(self, span_dict):
+        self.write(SPAN, json.dumps(span_dict))
+
+    def generated(self, text):
+        self.write(GENERATED, text)
+
+    def ready(self):
+        self.write(READY)
+
+    def done(self):
+        self.write(DONE)
+
+    def error(self, text):
+        self.write(ERROR, text)
+
+
+class LogStream(io.TextIOBase):
+    """Text stream turning every line written to it into a LOG frame"""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self._partial = ""
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        lines = (self._partial + text).split("\n")
+        self._partial = lines.pop()
+        for line in lines:
+            self.writer.log(line)
+        return len(text)
+
+    def flush(self):
+        if self._partial:
+            self.writer.log(self._partial)
+            self._partial = ""
+
+
+def open_channel():
+    """Take over stdout for frames
+
+    The frame channel moves to a private duplicate of stdout. Python-level
+    prints go out as LOG frames and anything written to descriptor 1 directly
+    (native code, child processes) lands on stderr, so no stray output can
+    corrupt the stream.
+    """
+    sys.stdout.flush()
+    writer = FrameWriter(os.dup(1))
+    os.dup2(2, 1)
+    sys.stdout = LogStream(writer)
+    return writer
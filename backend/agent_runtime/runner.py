@@ -0,0 +1,78 @@
+# backend/agent_runtime/runner.py
+
+import os
+import sys
+import json
+import traceback
+from agent_runtime import protocol, tracing
+from agent_runtime.environment import Environment
+
+# service.name of spans created in workers
+SERVICE_NAME = "agent-runtime"
+
+# Compiled agent code keyed by path, reused while the file is unchanged
+_code_cache = {}
+
+
+def load_agent(agent_path):
+    """Compile the agent once and reuse the code object until the file changes"""
+    st = os.stat(agent_path)
+    cached = _code_cache.get(agent_path)
+    if cached and cached[0] == (st.st_mtime_ns, st.st_size):
+        return cached[1]
+
+    with open(agent_path, 'r') as f:
+        code = compile(f.read(), agent_path, 'exec')
+    _code_cache[agent_path] = ((st.st_mtime_ns, st.st_size), code)
+    return code
+
+
+def run_job(agent_path, env, channel):
+    """Run the agent module against an Environment, reporting failures as ERROR frames"""
+    try:
+        exec(load_agent(agent_path), {'__name__': '__main__', 'env': env})
+    except (Exception, SystemExit) as e:
+        traceback.print_exc()
+        channel.error(traceback.format_exc())
+        env.trace.record_error(e)
+    finally:
+        # A last print without a newline still reaches the log
+        sys.stdout.flush()
+
+
+def serve(agent_path, jobs=sys.stdin):
+    """Serve jobs read as JSON lines until stdin closes
+
+    A job carries the messages added since the previous job (or "reset" to start
+    over), per-turn "params" such as max_tokens and the request's traceparent,
+    and on the first job the connection "config" for the Environment. Output goes out as frames (see
+    protocol); READY after a job ends the turn.
+    """
+    history = []
+    config = {}
+    channel = protocol.open_channel()
+
+    # Compile while idle so the first job does not pay for it
+    load_agent(agent_path)
+    channel.ready()
+
+    for line in jobs:
+        job = json.loads(line)
+        config.update(job.get('config') or {})
+        if job.get('reset'):
+            history = []
+        history.extend(job.get('messages') or [])
+
+        params = job.get('params') or {}
+        # Spans of this run join the request's trace and go back as SPAN frames
+        span = tracing.remote_span("agent.run", params.get('traceparent'), channel.span, SERVICE_NAME,
+                                   messages=len(history))
+        env = Environment(messages=list(history), max_tokens=params.get('max_tokens') or 4000,
+                          channel=channel, trace=span, **config)
+        run_job(agent_path, env, channel)
+        span.end()
+        channel.ready()
+
+
+if __name__ == '__main__':
+    serve(sys.argv[1])
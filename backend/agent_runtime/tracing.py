@@ -0,0 +1,143 @@
+# backend/agent_runtime/tracing.py
+
+import os
+import time
+
+
+# W3C trace context: version, trace id, parent span id and flags (01 = sampled)
+def format_traceparent(trace_id, span_id, sampled=True):
+    return f"00-{trace_id}-{span_id}-{'01' if sampled else '00'}"
+
+
+def parse_traceparent(header):
+    """Return (trace_id, span_id, sampled) from a traceparent header, or None if it is malformed"""
+    parts = (header or "").strip().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+        flags = int(parts[3][:2], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+def new_id(size):
+    return os.urandom(size).hex()
+
+
+class Span:
+    """A timed operation in a trace
+
+    Finished spans are handed to `on_end` as plain dicts, which the backend
+    exports and the runtime sends back over its frame channel.
+    """
+
+    def __init__(self, name, trace_id, parent_id=None, attributes=None, service=None, kind="internal",
+                 on_end=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = new_id(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.service = service
+        self.kind = kind
+        self.status = "ok"
+        self.status_message = None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.on_end = on_end
+
+    def __bool__(self):
+        return True
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def record_error(self, error):
+        self.status = "error"
+        self.status_message = error if isinstance(error, str) else f"{type(error).__name__}: {error}"
+
+    def traceparent(self):
+        return format_traceparent(self.trace_id, self.span_id)
+
+    def child(self, name, **attributes):
+        """A span under this one, reported the same way"""
+        return Span(name, self.trace_id, self.span_id, attributes, self.service, on_end=self.on_end)
+
+    def end(self):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if self.on_end:
+            self.on_end(self.to_dict())
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "service": self.service,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.end_ns,
+            "attributes": self.attributes,
+            "status": self.status,
+            "status_message": self.status_message,
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.record_error(exc)
+        self.end()
+
+
+class NoopSpan:
+    """Stands in for a span when tracing is off or the trace is not sampled"""
+
+    def __bool__(self):
+        return False
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, **attributes):
+        pass
+
+    def record_error(self, error):
+        pass
+
+    def traceparent(self):
+        return None
+
+    def child(self, name, **attributes):
+        return self
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+NOOP_SPAN = NoopSpan()
+
+
+def remote_span(name, traceparent, on_end, service, **attributes):
+    """Span continuing a trace started elsewhere, a no-op without a sampled traceparent"""
+    parent = parse_traceparent(traceparent)
+    if parent is None or not parent[2]:
+        return NOOP_SPAN
+    return Span(name, parent[0], parent[1], attributes, service, on_end=on_end)
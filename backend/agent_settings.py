@@ -0,0 +1,38 @@
+# backend/agent_settings.py
+
+import os
+import json
+import logging
+from config import AGENTS_DIR
+
+logger = logging.getLogger(__name__)
+
+# Optional per-agent settings file, next to agent.py and the Dockerfile
+SETTINGS_FILE = "agent.json"
+
+# Parsed settings keyed by agent, validated by the file's mtime
+_settings_cache = {}
+
+
+def agent_settings(agent_name):
+    """Return the agent's agent.json as a dict, or an empty dict when there is none"""
+    path = os.path.join(AGENTS_DIR, agent_name, SETTINGS_FILE)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        _settings_cache.pop(agent_name, None)
+        return {}
+
+    cached = _settings_cache.get(agent_name)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    try:
+        with open(path, 'r') as f:
+            settings = json.load(f)
+    except ValueError as e:
+        logger.error(f"Invalid {SETTINGS_FILE} for agent {agent_name}: {str(e)}")
+        settings = {}
+
+    _settings_cache[agent_name] = (mtime, settings)
+    return settings
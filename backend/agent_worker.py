@@ -0,0 +1,98 @@
+# backend/agent_worker.py
+
+import json
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime
+from config import READY_TIMEOUT
+from agent_runtime import protocol
+
+logger = logging.getLogger(__name__)
+
+
+class AgentWorker:
+    """A running agent runtime reachable through stdin/stdout/stderr
+
+    Subclasses provide the `stdout` and `stderr` readers and implement
+    is_alive(), write() and destroy(); everything that speaks the runtime's
+    frame protocol lives here so every execution path streams the same way.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.created_at = datetime.now()
+        # Recent stderr lines, kept for error reporting once the worker is serving jobs
+        self.stderr_tail = deque(maxlen=50)
+        self._stderr_task = None
+        self.frames = protocol.FrameDecoder()
+
+    def is_alive(self):
+        raise NotImplementedError
+
+    async def write(self, data):
+        raise NotImplementedError
+
+    async def destroy(self):
+        raise NotImplementedError
+
+    async def read_frame(self):
+        """Return the next (kind, payload) frame from stdout, or None once the worker closed it"""
+        while True:
+            frame = self.frames.next_frame()
+            if frame is not None:
+                return frame
+            data = await self.stdout.read(65536)
+            if not data:
+                if self.frames.pending():
+                    logger.warning(f"Worker {self.name} closed stdout in the middle of a frame")
+                return None
+            self.frames.feed(data)
+
+    async def wait_until_ready(self, timeout=READY_TIMEOUT):
+        """Wait for the READY frame, so start latency follows the worker and not a constant"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise TimeoutError(f"Worker {self.name} not ready after {timeout}s")
+            try:
+                frame = await asyncio.wait_for(self.read_frame(), remaining)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"Worker {self.name} not ready after {timeout}s")
+
+            if frame is None:
+                error_str = (await self.stderr.read()).decode('utf-8', errors='replace')
+                raise RuntimeError(f"Worker {self.name} exited before it was ready: {error_str[-500:]}")
+
+            kind, payload = frame
+            if kind == protocol.READY:
+                logger.info(f"Worker {self.name} ready in "
+                            f"{(datetime.now() - self.created_at).total_seconds():.3f}s")
+                # A long-lived worker must not let unread stderr pile up
+                self._stderr_task = asyncio.create_task(self._drain_stderr())
+                return
+
+            # Anything sent before READY belongs to worker startup, not to a job
+            logger.info(f"Worker {self.name} startup output: {payload[:80].decode('utf-8', errors='replace')}")
+
+    async def _drain_stderr(self):
+        while True:
+            line_bytes = await self.stderr.readline()
+            if not line_bytes:
+                return
+            line_str = line_bytes.decode('utf-8', errors='replace').rstrip('\n')
+            self.stderr_tail.append(line_str)
+            logger.info(f"Worker {self.name} stderr: {line_str[:200]}")
+
+    async def stderr_output(self):
+        """Return recent stderr output, complete once the worker has exited"""
+        if self._stderr_task and not self.is_alive():
+            await self._stderr_task
+        return "\n".join(self.stderr_tail)
+
+    async def send_job(self, payload):
+        """Hand a job to the runtime as a single JSON line on stdin"""
+        await self.write((json.dumps(payload) + "\n").encode('utf-8'))
@@ -2,18 +2,28 @@
 
 import os
 import json
+import time
+import asyncio
 import logging
 from dotenv import load_dotenv
-from fastapi import FastAPI, Request, HTTPException, BackgroundTasks
+from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import StreamingResponse, JSONResponse, Response
 from datetime import datetime
 
 # Import from local modules
 from models import LoginRequest, ChatRequest
-from auth import handle_login
-from agent_manager import stream_from_agent, cleanup_old_processes
-from config import AGENTS_DIR, TOKEN_EXPIRATION
+from auth import handle_login, handle_logout, verify_token, verify_gateway_key, quota, client_id
+from auth import start_revocation_sync, stop_revocation_sync
+from agent_manager import stream_from_agent, warm_agent_pools, shutdown_agent_pools
+from image_builder import prebuild_agent_images
+from scheduler import scheduler, run_with_slot
+from sse import collect_events
+from llm_gateway import llm_gateway
+from metrics import registry, CONTENT_TYPE
+from state_store import store
+import tracing
+from config import AGENTS_DIR, TOKEN_EXPIRATION, PREBUILD_AGENT_IMAGES, BACKEND_WORKERS, GATEWAY_URL
 
 # Load environment variables
 load_dotenv()
@@ -22,9 +32,6 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# In-memory token storage (for MVP only)
-active_tokens = {}
-
 # Create FastAPI app
 app = FastAPI()
 
@@ -38,6 +45,25 @@ app.add_middleware(
 )
 
 
+# Warm up agent containers before the first request arrives
+@app.on_event("startup")
+async def startup():
+    if PREBUILD_AGENT_IMAGES:
+        asyncio.create_task(prebuild_agent_images())
+    start_revocation_sync()
+    await warm_agent_pools()
+
+
+# Remove idle pooled containers when the server stops
+@app.on_event("shutdown")
+async def shutdown():
+    await shutdown_agent_pools()
+    await llm_gateway.close()
+    await tracing.exporter.close()
+    await stop_revocation_sync()
+    await store.close()
+
+
 # Middleware to handle exceptions
 @app.middleware("http")
 async def exception_middleware(request: Request, call_next):
@@ -55,13 +81,20 @@ async def exception_middleware(request: Request, call_next):
 @app.post("/api/login")
 async def login(request: LoginRequest):
     """Simple login to obtain an access token"""
-    return await handle_login(request, active_tokens, TOKEN_EXPIRATION, logger)
+    with tracing.span("POST /api/login", kind="server"):
+        return await handle_login(request, TOKEN_EXPIRATION, logger)
 
 
-# New endpoint for chat completions with agent support
-@app.post("/chat/completions")
-async def chat_completions(request: ChatRequest, req: Request, background_tasks: BackgroundTasks):
-    """Handle chat completions with agent support"""
+# Logout endpoint
+@app.post("/api/logout")
+async def logout(req: Request):
+    """Revoke the access token in the Authorization header"""
+    _, claims = authenticate(req)
+    return await handle_logout(claims, logger)
+
+
+# Bearer token of the request and its claims, or 401
+def authenticate(req: Request):
     # Extract token from header
     auth_header = req.headers.get('Authorization')
     token = None
@@ -75,14 +108,21 @@ async def chat_completions(request: ChatRequest, req: Request, background_tasks:
             detail="Missing token in Authorization header"
         )
 
-    if token not in active_tokens:
+    # Signed tokens are checked here, without a lookup in shared state
+    claims = verify_token(token)
+    if claims is None:
         raise HTTPException(
             status_code=401,
             detail="Invalid or expired token"
         )
+    return token, claims
 
-    # Schedule cleanup of old processes
-    background_tasks.add_task(cleanup_old_processes)
+
+# New endpoint for chat completions with agent support
+@app.post("/chat/completions")
+async def chat_completions(request: ChatRequest, req: Request):
+    """Handle chat completions with agent support"""
+    token, claims = authenticate(req)
 
     # Get agent name and messages
     agent_name = request.agent_name
@@ -108,22 +148,50 @@ async def chat_completions(request: ChatRequest, req: Request, background_tasks:
             detail=f"Agent '{agent_name}' not found"
         )
 
-    # Store messages and agent in token data
-    active_tokens[token]['messages'] = messages
-    active_tokens[token]['agent_name'] = agent_name
-    active_tokens[token]['max_tokens'] = request.max_tokens
+    # Root span of the request, continuing the caller's trace when it sent a traceparent
+    request_span = tracing.start_span(
+        "POST /chat/completions", req.headers.get('traceparent'), kind="server",
+        agent=agent_name, stream=request.stream, messages=len(messages)
+    )
+
+    # Wait for a run slot; over capacity this raises 429 with Retry-After
+    queued_at = time.monotonic()
+    try:
+        with tracing.span("scheduler.admit", parent=request_span):
+            # The token's quota tier sets the run's priority class and fair share
+            tier = quota(claims)
+            slot = await scheduler.admit(
+                client_id(claims),
+                agent_name,
+                priority=tier['priority'],
+                weight=tier['weight']
+            )
+    except BaseException as e:
+        request_span.record_error(e)
+        request_span.end()
+        raise
 
-    # If not streaming, run agent directly and return result
+    stream = tracing.traced_stream(
+        request_span,
+        run_with_slot(slot, stream_from_agent(agent_name, messages, request.max_tokens, token, trace=request_span))
+    )
+
+    # If not streaming, run the same stream to completion and return it as one body
     if not request.stream:
-        # TODO: Implement non-streaming mode
-        raise HTTPException(
-            status_code=501,
-            detail="Non-streaming mode not implemented yet"
-        )
+        queued_ms = round((time.monotonic() - queued_at) * 1000, 1)
+        result = await collect_events(stream)
+        if result["errors"] and not (result["content"] or result["messages"]):
+            raise HTTPException(
+                status_code=502,
+                detail=result["errors"][0]
+            )
+
+        result["timings"]["queued_ms"] = queued_ms
+        return {"agent_name": agent_name, **result}
 
     # Return streaming response, passing the token for persistent sessions
     return StreamingResponse(
-        stream_from_agent(agent_name, messages, request.max_tokens, token),
+        stream,
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -133,11 +201,59 @@ async def chat_completions(request: ChatRequest, req: Request, background_tasks:
     )
 
 
+# OpenAI-compatible gateway to API_BASE_URL for agents' chat completions, mounted when GATEWAY_URL is set
+async def llm_gateway_proxy(req: Request):
+    """Forward an agent's chat completion request upstream over the shared connection pool"""
+    # Only agents hold the gateway key, see environment_config
+    if not verify_gateway_key(req.headers.get('authorization')):
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid gateway key"
+        )
+
+    body = await req.body()
+    # Joins the trace of the agent's completion call
+    gateway_span = tracing.start_span("POST /v1/chat/completions", req.headers.get('traceparent'), kind="server")
+    try:
+        shared = await llm_gateway.forward("POST", "chat/completions", req.url.query, req.headers, body)
+    except Exception as e:
+        gateway_span.record_error(e)
+        gateway_span.end()
+        raise HTTPException(
+            status_code=502,
+            detail=f"LLM gateway error: {str(e)}"
+        )
+
+    gateway_span.set_attributes(status=shared.status, coalesced=shared.subscribers > 1)
+    return StreamingResponse(
+        tracing.traced_stream(gateway_span, llm_gateway.relay(shared)),
+        status_code=shared.status,
+        headers=shared.headers
+    )
+
+
+if GATEWAY_URL:
+    app.add_api_route("/v1/chat/completions", llm_gateway_proxy, methods=["POST"])
+
+
 # Health check endpoint
 @app.get("/api/health")
 async def health_check():
     """Simple health check endpoint"""
-    return {"status": "ok", "timestamp": datetime.now().isoformat()}
+    return {
+        "status": "ok",
+        "timestamp": datetime.now().isoformat(),
+        "scheduler": scheduler.stats(),
+        "gateway": llm_gateway.stats(),
+        "state_store": store.stats(),
+    }
+
+
+# Prometheus metrics endpoint
+@app.get("/metrics")
+async def metrics():
+    """Agent runner metrics in the Prometheus text format"""
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
 
 
 # Run when directly executed
@@ -149,4 +265,5 @@ if __name__ == "__main__":
         os.makedirs(AGENTS_DIR)
 
     port = int(os.environ.get("PORT", 5001))
-    uvicorn.run("app:app", host="0.0.0.0", port=port)
\ No newline at end of file
+    # Worker processes share tokens and sessions through STATE_STORE
+    uvicorn.run("app:app", host="0.0.0.0", port=port, workers=BACKEND_WORKERS)
\ No newline at end of file
@@ -1,32 +1,169 @@
 # backend/auth.py
 
+import json
+import hmac
+import time
+import base64
+import asyncio
+import hashlib
+import logging
 import secrets
-from datetime import datetime, timedelta
+from datetime import datetime
 from fastapi import HTTPException
 from models import LoginRequest
+from metrics import logins, login_seconds
+from state_store import store
+from config import TOKEN_SECRET, TOKEN_DEFAULT_TIER, TOKEN_REVOCATION_SYNC_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Quota tiers carried in tokens: scheduler priority class and fair-share weight
+QUOTA_TIERS = {
+    "free": {"priority": "batch", "weight": 0.5},
+    "standard": {"priority": "standard", "weight": 1.0},
+    "pro": {"priority": "interactive", "weight": 2.0},
+}
+
+# State store set of the ids of revoked tokens, each kept until its token would have expired
+REVOKED_KEY = "revoked_tokens"
+
+if TOKEN_SECRET:
+    _secret = TOKEN_SECRET.encode('utf-8')
+else:
+    logger.warning("TOKEN_SECRET is not set, tokens are signed with a random key and end with this process")
+    _secret = secrets.token_bytes(32)
+
+# Ids of revoked tokens, checked on every request without leaving the process: those revoked
+# here (id -> expiry, kept until the token expires) and the store's copy as of the last sync
+_revoked_here = {}
+_revoked_shared = set()
+_sync_task = None
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode('ascii')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(payload):
+    return _b64encode(hmac.new(_secret, payload.encode('utf-8'), hashlib.sha256).digest())
+
+
+# Function to issue a signed token
+def issue_token(username, tier, ttl):
+    """Self-describing token: base64url claims (user, tier, expiry, id) and their HMAC-SHA256"""
+    claims = {"sub": username, "tier": tier, "exp": int(time.time() + ttl), "jti": secrets.token_hex(8)}
+    payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode('utf-8'))
+    return f"{payload}.{_sign(payload)}", claims
+
+
+# Function to verify a signed token
+def verify_token(token):
+    """Claims of a valid, unexpired, unrevoked token, else None; no shared state is read"""
+    payload, _, signature = token.partition(".")
+    # Constant-time comparison, so the signature cannot be guessed byte by byte
+    if not signature or not hmac.compare_digest(signature.encode('utf-8'), _sign(payload).encode('utf-8')):
+        return None
+    try:
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        return None
+    if claims["exp"] <= time.time() or claims["jti"] in _revoked_here or claims["jti"] in _revoked_shared:
+        return None
+    return claims
+
+
+# Scheduler priority and weight of a token's tier
+def quota(claims):
+    return QUOTA_TIERS.get(claims.get("tier")) or QUOTA_TIERS["standard"]
+
+
+# Client the scheduler's per-user caps and rate limit apply to
+def client_id(claims):
+    """The token's id as well as its user: every MVP login is "user", so each login counts as its own client"""
+    return f"{claims['sub']}:{claims['jti']}"
+
 
 # Handle login and token generation
-async def handle_login(request: LoginRequest, active_tokens, token_expiration, logger):
+async def handle_login(request: LoginRequest, token_expiration, logger):
     """Simple login to obtain an access token"""
+    started = time.monotonic()
     logger.info(f"Login attempt for user: {request.username}")
 
     # Simple authentication for MVP
     if request.username == 'user' and request.password == 'password':
-        # Generate token
-        token = secrets.token_hex(16)
-        expiration = datetime.now() + timedelta(hours=token_expiration)
-
-        # Store token
-        active_tokens[token] = {
-            'username': request.username,
-            'expiration': expiration
-        }
+        # Generate token, nothing is stored: it carries its own user, tier and expiry
+        token, claims = issue_token(request.username, TOKEN_DEFAULT_TIER, token_expiration * 3600)
+        expiration = datetime.fromtimestamp(claims["exp"])
 
         logger.info(f"Login successful for user: {request.username}")
+        logins.inc(result="success")
+        login_seconds.observe(time.monotonic() - started)
         return {
             'token': token,
-            'expires': expiration.isoformat()
+            'expires': expiration.isoformat(),
+            'tier': claims["tier"]
         }
 
     logger.warning(f"Login failed for user: {request.username}")
-    raise HTTPException(status_code=401, detail="Invalid credentials")
\ No newline at end of file
+    logins.inc(result="failure")
+    login_seconds.observe(time.monotonic() - started)
+    raise HTTPException(status_code=401, detail="Invalid credentials")
+
+
+# Key agents present to the LLM gateway instead of the upstream AUTH_TOKEN
+def gateway_key():
+    """Derived from the signing key, so every backend process accepts the same one"""
+    return _sign("llm-gateway")
+
+
+# Function to verify the Authorization header of a gateway request
+def verify_gateway_key(authorization):
+    scheme, _, key = (authorization or "").partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(key.encode('utf-8'), gateway_key().encode('utf-8'))
+
+
+# Expired tokens fail verification anyway, their revocations can go
+def forget_expired(now):
+    for jti in [jti for jti, expires_at in _revoked_here.items() if expires_at <= now]:
+        del _revoked_here[jti]
+
+
+# Handle logout by revoking the token
+async def handle_logout(claims, logger):
+    """Revoke a token here at once, and in other backend processes at their next sync"""
+    now = time.time()
+    forget_expired(now)
+    _revoked_here[claims["jti"]] = claims["exp"]
+    if store.shared and claims["exp"] > now:
+        await store.add_member(REVOKED_KEY, claims["jti"], claims["exp"] - now)
+    logger.info(f"Logout for user: {claims['sub']}")
+    return {'status': 'ok'}
+
+
+# Keep the local copy of the revoked tokens up to date
+async def sync_revocations():
+    """Every TOKEN_REVOCATION_SYNC_SECONDS, copy the store's revoked set and forget expired tokens"""
+    global _revoked_shared
+    while True:
+        try:
+            _revoked_shared = await store.members(REVOKED_KEY)
+        except Exception as e:
+            logger.error(f"Error syncing revoked tokens: {str(e)}")
+        forget_expired(time.time())
+        await asyncio.sleep(TOKEN_REVOCATION_SYNC_SECONDS)
+
+
+def start_revocation_sync():
+    global _sync_task
+    if store.shared and (_sync_task is None or _sync_task.done()):
+        _sync_task = asyncio.create_task(sync_revocations())
+
+
+async def stop_revocation_sync():
+    if _sync_task and not _sync_task.done():
+        _sync_task.cancel()
+        await asyncio.gather(_sync_task, return_exceptions=True)
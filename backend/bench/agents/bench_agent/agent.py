@@ -0,0 +1,17 @@
+# Benchmark agent: one streamed completion per turn, like most agents
+
+
+def main(env):
+    messages = [{
+        "role": "system",
+        "content": "You are a benchmark agent."
+    }] + env.list_messages()
+
+    reply = env.completion(messages, temperature=0.7, stream=True)
+
+    env.add_reply(reply)
+    env.mark_done()
+
+
+if 'env' in globals():  # This conditional allows the code to work with our injected environment
+    main(env)
@@ -0,0 +1,330 @@
+# backend/bench/fake_docker.py
+"""Docker Engine API stand-in for benchmarks
+
+Serves the subset of the Engine API used by docker_api.DockerClient on a
+unix socket. Agent containers run the real agent runtime as a local
+process, with bind mounts mapped back to host paths and named volumes kept
+as directories (archives uploaded into them are extracted), so the backend goes
+through its full container path (create, attach, start, READY, jobs,
+remove) without a Docker daemon. Image builds and dependency builds
+succeed after a configurable delay; the host Python's packages stand in
+for the dependency cache.
+
+    python bench/fake_docker.py --socket /tmp/bench-docker.sock --start-ms 300
+"""
+
+import io
+import os
+import sys
+import json
+import uuid
+import shutil
+import struct
+import asyncio
+import tarfile
+import argparse
+import tempfile
+from urllib.parse import parse_qs, unquote, urlsplit
+
+# Command the container pools run; anything else is treated as a one-off build container
+RUNTIME_MODULE = "agent_runtime.runner"
+
+
+class FakeDocker:
+    def __init__(self, start_ms=0.0, build_ms=0.0, ncpu=None, memory=None, volume_dir=None):
+        self.start_delay = start_ms / 1000
+        self.build_delay = build_ms / 1000
+        self.ncpu = ncpu or os.cpu_count() or 1
+        self.memory = memory or 16 * 2 ** 30
+        self.images = {"python:3.9-slim"}
+        self.containers = {}
+        # Named volumes: name -> directory under volume_dir
+        self.volume_dir = volume_dir or tempfile.mkdtemp(prefix="fake-docker-volumes-")
+        self.volumes = {}
+        self.stats = {"created": 0, "started": 0, "removed": 0, "builds": 0}
+
+    async def handle(self, reader, writer):
+        try:
+            while await self._request(reader, writer):
+                pass
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            if not writer.is_closing():
+                writer.close()
+
+    async def _request(self, reader, writer):
+        """Serve one request; False once the connection is done"""
+        line = await reader.readline()
+        if not line:
+            return False
+        method, target, _ = line.decode('latin-1').split(" ", 2)
+        headers = {}
+        while True:
+            header = await reader.readline()
+            if header in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = header.decode('latin-1').partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            body = b""
+            while True:
+                size = int((await reader.readline()).strip(), 16)
+                body += await reader.readexactly(size + 2)
+                body = body[:-2]
+                if size == 0:
+                    break
+        else:
+            body = await reader.readexactly(int(headers.get("content-length") or 0))
+
+        url = urlsplit(target)
+        path = url.path
+        # Versioned paths (/v1.41/...) are served like unversioned ones
+        if path.startswith("/v1."):
+            path = "/" + path.split("/", 2)[2]
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        parts = path.strip("/").split("/")
+
+        if parts[0] == "containers" and len(parts) == 3 and parts[2] == "attach":
+            await self._attach(parts[1], reader, writer)
+            return False
+
+        status, payload = await self._route(method, parts, query, body)
+        data = b"" if payload is None else json.dumps(payload).encode()
+        writer.write(
+            f"HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n".encode()
+            + data
+        )
+        await writer.drain()
+        return True
+
+    async def _route(self, method, parts, query, body):
+        head = parts[0]
+        if head == "_ping":
+            return 200, "OK"
+        if head == "version":
+            return 200, {"Version": "fake", "ApiVersion": "1.41"}
+        if head == "info":
+            return 200, {"NCPU": self.ncpu, "MemTotal": self.memory, "Name": "fake-docker"}
+
+        if head == "images":
+            image = unquote(parts[1])
+            if parts[-1] == "tag":
+                self.images.add(f"{query['repo']}:{query.get('tag', 'latest')}")
+                return 201, None
+            if image in self.images:
+                return 200, {"Id": f"sha256:{uuid.uuid5(uuid.NAMESPACE_DNS, image).hex}",
+                             "Config": {"Env": [f"PYTHON_VERSION={sys.version.split()[0]}"]}}
+            return 404, {"message": f"No such image: {image}"}
+
+        if head == "build":
+            await asyncio.sleep(self.build_delay)
+            self.images.add(query["t"])
+            self.stats["builds"] += 1
+            return 200, {"stream": f"Successfully tagged {query['t']}\n"}
+
+        if head == "volumes":
+            if method == "POST":
+                self._volume(json.loads(body)["Name"])
+                return 201, {}
+            name = unquote(parts[1])
+            if method == "DELETE":
+                path = self.volumes.pop(name, None)
+                if path:
+                    shutil.rmtree(path, ignore_errors=True)
+                return 204, None
+            return (200, {"Name": name}) if name in self.volumes else (404, {"message": "No such volume"})
+
+        if head == "containers":
+            if parts[1] == "create":
+                container_id = uuid.uuid4().hex
+                self.containers[container_id] = {
+                    "config": json.loads(body),
+                    "attached": asyncio.get_running_loop().create_future(),
+                    "process": None,
+                }
+                self.stats["created"] += 1
+                return 201, {"Id": container_id}
+
+            container = self.containers.get(parts[1])
+            if container is None:
+                return 404, {"message": f"No such container: {parts[1]}"}
+            action = parts[2] if len(parts) > 2 else None
+            if action == "start":
+                await self._start(container)
+                return 204, None
+            if action == "wait":
+                return 200, {"StatusCode": await container["exited"]}
+            if action == "archive":
+                self._extract(container["config"], query["path"], body)
+                return 200, None
+            if method == "DELETE":
+                self.containers.pop(parts[1], None)
+                process = container["process"]
+                if process and process.returncode is None:
+                    process.kill()
+                self.stats["removed"] += 1
+                return 204, None
+
+        return 404, {"message": f"Not implemented: {method} /{'/'.join(parts)}"}
+
+    async def _attach(self, container_id, reader, writer):
+        container = self.containers.get(container_id)
+        if container is None:
+            writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n")
+            return
+        writer.write(b"HTTP/1.1 101 UPGRADED\r\nContent-Type: application/vnd.docker.raw-stream\r\n"
+                     b"Connection: Upgrade\r\nUpgrade: tcp\r\n\r\n")
+        await writer.drain()
+        container["attached"].set_result((reader, writer))
+        # The connection now belongs to the container; keep it open until the container exits
+        await container.setdefault("done", asyncio.get_running_loop().create_future())
+
+    def _volume(self, name):
+        """Directory of a named volume, created on first use like the daemon does"""
+        if name not in self.volumes:
+            self.volumes[name] = os.path.join(self.volume_dir, "volumes", name)
+            os.makedirs(self.volumes[name], exist_ok=True)
+        return self.volumes[name]
+
+    def _extract(self, config, path, data):
+        """Unpack an uploaded archive into the mount holding path; the container's own files are not kept"""
+        for container_path, host_path in self._host_paths(config):
+            if path == container_path or path.startswith(container_path + "/"):
+                with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+                    tar.extractall(host_path + path[len(container_path):],
+                                   **({"filter": "data"} if hasattr(tarfile, "data_filter") else {}))
+                return
+
+    def _host_paths(self, config):
+        """Container path -> host path for the bind mounts and volumes, longest first"""
+        mapping = {}
+        for bind in (config.get("HostConfig") or {}).get("Binds") or []:
+            host, container = bind.split(":")[:2]
+            if not os.path.isabs(host):
+                # Reached through a link named like the mount point, so the parent rule below applies
+                link = os.path.join(self.volume_dir, "mounts", host, os.path.basename(container))
+                if not os.path.islink(link):
+                    os.makedirs(os.path.dirname(link), exist_ok=True)
+                    os.symlink(self._volume(host), link)
+                host = link
+            mapping[container] = host
+            # A mounted package directory also makes its parent importable
+            if os.path.isdir(host) and os.path.basename(host) == os.path.basename(container):
+                mapping.setdefault(os.path.dirname(container), os.path.dirname(host))
+        return sorted(mapping.items(), key=lambda item: len(item[0]), reverse=True)
+
+    async def _start(self, container):
+        config = container["config"]
+        container["exited"] = asyncio.get_running_loop().create_future()
+        container.setdefault("done", asyncio.get_running_loop().create_future())
+        await asyncio.sleep(self.start_delay)
+        self.stats["started"] += 1
+
+        command = config.get("Cmd") or []
+        if RUNTIME_MODULE not in command:
+            # Build containers (pip install into the dependency cache) finish right away;
+            # the host interpreter's packages stand in for what they would install
+            for container_path, host_path in self._host_paths(config):
+                if container_path == "/deps":
+                    os.makedirs(os.path.join(host_path, "site"), exist_ok=True)
+            asyncio.create_task(self._finish(container, None, 0))
+            return
+
+        paths = self._host_paths(config)
+
+        def to_host(value):
+            # Each path of a value like PYTHONPATH is mapped once, by the longest mount it is under
+            mapped = []
+            for path in value.split(":"):
+                for container_path, host_path in paths:
+                    if path == container_path or path.startswith(container_path + "/"):
+                        path = host_path + path[len(container_path):]
+                        break
+                mapped.append(path)
+            return ":".join(mapped)
+
+        env = dict(os.environ)
+        for entry in config.get("Env") or []:
+            name, _, value = entry.partition("=")
+            env[name] = to_host(value)
+        # The runtime writes bytecode to a per-container prefix inside the container
+        env.pop("PYTHONPYCACHEPREFIX", None)
+        argv = [sys.executable if arg == "python" else to_host(arg) for arg in command]
+
+        process = await asyncio.create_subprocess_exec(
+            *argv, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE, env=env
+        )
+        container["process"] = process
+        asyncio.create_task(self._run(container, process))
+
+    async def _run(self, container, process):
+        reader, writer = await container["attached"]
+
+        async def pump(source, stream_id):
+            # Docker's multiplexed stream: stream id, three zero bytes, big-endian length
+            while True:
+                data = await source.read(65536)
+                if not data:
+                    break
+                writer.write(bytes([stream_id, 0, 0, 0]) + struct.pack(">I", len(data)) + data)
+                await writer.drain()
+
+        async def feed_stdin():
+            try:
+                while True:
+                    data = await reader.read(65536)
+                    if not data:
+                        break
+                    process.stdin.write(data)
+                    await process.stdin.drain()
+            except (ConnectionError, BrokenPipeError):
+                pass
+            finally:
+                if not process.stdin.is_closing():
+                    process.stdin.close()
+
+        stdin_task = asyncio.create_task(feed_stdin())
+        try:
+            await asyncio.gather(pump(process.stdout, 1), pump(process.stderr, 2))
+        except ConnectionError:
+            process.kill()
+        code = await process.wait()
+        stdin_task.cancel()
+        await self._finish(container, writer, code)
+
+    async def _finish(self, container, writer, code):
+        if writer is None:
+            reader, writer = await container["attached"]
+        if not writer.is_closing():
+            writer.close()
+        if not container["exited"].done():
+            container["exited"].set_result(code)
+        if not container["done"].done():
+            container["done"].set_result(None)
+
+
+async def serve(socket_path, **options):
+    docker = FakeDocker(volume_dir=f"{socket_path}.volumes", **options)
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = await asyncio.start_unix_server(docker.handle, socket_path)
+    print(f"READY {socket_path}", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--socket", default="/tmp/bench-docker.sock")
+    parser.add_argument("--start-ms", type=float, default=0.0, help="delay added to every container start")
+    parser.add_argument("--build-ms", type=float, default=0.0, help="duration of every image build")
+    parser.add_argument("--ncpu", type=int, default=None, help="CPUs reported by /info")
+    args = parser.parse_args()
+    asyncio.run(serve(args.socket, start_ms=args.start_ms, build_ms=args.build_ms, ncpu=args.ncpu))
+
+
+if __name__ == "__main__":
+    main()
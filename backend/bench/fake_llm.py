@@ -0,0 +1,142 @@
+# backend/bench/fake_llm.py
+"""OpenAI-compatible chat completions server for benchmarks
+
+Streams a fixed number of tokens per completion at a configurable rate,
+after a configurable time to first token, so agent runs have a known,
+repeatable LLM cost. Plain asyncio, HTTP/1.1 keep-alive, chunked
+streaming; GET /stats reports the calls served.
+
+    python bench/fake_llm.py --port 8765 --tokens 64 --token-rate 100 --latency-ms 200
+"""
+
+import json
+import time
+import asyncio
+import argparse
+
+
+class FakeLLM:
+    def __init__(self, tokens=64, token_rate=100.0, latency_ms=0.0):
+        self.tokens = tokens
+        self.token_interval = 1.0 / token_rate if token_rate > 0 else 0.0
+        self.latency = latency_ms / 1000
+        self.stats = {"completions": 0, "streamed": 0, "tokens": 0, "in_flight": 0}
+
+    async def handle(self, reader, writer):
+        try:
+            while await self._request(reader, writer):
+                pass
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            if not writer.is_closing():
+                writer.close()
+
+    async def _request(self, reader, writer):
+        line = await reader.readline()
+        if not line:
+            return False
+        method, path, _ = line.decode('latin-1').split(" ", 2)
+        headers = {}
+        while True:
+            header = await reader.readline()
+            if header in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = header.decode('latin-1').partition(":")
+            headers[name.strip().lower()] = value.strip()
+        body = await reader.readexactly(int(headers.get("content-length") or 0))
+
+        if path.startswith("/stats"):
+            self._json(writer, 200, self.stats)
+        elif method == "POST" and path.rstrip("/").endswith("/chat/completions"):
+            await self._completion(writer, json.loads(body or b"{}"))
+        else:
+            self._json(writer, 404, {"error": {"message": f"Not found: {path}"}})
+        await writer.drain()
+        return True
+
+    @staticmethod
+    def _json(writer, status, payload):
+        data = json.dumps(payload).encode()
+        writer.write(f"HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(data)}\r\n\r\n".encode() + data)
+
+    async def _completion(self, writer, request):
+        count = min(self.tokens, int(request.get("max_tokens") or self.tokens))
+        model = request.get("model") or "fake"
+        created = int(time.time())
+        usage = {"prompt_tokens": len(json.dumps(request.get("messages") or [])) // 4,
+                 "completion_tokens": count}
+        usage["total_tokens"] = usage["prompt_tokens"] + count
+
+        self.stats["completions"] += 1
+        self.stats["in_flight"] += 1
+        try:
+            await asyncio.sleep(self.latency)
+            if not request.get("stream"):
+                await asyncio.sleep(self.token_interval * count)
+                self.stats["tokens"] += count
+                self._json(writer, 200, {
+                    "id": "chatcmpl-bench", "object": "chat.completion", "created": created, "model": model,
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": "".join(self._words(count))}}],
+                    "usage": usage,
+                })
+                return
+
+            self.stats["streamed"] += 1
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                         b"Transfer-Encoding: chunked\r\n\r\n")
+            next_at = time.monotonic()
+            for word in self._words(count):
+                self._chunk(writer, {
+                    "id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}],
+                })
+                await writer.drain()
+                self.stats["tokens"] += 1
+                # Paced against the clock so slow writes do not lower the configured rate
+                next_at += self.token_interval
+                delay = next_at - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            self._chunk(writer, {
+                "id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "usage": usage,
+            })
+            self._chunk(writer, "[DONE]")
+            writer.write(b"0\r\n\r\n")
+        finally:
+            self.stats["in_flight"] -= 1
+
+    @staticmethod
+    def _words(count):
+        return [f" tok{i}" for i in range(count)]
+
+    @staticmethod
+    def _chunk(writer, event):
+        data = f"data: {event if isinstance(event, str) else json.dumps(event)}\n\n".encode()
+        writer.write(b"%x\r\n" % len(data) + data + b"\r\n")
+
+
+async def serve(host, port, **options):
+    server = await asyncio.start_server(FakeLLM(**options).handle, host, port)
+    print(f"READY http://{host}:{port}/v1", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--tokens", type=int, default=64, help="tokens per completion (capped by max_tokens)")
+    parser.add_argument("--token-rate", type=float, default=100.0, help="tokens per second per stream, 0 = unpaced")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="delay before the first token")
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, tokens=args.tokens, token_rate=args.token_rate,
+                      latency_ms=args.latency_ms))
+
+
+if __name__ == "__main__":
+    main()
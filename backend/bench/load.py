@@ -0,0 +1,266 @@
+# backend/bench/load.py
+"""Concurrent load client for /chat/completions
+
+Runs the same streamed chat at increasing concurrency levels against a
+running backend. Each concurrent virtual user logs in once, keeps its
+session across levels, and sends requests back to back for the level's
+duration. Per level it reports
+time to first token, per-stream and aggregate tokens per second, request
+latency, errors and, given the server's process ids, CPU seconds per
+stream. The highest level that meets the TTFT and error SLOs is reported
+as the max sustainable concurrency.
+
+    python bench/load.py --url http://127.0.0.1:5001 --agent bench_agent --levels 1,4,16 --output load.json
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import asyncio
+import argparse
+import platform
+from datetime import datetime, timezone
+import httpx
+
+# Clock ticks per second for /proc CPU times
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of an unsorted list, None when empty"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def distribution(values, scale=1.0, digits=2):
+    def fmt(value):
+        return None if value is None else round(value * scale, digits)
+    return {
+        "p50": fmt(percentile(values, 50)),
+        "p95": fmt(percentile(values, 95)),
+        "p99": fmt(percentile(values, 99)),
+        "mean": fmt(sum(values) / len(values) if values else None),
+        "max": fmt(max(values) if values else None),
+    }
+
+
+def process_tree_cpu(pids):
+    """CPU seconds used so far by the processes and all their live descendants (Linux /proc)"""
+    stats = {}
+    for entry in os.listdir("/proc") if os.path.isdir("/proc") else []:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        # Fields after the command name: state, ppid, ... utime (12), stime (13)
+        stats[int(entry)] = (int(fields[1]), int(fields[11]) + int(fields[12]))
+
+    children = {}
+    for pid, (ppid, _) in stats.items():
+        children.setdefault(ppid, []).append(pid)
+
+    total, stack, seen = 0, list(pids), set()
+    while stack:
+        pid = stack.pop()
+        if pid in seen or pid not in stats:
+            continue
+        seen.add(pid)
+        total += stats[pid][1]
+        stack.extend(children.get(pid, []))
+    return total / CLOCK_TICKS
+
+
+async def login(client):
+    response = await client.post("/api/login", json={"username": "user", "password": "password"})
+    response.raise_for_status()
+    return response.json()["token"]
+
+
+async def run_stream(client, token, agent, messages, max_tokens):
+    """One streamed chat; returns its timings and token count"""
+    sample = {"ok": False, "ttft": None, "duration": None, "tokens": 0, "error": None}
+    started = time.perf_counter()
+    first_token_at = None
+    try:
+        async with client.stream(
+            "POST", "/chat/completions", headers={"Authorization": f"Bearer {token}"},
+            json={"agent_name": agent, "messages": messages, "max_tokens": max_tokens, "stream": True},
+        ) as response:
+            if response.status_code != 200:
+                await response.aread()
+                sample["error"] = f"HTTP {response.status_code}"
+                return sample
+
+            event, data = "message", []
+            async for line in response.aiter_lines():
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    data.append(line[5:].lstrip())
+                elif not line and data:
+                    if event == "message" and first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    elif event == "error" and not sample["error"]:
+                        sample["error"] = "\n".join(data)[:200]
+                    elif event == "completion":
+                        usage = json.loads("\n".join(data)).get("usage") or {}
+                        sample["tokens"] = max(sample["tokens"], usage.get("completion_tokens") or 0)
+                    event, data = "message", []
+    except httpx.HTTPError as e:
+        sample["error"] = f"{type(e).__name__}: {e}"
+        return sample
+
+    ended = time.perf_counter()
+    sample["duration"] = ended - started
+    if first_token_at is not None:
+        sample["ttft"] = first_token_at - started
+        if sample["tokens"] and ended > first_token_at:
+            sample["tokens_per_second"] = sample["tokens"] / (ended - first_token_at)
+    sample["ok"] = sample["error"] is None and first_token_at is not None
+    if not sample["ok"] and not sample["error"]:
+        sample["error"] = "no tokens streamed"
+    return sample
+
+
+async def run_level(url, agent, tokens, duration, warmup, max_tokens, pids, timeout):
+    """Run one concurrency level, one virtual user per token, and summarize it"""
+    concurrency = len(tokens)
+    limits = httpx.Limits(max_connections=concurrency + 4, max_keepalive_connections=concurrency + 4)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=timeout) as client:
+        messages = [{"role": "user", "content": "Benchmark request: reply with a few sentences."}]
+
+        # Warm-up turns start each user's session, so the level measures steady state
+        await asyncio.gather(*[
+            run_stream(client, token, agent, messages, max_tokens) for token in tokens for _ in range(warmup)
+        ])
+
+        samples = []
+        deadline = time.perf_counter() + duration
+
+        async def user(token):
+            while time.perf_counter() < deadline:
+                samples.append(await run_stream(client, token, agent, messages, max_tokens))
+
+        cpu_before = process_tree_cpu(pids) if pids else None
+        started = time.perf_counter()
+        await asyncio.gather(*[user(token) for token in tokens])
+        wall = time.perf_counter() - started
+        cpu_used = process_tree_cpu(pids) - cpu_before if pids else None
+
+    ok = [s for s in samples if s["ok"]]
+    errors = {}
+    for s in samples:
+        if s["error"]:
+            errors[s["error"]] = errors.get(s["error"], 0) + 1
+    total_tokens = sum(s["tokens"] for s in ok)
+    return {
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "ok": len(ok),
+        "error_rate": round((len(samples) - len(ok)) / len(samples), 4) if samples else None,
+        "errors": errors,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(ok) / wall, 3) if wall else None,
+        "ttft_ms": distribution([s["ttft"] for s in ok], 1000),
+        "latency_ms": distribution([s["duration"] for s in ok], 1000),
+        "stream_tokens_per_second": distribution([s["tokens_per_second"] for s in ok if "tokens_per_second" in s]),
+        "aggregate_tokens_per_second": round(total_tokens / wall, 2) if wall else None,
+        "cpu_seconds": round(cpu_used, 3) if cpu_used is not None else None,
+        "cpu_ms_per_stream": round(cpu_used * 1000 / len(ok), 2) if cpu_used is not None and ok else None,
+    }
+
+
+def sustainable(level, slo_ttft_ms, max_error_rate):
+    p95 = level["ttft_ms"]["p95"]
+    return level["ok"] > 0 and level["error_rate"] <= max_error_rate and p95 is not None and p95 <= slo_ttft_ms
+
+
+async def run_load(url, agent, levels, duration=10.0, warmup=1, max_tokens=256, pids=(), slo_ttft_ms=1000.0,
+                   max_error_rate=0.01, timeout=120.0, stop_on_breach=True, log=print):
+    """Run every level in order and return the machine-readable result"""
+    results = []
+    max_sustainable = 0
+    async with httpx.AsyncClient(base_url=url, timeout=timeout) as client:
+        users = [await login(client) for _ in range(max(levels))]
+
+    for concurrency in levels:
+        level = await run_level(url, agent, users[:concurrency], duration, warmup, max_tokens, list(pids), timeout)
+        level["sustainable"] = sustainable(level, slo_ttft_ms, max_error_rate)
+        results.append(level)
+        log(f"concurrency {concurrency:>4}: {level['requests']} requests, "
+            f"ttft p50/p95/p99 {level['ttft_ms']['p50']}/{level['ttft_ms']['p95']}/{level['ttft_ms']['p99']} ms, "
+            f"{level['aggregate_tokens_per_second']} tok/s, cpu {level['cpu_ms_per_stream']} ms/stream, "
+            f"errors {level['error_rate']}")
+        if level["sustainable"]:
+            max_sustainable = max(max_sustainable, concurrency)
+        elif stop_on_breach:
+            break
+
+    return {
+        "schema": 1,
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "config": {
+            "url": url, "agent": agent, "levels": list(levels), "duration_seconds": duration,
+            "warmup_requests": warmup, "max_tokens": max_tokens, "slo_ttft_ms": slo_ttft_ms,
+            "max_error_rate": max_error_rate,
+        },
+        "levels": results,
+        "max_sustainable_concurrency": max_sustainable,
+    }
+
+
+def add_load_arguments(parser):
+    parser.add_argument("--agent", default="bench_agent")
+    parser.add_argument("--levels", default="1,2,4,8,16,32", help="comma-separated concurrency levels")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per level")
+    parser.add_argument("--warmup", type=int, default=1, help="unmeasured requests per user before each level")
+    parser.add_argument("--max-tokens", type=int, default=256)
+    parser.add_argument("--slo-ttft-ms", type=float, default=1000.0, help="p95 time to first token a level must meet")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--all-levels", action="store_true", help="keep going after a level misses the SLO")
+    parser.add_argument("--output", help="write the JSON result here instead of stdout")
+
+
+def load_options(args, pids=()):
+    return dict(
+        agent=args.agent, levels=[int(level) for level in args.levels.split(",") if level.strip()],
+        duration=args.duration, warmup=args.warmup, max_tokens=args.max_tokens, pids=pids,
+        slo_ttft_ms=args.slo_ttft_ms, max_error_rate=args.max_error_rate, stop_on_breach=not args.all_levels,
+        log=lambda line: print(line, file=sys.stderr, flush=True),
+    )
+
+
+def write_result(result, output):
+    data = json.dumps(result, indent=2)
+    if output:
+        with open(output, 'w') as f:
+            f.write(data + "\n")
+    else:
+        print(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", default="http://127.0.0.1:5001")
+    parser.add_argument("--pid", type=int, action="append", default=[],
+                        help="server process id to measure CPU for, with its children (repeatable)")
+    add_load_arguments(parser)
+    args = parser.parse_args()
+    result = asyncio.run(run_load(args.url, **load_options(args, args.pid)))
+    write_result(result, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+# backend/bench/run_bench.py
+"""End-to-end benchmark: fake LLM, fake Docker, the real backend and the load client
+
+Starts the fake LLM and (for the docker backend) the fake Docker Engine
+API, runs the backend under uvicorn in a scratch directory with the bench
+agent, drives it with bench/load.py and writes one JSON result, so runs
+on different commits can be compared.
+
+    cd backend && python bench/run_bench.py --levels 1,4,16,64 --output bench-results.json
+"""
+
+import os
+import sys
+import time
+import shutil
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import load  # noqa: E402
+
+# Backend settings that would otherwise limit or skew the benchmark; the caller's environment wins
+BENCH_DEFAULTS = {
+    "SCHED_MAX_CONCURRENT": "100000",
+    "SCHED_MAX_PER_USER": "100000",
+    "SCHED_MAX_PER_AGENT": "100000",
+    "SCHED_MAX_QUEUE": "100000",
+    "SCHED_USER_RATE": "1000000",
+    "SCHED_USER_BURST": "1000000",
+    "SESSION_MAX_LIVE": "100000",
+    "CPU_PLACEMENT": "false",
+    "PREBUILD_AGENT_IMAGES": "false",
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start(argv, name, workdir, env=None, ready_line=None, timeout=30.0):
+    """Start a helper process logging to workdir; wait for its READY line when given"""
+    log_path = os.path.join(workdir, f"{name}.log")
+    log = open(log_path, "w")
+    process = subprocess.Popen(argv, cwd=workdir, env=env, stdout=subprocess.PIPE if ready_line else log,
+                               stderr=log, text=True)
+    if ready_line:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            line = process.stdout.readline()
+            if line.startswith(ready_line):
+                break
+            if not line and process.poll() is not None:
+                raise RuntimeError(f"{name} exited early, see {log_path}")
+        else:
+            raise RuntimeError(f"{name} did not start within {timeout}s, see {log_path}")
+    return process
+
+
+def wait_for_backend(url, process, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Backend exited during startup, see backend.log")
+        try:
+            if httpx.get(f"{url}/api/health", timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Backend did not answer within {timeout}s")
+
+
+def stop(process):
+    if process and process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True,
+                              timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--backend", choices=["docker", "local"], default="docker",
+                        help="execution backend; docker runs against the fake Engine API")
+    parser.add_argument("--tokens", type=int, default=64, help="tokens per completion from the fake LLM")
+    parser.add_argument("--token-rate", type=float, default=100.0, help="fake LLM tokens per second per stream")
+    parser.add_argument("--latency-ms", type=float, default=100.0, help="fake LLM time to first token")
+    parser.add_argument("--start-ms", type=float, default=0.0, help="fake Docker container start delay")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory with the process logs")
+    load.add_load_arguments(parser)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="agent-bench-")
+    shutil.copytree(os.path.join(BENCH_DIR, "agents"), os.path.join(workdir, "agents"))
+    processes = []
+    try:
+        llm_port = free_port()
+        processes.append(start(
+            [sys.executable, os.path.join(BENCH_DIR, "fake_llm.py"), "--port", str(llm_port),
+             "--tokens", str(args.tokens), "--token-rate", str(args.token_rate), "--latency-ms", str(args.latency_ms)],
+            "fake_llm", workdir, ready_line="READY",
+        ))
+
+        env = dict(os.environ)
+        for name, value in BENCH_DEFAULTS.items():
+            env.setdefault(name, value)
+        env.update({
+            "API_BASE_URL": f"http://127.0.0.1:{llm_port}/v1",
+            "AUTH_TOKEN": "bench",
+            "DEFAULT_MODEL": "bench-model",
+            "EXECUTION_BACKEND": args.backend,
+            "PYTHONPATH": BACKEND_DIR + os.pathsep + env.get("PYTHONPATH", ""),
+        })
+        env.pop("DOCKER_HOSTS", None)
+
+        if args.backend == "docker":
+            docker_socket = os.path.join(workdir, "docker.sock")
+            processes.append(start(
+                [sys.executable, os.path.join(BENCH_DIR, "fake_docker.py"), "--socket", docker_socket,
+                 "--start-ms", str(args.start_ms)],
+                "fake_docker", workdir, ready_line="READY",
+            ))
+            env["DOCKER_SOCKET"] = docker_socket
+
+        port = free_port()
+        backend = start(
+            [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port),
+             "--log-level", "warning"],
+            "backend", workdir, env=env,
+        )
+        processes.append(backend)
+        url = f"http://127.0.0.1:{port}"
+        wait_for_backend(url, backend)
+
+        # The backend, its workers and the fake daemon (which runs the containers) are the server side
+        pids = [backend.pid] + ([processes[1].pid] if args.backend == "docker" else [])
+        options = load.load_options(args, pids)
+        result = asyncio.run(load.run_load(url, **options))
+        result["bench"] = {
+            "backend": args.backend,
+            "git_commit": git_commit(),
+            "fake_llm": {"tokens": args.tokens, "token_rate": args.token_rate, "latency_ms": args.latency_ms},
+            "fake_docker": {"start_ms": args.start_ms} if args.backend == "docker" else None,
+            "settings": {name: env[name] for name in BENCH_DEFAULTS},
+        }
+        load.write_result(result, args.output)
+    finally:
+        for process in reversed(processes):
+            stop(process)
+        if args.keep:
+            print(f"Logs kept in {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
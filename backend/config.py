@@ -2,8 +2,8 @@
 
 import os
 import logging
+import tempfile
 from dotenv import load_dotenv
-from openai import OpenAI
 
 # Load environment variables
 load_dotenv()
@@ -21,10 +21,138 @@ API_BASE_URL = os.environ.get('API_BASE_URL')
 AUTH_TOKEN = os.environ.get('AUTH_TOKEN')
 DEFAULT_MODEL = os.environ.get('DEFAULT_MODEL')
 TOKEN_EXPIRATION = 24  # hours
+# uvicorn worker processes; the concurrency, queue, rate, pool and session limits below are for
+# the whole host, and each worker enforces its share since it only sees its own requests
+BACKEND_WORKERS = max(1, int(os.environ.get('WEB_CONCURRENCY', 1)))
+
+
+# Function to give one worker process its share of a host-wide limit
+def worker_share(limit, minimum=1):
+    return max(minimum, limit // BACKEND_WORKERS)
+
+
 AGENTS_DIR = "agents"
+BASE_IMAGE = "python:3.9-slim"
+DOCKER_SOCKET = os.environ.get('DOCKER_SOCKET', '/var/run/docker.sock')
+# Docker daemons agents are placed on: comma-separated unix:///path or tcp://host:port endpoints
+DOCKER_HOSTS = [h.strip() for h in os.environ.get('DOCKER_HOSTS', DOCKER_SOCKET).split(',') if h.strip()]
+# Seconds an unreachable Docker host is skipped before it is tried again
+HOST_RETRY_SECONDS = float(os.environ.get('HOST_RETRY_SECONDS', 30))
+
+# Agent image builds: concurrent build workers and whether to build all images at startup
+IMAGE_BUILD_WORKERS = int(os.environ.get('IMAGE_BUILD_WORKERS', 2))
+PREBUILD_AGENT_IMAGES = os.environ.get('PREBUILD_AGENT_IMAGES', 'false').lower() in ('1', 'true', 'yes')
+
+# Host directory holding content-addressed copies of agent.py mounted into containers
+ENTRYPOINT_CACHE_DIR = os.path.abspath(os.environ.get('ENTRYPOINT_CACHE_DIR', 'entrypoint_cache'))
+
+# Host directory holding prebuilt agent dependencies, keyed by requirements hash
+DEPS_CACHE_DIR = os.path.abspath(os.environ.get('DEPS_CACHE_DIR', 'deps_cache'))
+
+# Warm container pool settings (per agent)
+POOL_MIN_SIZE = int(os.environ.get('POOL_MIN_SIZE', 1))
+# Every worker keeps a warm container when the host keeps any
+POOL_MIN_SIZE = worker_share(POOL_MIN_SIZE, minimum=min(POOL_MIN_SIZE, 1))
+POOL_MAX_SIZE = worker_share(int(os.environ.get('POOL_MAX_SIZE', 8)))
+# Keep one container per (user, agent) alive between turns and send it only new messages
+AGENT_SESSIONS = os.environ.get('AGENT_SESSIONS', 'true').lower() in ('1', 'true', 'yes')
+# Seconds a session may sit idle before its worker is stopped, and the cap on live sessions
+# (the least recently used idle session is evicted when a new one would exceed it)
+SESSION_IDLE_TTL = float(os.environ.get('SESSION_IDLE_TTL', 86400))
+SESSION_MAX_LIVE = worker_share(int(os.environ.get('SESSION_MAX_LIVE', 256)))
+# Seconds a new container gets to report READY before it is discarded
+READY_TIMEOUT = float(os.environ.get('READY_TIMEOUT', 60))
+
+# Unix socket of the fork server that runs agents without a Dockerfile
+FORK_SERVER_SOCKET = os.environ.get(
+    'FORK_SERVER_SOCKET', os.path.join(tempfile.gettempdir(), f"agent-fork-server-{os.getpid()}.sock")
+)
+
+# Default execution backend for agents without a "backend" in agent.json:
+# "auto" (docker when the agent has a Dockerfile, local otherwise), "docker", "local" or "sandbox"
+EXECUTION_BACKEND = os.environ.get('EXECUTION_BACKEND', 'auto')
+
+# Namespace sandbox backend: launcher binary and optional cgroup v2 limits
+# (SANDBOX_CGROUP_ROOT must be a cgroup directory delegated to this user)
+SANDBOX_LAUNCHER = os.environ.get('SANDBOX_LAUNCHER', 'bwrap')
+SANDBOX_CGROUP_ROOT = os.environ.get('SANDBOX_CGROUP_ROOT')
+SANDBOX_MEMORY_LIMIT = os.environ.get('SANDBOX_MEMORY_LIMIT', '512M')
+SANDBOX_CPUS = float(os.environ.get('SANDBOX_CPUS', 1))
+SANDBOX_PIDS_LIMIT = int(os.environ.get('SANDBOX_PIDS_LIMIT', 64))
 
-# Initialize OpenAI client
-client = OpenAI(
-    api_key="dummy",  # Will be overridden by auth header
-    base_url=API_BASE_URL
-)
\ No newline at end of file
+# Admission scheduler: concurrent agent runs (global, per user, per agent), queue bound,
+# seconds a request may wait in the queue, and the per-user rate limit (requests/s and burst, rate 0 = unlimited)
+SCHED_MAX_CONCURRENT = worker_share(int(os.environ.get('SCHED_MAX_CONCURRENT', 64)))
+SCHED_MAX_PER_USER = worker_share(int(os.environ.get('SCHED_MAX_PER_USER', 4)))
+SCHED_MAX_PER_AGENT = worker_share(int(os.environ.get('SCHED_MAX_PER_AGENT', 32)))
+SCHED_MAX_QUEUE = worker_share(int(os.environ.get('SCHED_MAX_QUEUE', 256)))
+SCHED_QUEUE_TIMEOUT = float(os.environ.get('SCHED_QUEUE_TIMEOUT', 30))
+SCHED_USER_RATE = float(os.environ.get('SCHED_USER_RATE', 2)) / BACKEND_WORKERS
+SCHED_USER_BURST = max(1.0, float(os.environ.get('SCHED_USER_BURST', 10)) / BACKEND_WORKERS)
+
+# Default resources for agents whose agent.json has no "resources" (empty/0 = unlimited)
+AGENT_DEFAULT_CPUS = float(os.environ.get('AGENT_DEFAULT_CPUS', 0))
+AGENT_DEFAULT_MEMORY = os.environ.get('AGENT_DEFAULT_MEMORY', '')
+AGENT_DEFAULT_PIDS = int(os.environ.get('AGENT_DEFAULT_PIDS', 0))
+# Pin containers with a CPU limit to CPU sets on one NUMA node; capacity per CPU (1.0 = no overcommit).
+# With several backend workers each one places onto its own slice of every node's CPUs
+CPU_PLACEMENT = os.environ.get('CPU_PLACEMENT', 'true').lower() in ('1', 'true', 'yes')
+PLACEMENT_OVERCOMMIT = float(os.environ.get('PLACEMENT_OVERCOMMIT', 1.0))
+
+# Opt-in cache of deterministic (temperature 0, n=1) completions made by agents: entries kept
+# in memory per worker, and a directory shared by all workers (mounted into containers)
+COMPLETION_CACHE = os.environ.get('COMPLETION_CACHE', 'false').lower() in ('1', 'true', 'yes')
+COMPLETION_CACHE_DIR = os.path.abspath(os.environ.get('COMPLETION_CACHE_DIR', 'completion_cache'))
+COMPLETION_CACHE_ENTRIES = int(os.environ.get('COMPLETION_CACHE_ENTRIES', 256))
+# Limits of the shared directory: total size in MB, and seconds an entry may go unused (0 = no limit)
+COMPLETION_CACHE_MAX_MB = int(os.environ.get('COMPLETION_CACHE_MAX_MB', 1024))
+COMPLETION_CACHE_TTL = int(os.environ.get('COMPLETION_CACHE_TTL', 7 * 24 * 3600))
+
+# Concurrent LLM calls one agent run may make through env.acompletion / env.completion_many
+AGENT_COMPLETION_CONCURRENCY = int(os.environ.get('AGENT_COMPLETION_CONCURRENCY', 4))
+
+# Token counting: "auto" (tiktoken when installed, else an estimate), "tiktoken" or "approx"
+TOKENIZER = os.environ.get('TOKENIZER', 'auto')
+TOKENIZER_ENCODING = os.environ.get('TOKENIZER_ENCODING', 'cl100k_base')
+# Per-turn budgets: streamed tokens as a multiple of the request's max_tokens, and seconds;
+# a worker over budget is stopped (0 = no limit)
+AGENT_TOKEN_BUDGET_FACTOR = float(os.environ.get('AGENT_TOKEN_BUDGET_FACTOR', 8))
+AGENT_TURN_TIMEOUT = float(os.environ.get('AGENT_TURN_TIMEOUT', 600))
+
+# SSE token coalescing: tokens are batched into one event for up to this many milliseconds
+# or characters, whichever comes first (0 ms sends every token as its own event)
+SSE_COALESCE_MS = float(os.environ.get('SSE_COALESCE_MS', 20))
+SSE_COALESCE_CHARS = int(os.environ.get('SSE_COALESCE_CHARS', 1024))
+
+# LLM gateway served at /v1/chat/completions: URL agents use to reach it (empty = no gateway,
+# agents call API_BASE_URL directly), HTTP/2 upstream when the h2 package is installed, pool size and request timeout
+GATEWAY_URL = os.environ.get('GATEWAY_URL', '')
+GATEWAY_HTTP2 = os.environ.get('GATEWAY_HTTP2', 'true').lower() in ('1', 'true', 'yes')
+GATEWAY_MAX_CONNECTIONS = int(os.environ.get('GATEWAY_MAX_CONNECTIONS', 100))
+GATEWAY_KEEPALIVE_CONNECTIONS = int(os.environ.get('GATEWAY_KEEPALIVE_CONNECTIONS', 20))
+GATEWAY_TIMEOUT = float(os.environ.get('GATEWAY_TIMEOUT', 300))
+# Request tracing: exporter ("" = off, "file" = JSON lines in TRACE_FILE, "otlp" = OTLP/HTTP JSON
+# to TRACE_OTLP_ENDPOINT), share of new traces sampled and seconds between exports
+TRACE_EXPORTER = os.environ.get('TRACE_EXPORTER', '').lower()
+TRACE_FILE = os.path.abspath(os.environ.get('TRACE_FILE', 'traces.jsonl'))
+TRACE_OTLP_ENDPOINT = os.environ.get('TRACE_OTLP_ENDPOINT', 'http://localhost:4318/v1/traces')
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', 1.0))
+TRACE_FLUSH_SECONDS = float(os.environ.get('TRACE_FLUSH_SECONDS', 1.0))
+# Shared state (revoked tokens, session metadata and ownership): "memory" (this process only),
+# "sqlite:path/to/state.db" (processes on one host) or "redis://host:port/db" (any number of
+# replicas) and seconds between checks for sessions moved to another process
+STATE_STORE = os.environ.get('STATE_STORE', 'memory')
+STATE_SWEEP_SECONDS = float(os.environ.get('STATE_SWEEP_SECONDS', 30))
+if BACKEND_WORKERS > 1 and STATE_STORE in ('', 'memory'):
+    error_msg = "WEB_CONCURRENCY > 1 needs a shared STATE_STORE (sqlite: or redis://)"
+    logging.error(error_msg)
+    raise EnvironmentError(error_msg)
+# Access tokens: HMAC key (empty = random per process, tokens die with it), quota tier of new
+# tokens and seconds between refreshes of the revoked (logged out) tokens from STATE_STORE
+TOKEN_SECRET = os.environ.get('TOKEN_SECRET', '')
+TOKEN_DEFAULT_TIER = os.environ.get('TOKEN_DEFAULT_TIER', 'standard')
+TOKEN_REVOCATION_SYNC_SECONDS = float(os.environ.get('TOKEN_REVOCATION_SYNC_SECONDS', 5))
+if BACKEND_WORKERS > 1 and not TOKEN_SECRET:
+    error_msg = "WEB_CONCURRENCY > 1 needs a TOKEN_SECRET shared by every worker"
+    logging.error(error_msg)
+    raise EnvironmentError(error_msg)
@@ -0,0 +1,308 @@
+# backend/container_pool.py
+
+import os
+import time
+import uuid
+import asyncio
+import logging
+from collections import deque
+from config import POOL_MIN_SIZE, POOL_MAX_SIZE, COMPLETION_CACHE, COMPLETION_CACHE_DIR
+from dependency_cache import DEPS_MOUNT
+from agent_worker import AgentWorker
+from resources import ResourceProfile
+from placement import docker_resource_config
+from metrics import container_start_seconds, container_attach_seconds
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Runtime package mounted read-only into every container, unless a compiled copy is given
+RUNTIME_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "agent_runtime")
+RUNTIME_MOUNT = "/opt/agent-runtime"
+# Where the agent's code is mounted; a directory of its own, so the image's /app stays visible
+ENTRYPOINT_MOUNT = "/opt/agent-entrypoint/entrypoint.py"
+
+# Pools keyed by (host, agent name, image, dependency dir, entrypoint, resource profile)
+container_pools = {}
+
+
+class WarmContainer(AgentWorker):
+    """A pre-started agent container that is idle and waiting on stdin for a job"""
+
+    def __init__(self, name, image, container_id, stream, host, cpus=0.0):
+        super().__init__(name)
+        self.image = image
+        # Docker host the container runs on, sessions stay on it
+        self.host = host
+        # CPUs counted against the host while the container exists
+        self.cpus = cpus
+        self.id = container_id
+        self.stream = stream
+        # Pool the container is checked out from, None once it belongs to a session
+        self.pool = None
+        # CPUs reserved for the container, given back when it is removed
+        self.placement = None
+
+    @property
+    def stdout(self):
+        return self.stream.stdout
+
+    @property
+    def stderr(self):
+        return self.stream.stderr
+
+    def is_alive(self):
+        # The daemon closes the attach connection when the container exits
+        return not self.stream.closed.is_set()
+
+    async def write(self, data):
+        await self.stream.write(data)
+
+    async def release_resources(self):
+        """Close the stream and give back the container's CPU set and host capacity; runs once"""
+        await self.stream.close()
+        if self.placement:
+            self.host.placer.release(self.placement)
+            self.placement = None
+        if self.cpus is not None:
+            self.host.remove_container(self.cpus)
+            self.cpus = None
+
+    async def destroy(self):
+        """Force-remove the container through the Engine API if it still runs, then release its resources"""
+        try:
+            # An exited container is gone already (AutoRemove), but still holds its reservations here
+            if self.is_alive():
+                await self.host.client.remove_container(self.id, force=True)
+        finally:
+            await self.release_resources()
+
+
+class ContainerPool:
+    """Per-agent pool of warm containers, refilled in the background"""
+
+    def __init__(self, host, agent_name, image, deps_dir, entrypoint_path, resources=None,
+                 min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE, runtime_dir=None):
+        # Docker host all containers of the pool run on
+        self.host = host
+        self.agent_name = agent_name
+        self.image = image
+        # CPU, memory and pids limits applied to every container of the pool
+        self.resources = resources or ResourceProfile()
+        # Prebuilt dependency cache mounted read-only, so containers never run pip
+        self.deps_dir = deps_dir
+        # Cached copy of agent.py the runtime serves jobs with
+        self.entrypoint_path = entrypoint_path
+        # Directory holding agent_runtime, compiled for the image's interpreter
+        self.runtime_dir = runtime_dir or os.path.dirname(RUNTIME_DIR)
+        self.min_size = min_size
+        self.max_size = max(max_size, 1)
+        self.idle = deque()
+        # Containers counted against max_size: idle, starting and busy
+        self.live = 0
+        self.starting = 0
+        # Requests blocked in acquire()
+        self.waiting = 0
+        self.closed = False
+        self._refill_task = None
+        self._changed = asyncio.Condition()
+
+    async def _start_container(self):
+        """Start a container and return it once it reported READY"""
+        with tracing.span("container.start", agent=self.agent_name, image=self.image, host=self.host.name):
+            return await self._launch_container()
+
+    async def _launch_container(self):
+        name = f"agent-{self.agent_name}-{uuid.uuid4().hex[:8]}"
+        config = {
+            "Image": self.image,
+            # The runtime imports its dependencies and compiles the agent before
+            # reporting READY, so none of that happens once a job arrives
+            "Cmd": ["python", "-u", "-m", "agent_runtime.runner", ENTRYPOINT_MOUNT],
+            "WorkingDir": "/app",
+            "Env": [
+                "PYTHONWARNINGS=ignore",
+                f"PYTHONPATH={RUNTIME_MOUNT}:{DEPS_MOUNT}",
+            ],
+            # Keep STDIN open so the job can be handed over later
+            "OpenStdin": True,
+            "StdinOnce": True,
+            "AttachStdin": True,
+            "AttachStdout": True,
+            "AttachStderr": True,
+            "Tty": False,
+            "HostConfig": {
+                "AutoRemove": True,
+                # Bind mounts locally, content-addressed volumes on remote hosts
+                "Binds": [
+                    await self.host.mount(os.path.join(self.deps_dir, 'site'), DEPS_MOUNT, self.image),
+                    await self.host.mount(os.path.join(self.runtime_dir, 'agent_runtime'), f"{RUNTIME_MOUNT}/agent_runtime", self.image),
+                    await self.host.mount(self.entrypoint_path, ENTRYPOINT_MOUNT, self.image),
+                ] + ([self.host.shared_mount(COMPLETION_CACHE_DIR)] if COMPLETION_CACHE else []),
+            },
+        }
+
+        placement = None
+        if self.host.placer and self.resources.cpus:
+            placement = self.host.placer.place(self.resources.cpus, self.resources.memory)
+            if placement is None:
+                logger.warning(f"No CPU set has room for {name}, starting it unpinned")
+        config["HostConfig"].update(docker_resource_config(self.resources, placement))
+
+        logger.info(f"Starting warm container: {name} on {self.host.name}"
+                    + (f", CPUs {placement.cpuset} (node {placement.node})" if placement else ""))
+        client = self.host.client
+        started = time.monotonic()
+        try:
+            container_id = await client.create_container(config, name=name)
+            try:
+                # Attach before starting so no output is missed
+                attach_started = time.monotonic()
+                with tracing.span("container.attach"):
+                    stream = await client.attach(container_id)
+                container_attach_seconds.observe(time.monotonic() - attach_started, host=self.host.name)
+            except BaseException:
+                await client.remove_container(container_id)
+                raise
+        except BaseException:
+            if placement:
+                self.host.placer.release(placement)
+            raise
+        self.host.add_container(self.resources.cpus or 1.0)
+        container = WarmContainer(name, self.image, container_id, stream, self.host, self.resources.cpus or 1.0)
+        container.placement = placement
+
+        try:
+            await client.start_container(container_id)
+            await container.wait_until_ready()
+        except BaseException:
+            await container.destroy()
+            raise
+
+        container_start_seconds.observe(time.monotonic() - started, host=self.host.name)
+        return container
+
+    async def acquire(self):
+        """Take an idle container, starting one on demand while below max_size"""
+        while True:
+            while self.idle:
+                container = self.idle.popleft()
+                if container.is_alive():
+                    container.pool = self
+                    self.schedule_refill()
+                    return container
+                # Container died while idle, it no longer counts against the pool or its host
+                self.live -= 1
+                await container.release_resources()
+
+            # Containers already starting are closer to ready than a new one
+            if self.waiting < self.starting or self.live >= self.max_size:
+                self.waiting += 1
+                try:
+                    async with self._changed:
+                        await self._changed.wait()
+                finally:
+                    self.waiting -= 1
+                continue
+
+            self.live += 1
+            try:
+                container = await self._start_container()
+            except Exception:
+                self.live -= 1
+                raise
+            container.pool = self
+            self.schedule_refill()
+            return container
+
+    async def detach(self, container):
+        """Hand a container over to a session; it no longer counts against the pool"""
+        container.pool = None
+        self.live -= 1
+        async with self._changed:
+            self._changed.notify()
+        self.schedule_refill()
+
+    async def release(self, container):
+        """Return a container after its job; single-use containers are torn down"""
+        await container.destroy()
+        self.live -= 1
+        async with self._changed:
+            self._changed.notify()
+        self.schedule_refill()
+
+    def schedule_refill(self):
+        """Top the pool back up to min_size without blocking the caller"""
+        if self.closed:
+            return
+        if self._refill_task is None or self._refill_task.done():
+            self._refill_task = asyncio.create_task(self._refill())
+
+    async def _refill(self):
+        # Refills serve later requests, not the one that happened to trigger them
+        tracing.detach()
+        while not self.closed and len(self.idle) + self.starting < self.min_size and self.live < self.max_size:
+            missing = min(self.min_size - len(self.idle) - self.starting, self.max_size - self.live)
+            results = await asyncio.gather(*[self._warm_one() for _ in range(missing)])
+            if not all(results):
+                # Do not spin on a broken image or daemon
+                break
+
+    async def _warm_one(self):
+        """Start one container and park it in the idle queue as soon as it is ready"""
+        self.live += 1
+        self.starting += 1
+        try:
+            container = await self._start_container()
+            self.idle.append(container)
+            return True
+        except Exception as e:
+            logger.error(f"Error starting warm container for {self.agent_name}: {str(e)}")
+            self.live -= 1
+            return False
+        finally:
+            self.starting -= 1
+            async with self._changed:
+                self._changed.notify_all()
+
+    async def close(self):
+        """Stop refilling and remove all idle containers"""
+        self.closed = True
+        if self._refill_task and not self._refill_task.done():
+            self._refill_task.cancel()
+            await asyncio.gather(self._refill_task, return_exceptions=True)
+        while self.idle:
+            container = self.idle.popleft()
+            self.live -= 1
+            await container.destroy()
+
+
+def get_container_pool(host, agent_name, image, deps_dir, entrypoint_path, resources=None, runtime_dir=None):
+    """Return the host's pool for an agent image and dependency set, creating it on first use"""
+    key = (host.name, agent_name, image, deps_dir, entrypoint_path, resources, runtime_dir)
+    pool = container_pools.get(key)
+    if pool is None:
+        # Idle containers of an outdated image or dependency set are retired
+        for other_key in [k for k in container_pools if k[:2] == key[:2]]:
+            logger.info(f"Retiring container pool for {agent_name} ({other_key[2]}) on {host.name}")
+            asyncio.create_task(container_pools.pop(other_key).close())
+
+        pool = ContainerPool(host, agent_name, image, deps_dir, entrypoint_path, resources, runtime_dir=runtime_dir)
+        container_pools[key] = pool
+        logger.info(f"Created container pool for {agent_name} ({image}) on {host.name}")
+    return pool
+
+
+def idle_containers(host, agent_name, image):
+    """Number of warm containers of the agent image waiting on the host"""
+    return sum(
+        len(pool.idle) for key, pool in container_pools.items()
+        if key[:3] == (host.name, agent_name, image)
+    )
+
+
+async def close_container_pools():
+    """Remove every idle pooled container, used on shutdown"""
+    for pool in list(container_pools.values()):
+        await pool.close()
+    container_pools.clear()
@@ -0,0 +1,254 @@
+# backend/dependency_cache.py
+
+import os
+import uuid
+import fcntl
+import shutil
+import asyncio
+import hashlib
+import logging
+from config import AGENTS_DIR, DEPS_CACHE_DIR
+from docker_hosts import build_host
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Packages every agent container needs to run the injected Environment
+BASE_REQUIREMENTS = ["openai==1.2.0", "httpx==0.27.2"]
+
+# Mount point of the prebuilt site-packages inside agent containers
+DEPS_MOUNT = "/opt/agent-deps"
+
+# Runtime package injected into agent containers, compiled once per interpreter
+RUNTIME_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "agent_runtime")
+
+# Marker written once a cache entry is complete
+COMPLETE_MARKER = ".complete"
+
+# Builds in flight, keyed by cache key, so concurrent callers share one build
+pending_dependency_builds = {}
+
+# Cache keys already known to be complete, and the directory each resolved to
+ready_dependency_dirs = {}
+
+# Python version per image, inspected once
+image_python_versions = {}
+
+# Content hash of the runtime sources, read once
+runtime_digests = {}
+
+
+def agent_requirements(agent_name):
+    """Return the normalized requirement lines for an agent"""
+    lines = list(BASE_REQUIREMENTS)
+    req_path = os.path.join(AGENTS_DIR, agent_name, "requirements.txt")
+    if os.path.exists(req_path):
+        with open(req_path, 'r') as f:
+            lines.extend(f.read().splitlines())
+
+    requirements = set()
+    for line in lines:
+        line = line.split('#', 1)[0].strip()
+        if line:
+            requirements.add(line)
+    return sorted(requirements)
+
+
+async def image_python_version(image):
+    """Python version of an image, so wheels are only shared between compatible interpreters"""
+    if image in image_python_versions:
+        return image_python_versions[image]
+
+    info = await build_host().client.inspect_image(image)
+    # Unknown interpreter, fall back to keying on the image itself
+    version = info.get("Id", image)
+    for entry in (info.get("Config") or {}).get("Env") or []:
+        if entry.startswith("PYTHON_VERSION="):
+            version = entry.split("=", 1)[1]
+            break
+
+    image_python_versions[image] = version
+    return version
+
+
+def dependency_cache_key(requirements, python_version):
+    """Content hash of the requirements and the interpreter they are built for"""
+    digest = hashlib.sha256()
+    digest.update(python_version.encode('utf-8'))
+    digest.update(b"\0")
+    digest.update("\n".join(requirements).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def runtime_cache_key(python_version):
+    """Content hash of the runtime sources and the interpreter they are compiled for"""
+    if RUNTIME_DIR not in runtime_digests:
+        digest = hashlib.sha256()
+        for root, dirs, files in os.walk(RUNTIME_DIR):
+            dirs[:] = sorted(name for name in dirs if name != "__pycache__")
+            for name in sorted(files):
+                if name.endswith(".py"):
+                    path = os.path.join(root, name)
+                    digest.update(os.path.relpath(path, RUNTIME_DIR).encode('utf-8') + b"\0")
+                    with open(path, 'rb') as f:
+                        digest.update(f.read() + b"\0")
+        runtime_digests[RUNTIME_DIR] = digest.hexdigest()
+
+    digest = hashlib.sha256()
+    digest.update(python_version.encode('utf-8'))
+    digest.update(b"\0")
+    digest.update(runtime_digests[RUNTIME_DIR].encode('utf-8'))
+    return "runtime-" + digest.hexdigest()[:16]
+
+
+def published_dependency_dir(key):
+    """Complete directory the cache key points to, or None
+
+    DEPS_CACHE_DIR/<key> is a symlink to the version built last, <key>.<id>;
+    containers mount the version itself, which is never changed or removed.
+    """
+    cache_dir = os.path.realpath(os.path.join(DEPS_CACHE_DIR, key))
+    if os.path.exists(os.path.join(cache_dir, COMPLETE_MARKER)):
+        return cache_dir
+    return None
+
+
+async def ensure_dependencies(agent_name, image):
+    """Return the host directory with the agent's prebuilt dependencies, building it once
+
+    Builds run on the local build host, which must already have the image.
+    """
+    requirements = agent_requirements(agent_name)
+    python_version = await image_python_version(image)
+    key = dependency_cache_key(requirements, python_version)
+    return await _ensure_cache_entry(key, lambda: _run_dependency_build(key, requirements, image))
+
+
+async def ensure_runtime_bytecode(image):
+    """Return the host directory with agent_runtime compiled by the image's interpreter, building it once
+
+    Containers mount it read-only and load the bytecode instead of compiling the runtime on every start.
+    """
+    key = runtime_cache_key(await image_python_version(image))
+    return await _ensure_cache_entry(key, lambda: _run_runtime_build(key, image))
+
+
+async def _ensure_cache_entry(key, run_build):
+    if key in ready_dependency_dirs:
+        return ready_dependency_dirs[key]
+
+    cache_dir = published_dependency_dir(key)
+    if cache_dir:
+        # Built on an earlier run or by another backend process, usable without network access
+        ready_dependency_dirs[key] = cache_dir
+        return cache_dir
+
+    build = pending_dependency_builds.get(key)
+    if build is None:
+        build = asyncio.ensure_future(_build_cache_entry(key, run_build))
+        pending_dependency_builds[key] = build
+        build.add_done_callback(lambda _: pending_dependency_builds.pop(key, None))
+
+    # Shield the shared build from callers that give up waiting
+    cache_dir = await asyncio.shield(build)
+    ready_dependency_dirs[key] = cache_dir
+    return cache_dir
+
+
+async def _build_cache_entry(key, run_build):
+    """Build the cache entry unless another backend process on this host built it meanwhile"""
+    os.makedirs(DEPS_CACHE_DIR, exist_ok=True)
+    # Builds of a key are serialized across processes by a lock file; closing it releases the lock
+    lock_fd = os.open(os.path.join(DEPS_CACHE_DIR, f".{key}.lock"), os.O_CREAT | os.O_RDWR, 0o644)
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, fcntl.flock, lock_fd, fcntl.LOCK_EX)
+        cache_dir = published_dependency_dir(key)
+        if cache_dir:
+            logger.info(f"Dependency cache {key} was built by another process")
+            return cache_dir
+        return await run_build()
+    finally:
+        os.close(lock_fd)
+
+
+def _new_staging_dir(key):
+    build_id = uuid.uuid4().hex[:8]
+    staging_dir = os.path.join(DEPS_CACHE_DIR, f".{key}.{build_id}")
+    os.makedirs(staging_dir)
+    return build_id, staging_dir
+
+
+async def _run_dependency_build(key, requirements, image):
+    """Build a wheelhouse and an installed site directory in a throwaway container"""
+    link_path = os.path.join(DEPS_CACHE_DIR, key)
+    build_id, staging_dir = _new_staging_dir(key)
+
+    # Reuse a wheelhouse left from an earlier build so rebuilds can run offline
+    previous_wheels = os.path.join(os.path.realpath(link_path), "wheels")
+    if os.path.isdir(previous_wheels):
+        shutil.copytree(previous_wheels, os.path.join(staging_dir, "wheels"))
+        fetch = "true"
+    else:
+        fetch = "pip wheel --quiet --no-cache-dir --wheel-dir /deps/wheels -r /deps/requirements.txt"
+
+    with open(os.path.join(staging_dir, "requirements.txt"), 'w') as f:
+        f.write("\n".join(requirements) + "\n")
+
+    logger.info(f"Building dependency cache {key} for {image}")
+    config = {
+        "Image": image,
+        "Cmd": [
+            "bash", "-c",
+            f"{fetch} && pip install --quiet --no-cache-dir --no-index --find-links /deps/wheels"
+            " --target /deps/site -r /deps/requirements.txt"
+        ],
+        "Env": ["PIP_DISABLE_PIP_VERSION_CHECK=1", "PYTHONWARNINGS=ignore"],
+        "HostConfig": {"Binds": [f"{staging_dir}:/deps"]},
+    }
+    with tracing.span("dependencies.install", key=key, image=image):
+        return await _run_build_container(key, build_id, staging_dir, image, config)
+
+
+async def _run_runtime_build(key, image):
+    """Compile a copy of the runtime with the image's interpreter in a throwaway container"""
+    build_id, staging_dir = _new_staging_dir(key)
+    shutil.copytree(RUNTIME_DIR, os.path.join(staging_dir, "agent_runtime"),
+                    ignore=shutil.ignore_patterns("__pycache__"))
+
+    logger.info(f"Compiling runtime cache {key} for {image}")
+    config = {
+        "Image": image,
+        # The entry never changes once published, so the bytecode is trusted without checking the sources
+        "Cmd": ["python", "-m", "compileall", "-q", "--invalidation-mode", "unchecked-hash", "/deps/agent_runtime"],
+        "Env": ["PYTHONWARNINGS=ignore"],
+        "HostConfig": {"Binds": [f"{staging_dir}:/deps"]},
+    }
+    with tracing.span("runtime.compile", key=key, image=image):
+        return await _run_build_container(key, build_id, staging_dir, image, config)
+
+
+async def _run_build_container(key, build_id, staging_dir, image, config):
+    """Run the build container on the staging directory, then publish it as the key's entry"""
+    link_path = os.path.join(DEPS_CACHE_DIR, key)
+    cache_dir = os.path.join(DEPS_CACHE_DIR, f"{key}.{build_id}")
+    try:
+        exit_code, output = await build_host().client.run_container(config)
+        if exit_code != 0:
+            raise RuntimeError(f"Dependency build {key} failed ({exit_code}): {output[-500:]}")
+
+        with open(os.path.join(staging_dir, COMPLETE_MARKER), 'w') as f:
+            f.write(image + "\n")
+        os.rename(staging_dir, cache_dir)
+    except BaseException:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+    # Point the key at the new version in one step; an earlier entry may still be mounted, it is left alone
+    if os.path.isdir(link_path) and not os.path.islink(link_path):
+        os.rename(link_path, os.path.join(DEPS_CACHE_DIR, f".{key}.replaced.{build_id}"))
+    temp_link = os.path.join(DEPS_CACHE_DIR, f".{key}.link.{build_id}")
+    os.symlink(os.path.basename(cache_dir), temp_link)
+    os.replace(temp_link, link_path)
+
+    logger.info(f"Dependency cache {key} ready")
+    return cache_dir
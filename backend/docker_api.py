@@ -0,0 +1,319 @@
+# backend/docker_api.py
+
+import io
+import json
+import struct
+import asyncio
+import tarfile
+import logging
+from urllib.parse import quote, urlencode
+from config import DOCKER_SOCKET
+
+logger = logging.getLogger(__name__)
+
+# Stream ids used by the Engine API when multiplexing stdout/stderr (no TTY)
+STREAM_STDOUT = 1
+STREAM_STDERR = 2
+
+# Generous reader limit, agent output lines can be long
+READER_LIMIT = 2 ** 20
+
+
+class DockerAPIError(Exception):
+    """Error response from the Docker Engine API"""
+
+    def __init__(self, status, message):
+        super().__init__(f"Docker API error {status}: {message}")
+        self.status = status
+        self.message = message
+
+
+class AttachedStream:
+    """Hijacked attach connection: stdin writer plus demultiplexed stdout and stderr readers"""
+
+    def __init__(self, reader, writer):
+        self._reader = reader
+        self._writer = writer
+        self.stdout = asyncio.StreamReader(limit=READER_LIMIT)
+        self.stderr = asyncio.StreamReader(limit=READER_LIMIT)
+        self.closed = asyncio.Event()
+        self._pump_task = asyncio.create_task(self._pump())
+
+    async def _pump(self):
+        """Split the multiplexed stream into stdout and stderr as frames arrive"""
+        try:
+            while True:
+                header = await self._reader.readexactly(8)
+                stream_type, size = header[0], struct.unpack('>I', header[4:])[0]
+                payload = await self._reader.readexactly(size) if size else b""
+                if stream_type == STREAM_STDERR:
+                    self.stderr.feed_data(payload)
+                else:
+                    self.stdout.feed_data(payload)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.stdout.feed_eof()
+            self.stderr.feed_eof()
+            self.closed.set()
+
+    async def write(self, data):
+        self._writer.write(data)
+        await self._writer.drain()
+
+    async def close(self):
+        if not self._pump_task.done():
+            self._pump_task.cancel()
+            await asyncio.gather(self._pump_task, return_exceptions=True)
+        self._writer.close()
+
+
+class DockerClient:
+    """Minimal asyncio client for the Docker Engine API over a Unix socket or plain TCP
+
+    The endpoint is a socket path, unix:///path/to/docker.sock or tcp://host:port.
+    """
+
+    def __init__(self, endpoint=DOCKER_SOCKET):
+        self.endpoint = endpoint
+        if endpoint.startswith("tcp://"):
+            host, _, port = endpoint[len("tcp://"):].rstrip("/").rpartition(":")
+            self.address = (host, int(port))
+            self.socket_path = None
+        else:
+            self.address = None
+            self.socket_path = endpoint[len("unix://"):] if endpoint.startswith("unix://") else endpoint
+
+    @property
+    def is_local(self):
+        """Whether the daemon shares this machine's filesystem, so bind mounts of host paths work"""
+        return self.socket_path is not None
+
+    async def _open(self):
+        if self.address:
+            return await asyncio.open_connection(*self.address, limit=READER_LIMIT)
+        return await asyncio.open_unix_connection(self.socket_path, limit=READER_LIMIT)
+
+    async def _send(self, method, path, params=None, body=None, content_type="application/json", upgrade=False):
+        """Send one HTTP/1.1 request and return status, headers and the open connection"""
+        reader, writer = await self._open()
+
+        if params:
+            path = f"{path}?{urlencode(params)}"
+        if body is not None and not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+
+        lines = [f"{method} {path} HTTP/1.1", "Host: docker"]
+        if upgrade:
+            lines += ["Connection: Upgrade", "Upgrade: tcp"]
+        else:
+            lines.append("Connection: close")
+        if body is not None:
+            lines += [f"Content-Type: {content_type}", f"Content-Length: {len(body)}"]
+
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1') + (body or b""))
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            writer.close()
+            raise DockerAPIError(0, "Connection closed by daemon")
+        status = int(status_line.split()[1])
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode('latin-1').partition(":")
+            headers[key.strip().lower()] = value.strip()
+
+        return status, headers, reader, writer
+
+    async def _iter_body(self, headers, reader):
+        """Yield the response body as it arrives, handling chunked encoding"""
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size_line = await reader.readline()
+                size = int(size_line.split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    await reader.readline()
+                    return
+                yield await reader.readexactly(size)
+                await reader.readline()
+        elif "content-length" in headers:
+            length = int(headers["content-length"])
+            if length:
+                yield await reader.readexactly(length)
+        else:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    return
+                yield data
+
+    async def _request(self, method, path, params=None, body=None, content_type="application/json"):
+        """Perform a request and return status and decoded JSON (or raw text) body"""
+        status, headers, reader, writer = await self._send(method, path, params, body, content_type)
+        try:
+            data = b"".join([chunk async for chunk in self._iter_body(headers, reader)])
+        finally:
+            writer.close()
+
+        payload = None
+        if data:
+            try:
+                payload = json.loads(data)
+            except ValueError:
+                payload = data.decode('utf-8', errors='replace')
+
+        if status >= 400:
+            message = payload.get("message") if isinstance(payload, dict) else payload
+            raise DockerAPIError(status, message)
+        return status, payload
+
+    async def ping(self):
+        status, _ = await self._request("GET", "/_ping")
+        return status == 200
+
+    async def image_exists(self, image):
+        """Check whether an image is present on the daemon"""
+        try:
+            await self._request("GET", f"/images/{quote(image, safe='')}/json")
+            return True
+        except DockerAPIError as e:
+            if e.status == 404:
+                return False
+            raise
+
+    async def info(self):
+        """Return the daemon's system information (NCPU, MemTotal, ...)"""
+        _, payload = await self._request("GET", "/info")
+        return payload
+
+    async def inspect_image(self, image):
+        """Return the image inspect document"""
+        _, payload = await self._request("GET", f"/images/{quote(image, safe='')}/json")
+        return payload
+
+    async def create_container(self, config, name=None):
+        """Create a container and return its id"""
+        params = {"name": name} if name else None
+        _, payload = await self._request("POST", "/containers/create", params=params, body=config)
+        return payload["Id"]
+
+    async def attach(self, container_id):
+        """Attach to a container's stdio and return an AttachedStream"""
+        params = {"stream": 1, "stdin": 1, "stdout": 1, "stderr": 1}
+        status, headers, reader, writer = await self._send(
+            "POST", f"/containers/{container_id}/attach", params=params, upgrade=True
+        )
+        if status not in (101, 200):
+            body = b"".join([chunk async for chunk in self._iter_body(headers, reader)])
+            writer.close()
+            raise DockerAPIError(status, body.decode('utf-8', errors='replace'))
+        return AttachedStream(reader, writer)
+
+    async def start_container(self, container_id):
+        await self._request("POST", f"/containers/{container_id}/start")
+
+    async def wait_container(self, container_id):
+        """Block until the container exits and return its exit code"""
+        _, payload = await self._request("POST", f"/containers/{container_id}/wait")
+        return payload.get("StatusCode", -1)
+
+    async def remove_container(self, container_id, force=True):
+        """Remove a container, ignoring containers that are already gone"""
+        try:
+            await self._request("DELETE", f"/containers/{container_id}", params={"force": int(force)})
+        except DockerAPIError as e:
+            if e.status not in (404, 409):
+                raise
+
+    async def volume_exists(self, name):
+        try:
+            await self._request("GET", f"/volumes/{quote(name, safe='')}")
+            return True
+        except DockerAPIError as e:
+            if e.status == 404:
+                return False
+            raise
+
+    async def create_volume(self, name, labels=None):
+        await self._request("POST", "/volumes/create", body={"Name": name, "Labels": labels or {}})
+
+    async def remove_volume(self, name):
+        """Remove a volume, ignoring volumes that are already gone"""
+        try:
+            await self._request("DELETE", f"/volumes/{quote(name, safe='')}", params={"force": 1})
+        except DockerAPIError as e:
+            if e.status != 404:
+                raise
+
+    async def put_archive(self, container_id, path, data):
+        """Extract a tar archive into a path of a (possibly not started) container"""
+        await self._request(
+            "PUT", f"/containers/{container_id}/archive", params={"path": path},
+            body=data, content_type="application/x-tar"
+        )
+
+    async def tag_image(self, image, repository, tag):
+        await self._request("POST", f"/images/{quote(image, safe='')}/tag", params={"repo": repository, "tag": tag})
+
+    async def run_container(self, config, name=None):
+        """Run a container to completion and return its exit code and combined output"""
+        container_id = await self.create_container(config, name=name)
+        try:
+            stream = await self.attach(container_id)
+            try:
+                await self.start_container(container_id)
+                stdout, stderr = await asyncio.gather(stream.stdout.read(), stream.stderr.read())
+                exit_code = await self.wait_container(container_id)
+            finally:
+                await stream.close()
+        finally:
+            await self.remove_container(container_id)
+        return exit_code, (stdout + stderr).decode('utf-8', errors='replace')
+
+    async def build_image(self, context_dir, tag):
+        """Build an image from a directory and raise if the build reports an error"""
+        loop = asyncio.get_running_loop()
+        context = await loop.run_in_executor(None, tar_directory, context_dir)
+
+        status, headers, reader, writer = await self._send(
+            "POST", "/build", params={"t": tag, "rm": 1, "forcerm": 1},
+            body=context, content_type="application/x-tar"
+        )
+        try:
+            output = b"".join([chunk async for chunk in self._iter_body(headers, reader)])
+        finally:
+            writer.close()
+
+        if status >= 400:
+            raise DockerAPIError(status, output.decode('utf-8', errors='replace'))
+
+        # Build progress is a stream of JSON objects, errors are reported inline
+        for line in output.splitlines():
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            if "error" in message:
+                raise DockerAPIError(status, message["error"])
+        logger.info(f"Built image {tag}")
+
+
+def tar_directory(path):
+    """Pack a build context directory into an in-memory tar archive"""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w') as tar:
+        tar.add(path, arcname=".")
+    return buffer.getvalue()
+
+
+def tar_file(path, arcname):
+    """Pack a single file into an in-memory tar archive"""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w') as tar:
+        tar.add(path, arcname=arcname)
+    return buffer.getvalue()
@@ -0,0 +1,181 @@
+# backend/docker_hosts.py
+
+import os
+import time
+import asyncio
+import hashlib
+import logging
+import posixpath
+from config import DOCKER_HOSTS, CPU_PLACEMENT, HOST_RETRY_SECONDS, BACKEND_WORKERS
+from docker_api import DockerClient, tar_directory, tar_file
+from placement import CpuPlacer
+
+logger = logging.getLogger(__name__)
+
+# Content hashes of shipped directories, keyed by path and validated by file stats
+_tree_digests = {}
+
+
+def _tree_digest(path):
+    """Content hash of a file or directory tree, recomputed only when a file changed"""
+    files = []
+    if os.path.isdir(path):
+        for root, dirs, names in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+            for name in sorted(names):
+                if not name.endswith((".pyc", ".pyo")):
+                    files.append(os.path.join(root, name))
+    else:
+        files.append(path)
+
+    signature = [(f, os.stat(f).st_mtime_ns, os.stat(f).st_size) for f in files]
+    cached = _tree_digests.get(path)
+    if cached and cached[0] == signature:
+        return cached[1]
+
+    digest = hashlib.sha256()
+    for f in files:
+        digest.update(os.path.relpath(f, path).encode('utf-8') + b"\0")
+        with open(f, 'rb') as fh:
+            digest.update(hashlib.sha256(fh.read()).digest())
+    content_hash = digest.hexdigest()[:16]
+    _tree_digests[path] = (signature, content_hash)
+    return content_hash
+
+
+class DockerHost:
+    """One Docker daemon agents can run on, with its capacity and what it has cached
+
+    Local daemons see this machine's filesystem and get bind mounts. Remote
+    daemons get the same files shipped once into content-addressed named
+    volumes, so containers there start exactly like local ones.
+    """
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.client = DockerClient(endpoint)
+        self.name = endpoint
+        self.is_local = self.client.is_local
+        # CPUs and memory reported by the daemon, filled in by refresh()
+        self.ncpu = (os.cpu_count() or 1) if self.is_local else None
+        self.memory = None
+        # Local placement uses the real NUMA topology; remote hosts get theirs from /info
+        self.placer = CpuPlacer() if CPU_PLACEMENT and self.is_local else None
+        # Live containers on this host and the CPUs they are limited to
+        self.containers = 0
+        self.reserved_cpus = 0.0
+        # CPUs of requests that chose this host and are still getting their container
+        self.pending_cpus = 0.0
+        self.failed_until = 0.0
+        self.volumes = set()
+        self._pending_volumes = {}
+
+    async def refresh(self):
+        """Read the daemon's capacity; remote hosts get a single-node placer sized to it"""
+        info = await self.client.info()
+        self.ncpu = info.get("NCPU") or self.ncpu or 1
+        self.memory = info.get("MemTotal") or None
+        if CPU_PLACEMENT and not self.is_local and self.placer is None:
+            self.placer = CpuPlacer({0: (list(range(self.ncpu)), self.memory)})
+
+    def healthy(self):
+        return time.monotonic() >= self.failed_until
+
+    def mark_failed(self, error):
+        logger.error(f"Docker host {self.name} failed, skipping it for {HOST_RETRY_SECONDS}s: {str(error)}")
+        self.failed_until = time.monotonic() + HOST_RETRY_SECONDS
+
+    def free_cpus(self):
+        # Every backend worker places onto its own share of the host
+        return (self.ncpu or 1) / BACKEND_WORKERS - self.reserved_cpus - self.pending_cpus
+
+    def add_container(self, cpus):
+        self.containers += 1
+        self.reserved_cpus += cpus
+
+    def remove_container(self, cpus):
+        self.containers -= 1
+        self.reserved_cpus = max(0.0, self.reserved_cpus - cpus)
+
+    async def mount(self, source, target, image):
+        """Bind spec making a host file or directory available read-only at target
+
+        Remote hosts receive the content once in a volume named after its hash;
+        `image` is an image present on the host, used for the upload container.
+        """
+        if self.is_local:
+            return f"{source}:{target}:ro"
+
+        is_file = os.path.isfile(source)
+        # A file is shipped under the name it has at target, and mounted through its directory
+        arcname = posixpath.basename(target) if is_file else None
+        volume = f"agent-files-{_tree_digest(source)}"
+        if arcname:
+            volume += f"-{hashlib.sha256(arcname.encode('utf-8')).hexdigest()[:8]}"
+        if volume not in self.volumes:
+            upload = self._pending_volumes.get(volume)
+            if upload is None:
+                upload = asyncio.ensure_future(self._upload_volume(volume, source, arcname, image))
+                self._pending_volumes[volume] = upload
+                upload.add_done_callback(lambda _: self._pending_volumes.pop(volume, None))
+            await asyncio.shield(upload)
+
+        # The volume holds just that file, so the directory of target must be dedicated to it
+        return f"{volume}:{posixpath.dirname(target) if is_file else target}:ro"
+
+    def shared_mount(self, path):
+        """Writable bind spec for a directory all containers of the host share, at the same path"""
+        if self.is_local:
+            return f"{path}:{path}"
+        # Shared by the containers of a remote host, not with this machine
+        return f"agent-shared-{hashlib.sha256(path.encode('utf-8')).hexdigest()[:16]}:{path}"
+
+    async def _upload_volume(self, volume, source, arcname, image):
+        if await self.client.volume_exists(volume):
+            self.volumes.add(volume)
+            return
+
+        logger.info(f"Shipping {source} to {self.name} as volume {volume}")
+        loop = asyncio.get_running_loop()
+        if arcname:
+            data = await loop.run_in_executor(None, tar_file, source, arcname)
+        else:
+            data = await loop.run_in_executor(None, tar_directory, source)
+
+        await self.client.create_volume(volume, labels={"agent-files": source})
+        try:
+            # The archive is extracted through a container that is never started
+            helper = await self.client.create_container({
+                "Image": image,
+                "Cmd": ["true"],
+                "HostConfig": {"Binds": [f"{volume}:/target"]},
+            })
+            try:
+                await self.client.put_archive(helper, "/target", data)
+            finally:
+                await self.client.remove_container(helper)
+        except BaseException:
+            await self.client.remove_volume(volume)
+            raise
+        self.volumes.add(volume)
+
+
+# Every daemon agents may be placed on, in DOCKER_HOSTS order
+docker_hosts = [DockerHost(endpoint) for endpoint in DOCKER_HOSTS]
+
+
+def build_host():
+    """Daemon used for dependency builds, which write into this machine's filesystem"""
+    for host in docker_hosts:
+        if host.is_local:
+            return host
+    raise RuntimeError("Dependency builds need a Docker daemon on this machine (a unix:// endpoint in DOCKER_HOSTS)")
+
+
+async def refresh_docker_hosts():
+    """Read the capacity of every host, marking unreachable ones as failed"""
+    for host in docker_hosts:
+        try:
+            await host.refresh()
+        except Exception as e:
+            host.mark_failed(e)
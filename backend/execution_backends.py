@@ -0,0 +1,257 @@
+# backend/execution_backends.py
+
+import os
+import asyncio
+import hashlib
+import tempfile
+import logging
+from config import AGENTS_DIR, ENTRYPOINT_CACHE_DIR, EXECUTION_BACKEND
+from agent_settings import agent_settings
+from collections import OrderedDict
+from docker_api import DockerAPIError
+from docker_hosts import docker_hosts, build_host, refresh_docker_hosts
+from container_pool import get_container_pool, close_container_pools, idle_containers
+from dependency_cache import ensure_dependencies, ensure_runtime_bytecode
+from image_builder import ensure_agent_image, agent_image_tag, has_agent_image
+from local_backend import fork_server
+from sandbox_backend import launch_sandbox
+from resources import agent_resources
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Cached entrypoint per agent file, keyed by path and validated by mtime and size
+agent_entrypoints = {}
+
+# Session keys remembered for host stickiness
+STICKY_HOSTS_MAX = 4096
+
+
+# Content-addressed copy of an agent file, run by every backend
+def agent_entrypoint(agent_name):
+    """Return the cached entrypoint for the agent, rewritten only when agent.py changed"""
+    agent_path = os.path.join(AGENTS_DIR, agent_name, "agent.py")
+    st = os.stat(agent_path)
+
+    cached = agent_entrypoints.get(agent_path)
+    if cached and cached[0] == (st.st_mtime_ns, st.st_size):
+        return cached[1]
+
+    with tracing.span("agent.entrypoint", agent=agent_name):
+        with open(agent_path, 'rb') as f:
+            source = f.read()
+        digest = hashlib.sha256(source).hexdigest()[:16]
+        entrypoint_path = os.path.join(ENTRYPOINT_CACHE_DIR, f"{agent_name}-{digest}.py")
+
+        if not os.path.exists(entrypoint_path):
+            os.makedirs(ENTRYPOINT_CACHE_DIR, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(suffix='.py', prefix='agent_', dir=ENTRYPOINT_CACHE_DIR)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(source)
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, entrypoint_path)
+
+    agent_entrypoints[agent_path] = ((st.st_mtime_ns, st.st_size), entrypoint_path)
+    return entrypoint_path
+
+
+class ExecutionBackend:
+    """Where and how agent workers run
+
+    A worker is an AgentWorker serving the runtime's job protocol. version()
+    identifies what a worker of the agent currently runs, so sessions holding
+    a worker of an older version are replaced. A dedicated worker belongs to
+    a session until released; others go back to the backend after the turn.
+    `affinity` names the session a worker is for, so a backend can keep a
+    session's workers in one place.
+    """
+
+    name = None
+
+    async def warm(self, agent_name):
+        """Prepare the agent ahead of its first request"""
+
+    async def version(self, agent_name):
+        raise NotImplementedError
+
+    async def acquire(self, agent_name, version, dedicated, affinity=None):
+        raise NotImplementedError
+
+    async def release(self, worker):
+        """Stop a worker that is no longer needed"""
+        await worker.destroy()
+
+    async def close(self):
+        """Release everything held by the backend, used on shutdown"""
+
+
+class DockerBackend(ExecutionBackend):
+    """Agents in containers built from their Dockerfile, served from warm pools on one or more hosts"""
+
+    name = "docker"
+
+    def __init__(self):
+        # Host each session last ran on, least recently used first
+        self.session_hosts = OrderedDict()
+        self._hosts_ready = None
+
+    async def _refresh_hosts(self):
+        # Capacity of every host is read once, on first use
+        if self._hosts_ready is None:
+            self._hosts_ready = asyncio.ensure_future(refresh_docker_hosts())
+        await asyncio.shield(self._hosts_ready)
+
+    def rank_hosts(self, agent_name, image, cpus, affinity=None):
+        """Healthy hosts, best first: a warm container waiting, room for the
+        container, the session's previous host, the image already present,
+        then the most free CPU capacity"""
+        hosts = [host for host in docker_hosts if host.healthy()] or list(docker_hosts)
+        sticky = self.session_hosts.get(affinity)
+
+        def score(host):
+            return (
+                idle_containers(host, agent_name, image) > 0,
+                host.free_cpus() >= cpus,
+                host.name == sticky,
+                has_agent_image(host, image),
+                host.free_cpus() / (host.ncpu or 1),
+            )
+        return sorted(hosts, key=score, reverse=True)
+
+    async def _dependencies(self, agent_name, image):
+        # Dependencies are built once on the local build host and shipped from there
+        await ensure_agent_image(agent_name, build_host())
+        return await asyncio.gather(ensure_dependencies(agent_name, image), ensure_runtime_bytecode(image))
+
+    async def _pool(self, host, agent_name, image, deps_dirs):
+        deps_dir, runtime_dir = deps_dirs
+        await ensure_agent_image(agent_name, host)
+        return get_container_pool(
+            host, agent_name, image, deps_dir, agent_entrypoint(agent_name), agent_resources(agent_name),
+            runtime_dir=runtime_dir,
+        )
+
+    async def warm(self, agent_name):
+        await self._refresh_hosts()
+        image = agent_image_tag(agent_name)
+        deps_dirs = await self._dependencies(agent_name, image)
+        host = self.rank_hosts(agent_name, image, agent_resources(agent_name).cpus or 1.0)[0]
+        (await self._pool(host, agent_name, image, deps_dirs)).schedule_refill()
+
+    async def version(self, agent_name):
+        return agent_image_tag(agent_name)
+
+    async def acquire(self, agent_name, version, dedicated, affinity=None):
+        await self._refresh_hosts()
+        deps_dirs = await self._dependencies(agent_name, version)
+        cpus = agent_resources(agent_name).cpus or 1.0
+
+        error = None
+        for host in self.rank_hosts(agent_name, version, cpus, affinity):
+            # Counted right away so concurrent requests spread over the hosts
+            host.pending_cpus += cpus
+            try:
+                # Take a warm container from the agent's pool on that host; it is already
+                # running and blocked on stdin, so only the job itself has to be handed over
+                pool = await self._pool(host, agent_name, version, deps_dirs)
+                container = await pool.acquire()
+            except (OSError, DockerAPIError) as e:
+                # Only an unreachable daemon moves on to the next host
+                if isinstance(e, DockerAPIError) and e.status != 0:
+                    raise
+                host.mark_failed(e)
+                error = e
+                continue
+            finally:
+                host.pending_cpus -= cpus
+
+            if dedicated:
+                # The container now belongs to the session, not the pool
+                await pool.detach(container)
+            if affinity:
+                self.session_hosts[affinity] = host.name
+                self.session_hosts.move_to_end(affinity)
+                while len(self.session_hosts) > STICKY_HOSTS_MAX:
+                    self.session_hosts.popitem(last=False)
+            return container
+
+        raise RuntimeError(f"No Docker host could start agent {agent_name}: {str(error)}")
+
+    async def release(self, worker):
+        if worker.pool:
+            await worker.pool.release(worker)
+        else:
+            await worker.destroy()
+
+    async def close(self):
+        await close_container_pools()
+
+
+class LocalBackend(ExecutionBackend):
+    """Trusted agents forked straight from the fork server, without isolation"""
+
+    name = "local"
+
+    async def warm(self, agent_name):
+        await fork_server.ensure_started()
+
+    async def version(self, agent_name):
+        # Workers run the cached copy, so a changed agent.py means a new worker
+        return agent_entrypoint(agent_name)
+
+    async def acquire(self, agent_name, version, dedicated, affinity=None):
+        return await fork_server.spawn(agent_name, version)
+
+    async def close(self):
+        await fork_server.close()
+
+
+class SandboxBackend(ExecutionBackend):
+    """Agents in fresh Linux namespaces with a read-only root and cgroup limits"""
+
+    name = "sandbox"
+
+    async def version(self, agent_name):
+        return agent_entrypoint(agent_name)
+
+    async def acquire(self, agent_name, version, dedicated, affinity=None):
+        return await launch_sandbox(agent_name, version, agent_resources(agent_name))
+
+
+# Registered backends by name, as used in agent.json and EXECUTION_BACKEND
+execution_backends = {backend.name: backend for backend in (DockerBackend(), LocalBackend(), SandboxBackend())}
+
+
+def backend_for_agent(agent_name):
+    """Pick the agent's backend from its agent.json, falling back to EXECUTION_BACKEND"""
+    name = agent_settings(agent_name).get("backend") or EXECUTION_BACKEND
+    if name == "auto":
+        has_dockerfile = os.path.exists(os.path.join(AGENTS_DIR, agent_name, "Dockerfile"))
+        name = "docker" if has_dockerfile else "local"
+
+    backend = execution_backends.get(name)
+    if backend is None:
+        raise ValueError(f"Unknown execution backend for agent {agent_name}: {name}")
+    return backend
+
+
+async def warm_execution_backends():
+    """Warm every agent's backend in the background so server startup is not held up"""
+    if not os.path.isdir(AGENTS_DIR):
+        return
+
+    for agent_name in sorted(os.listdir(AGENTS_DIR)):
+        if os.path.exists(os.path.join(AGENTS_DIR, agent_name, "agent.py")):
+            asyncio.create_task(warm_agent(agent_name))
+
+
+async def warm_agent(agent_name):
+    try:
+        await backend_for_agent(agent_name).warm(agent_name)
+    except Exception as e:
+        logger.error(f"Error warming agent {agent_name}: {str(e)}")
+
+
+async def close_execution_backends():
+    for backend in execution_backends.values():
+        await backend.close()
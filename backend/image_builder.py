@@ -0,0 +1,137 @@
+# backend/image_builder.py
+
+import os
+import asyncio
+import hashlib
+import logging
+from config import AGENTS_DIR, IMAGE_BUILD_WORKERS
+from docker_hosts import docker_hosts, build_host
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Files that never influence the image
+IGNORED_DIRS = {"__pycache__", ".git"}
+IGNORED_SUFFIXES = (".pyc", ".pyo")
+
+# (host, tag) pairs confirmed to exist
+known_images = set()
+
+# Builds in flight keyed by (host, tag), so concurrent requests wait on the same build
+pending_builds = {}
+
+# Cached context hashes keyed by agent, invalidated when any file stat changes
+context_hashes = {}
+
+# Bounds how many agent images are built at the same time
+_build_slots = None
+
+
+def _context_files(agent_dir):
+    """Sorted relative paths of the files in an agent build context"""
+    files = []
+    for root, dirs, names in os.walk(agent_dir):
+        dirs[:] = sorted(d for d in dirs if d not in IGNORED_DIRS)
+        for name in names:
+            if not name.endswith(IGNORED_SUFFIXES):
+                files.append(os.path.relpath(os.path.join(root, name), agent_dir))
+    return sorted(files)
+
+
+def agent_context_hash(agent_name):
+    """Content hash of agents/<name>/, recomputed only when a file changed on disk"""
+    agent_dir = os.path.join(AGENTS_DIR, agent_name)
+    files = _context_files(agent_dir)
+
+    signature = []
+    for rel_path in files:
+        st = os.stat(os.path.join(agent_dir, rel_path))
+        signature.append((rel_path, st.st_mtime_ns, st.st_size))
+
+    cached = context_hashes.get(agent_name)
+    if cached and cached[0] == signature:
+        return cached[1]
+
+    digest = hashlib.sha256()
+    for rel_path in files:
+        digest.update(rel_path.encode('utf-8') + b"\0")
+        with open(os.path.join(agent_dir, rel_path), 'rb') as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+
+    content_hash = digest.hexdigest()[:16]
+    context_hashes[agent_name] = (signature, content_hash)
+    return content_hash
+
+
+def agent_image_tag(agent_name):
+    """Image tag for the current contents of an agent directory"""
+    return f"agent-{agent_name}:{agent_context_hash(agent_name)}"
+
+
+def has_agent_image(host, image):
+    """Whether the image is known to be on the host, without asking the daemon"""
+    return (host.name, image) in known_images
+
+
+async def ensure_agent_image(agent_name, host=None):
+    """Return the image for the agent's current contents, building it on the host if needed"""
+    host = host or build_host()
+    image = agent_image_tag(agent_name)
+    key = (host.name, image)
+    if key in known_images:
+        return image
+
+    build = pending_builds.get(key)
+    if build is None:
+        with tracing.span("image.check", image=image, host=host.name):
+            exists = await host.client.image_exists(image)
+        if exists:
+            known_images.add(key)
+            return image
+
+        # Re-check, another request may have started the build while we waited
+        build = pending_builds.get(key)
+        if build is None:
+            build = asyncio.ensure_future(_build_image(agent_name, image, host))
+            pending_builds[key] = build
+            build.add_done_callback(lambda _: pending_builds.pop(key, None))
+
+    # Shield the shared build from callers that go away while waiting
+    await asyncio.shield(build)
+    return image
+
+
+async def _build_image(agent_name, image, host):
+    global _build_slots
+    if _build_slots is None:
+        _build_slots = asyncio.Semaphore(max(IMAGE_BUILD_WORKERS, 1))
+
+    async with _build_slots:
+        logger.info(f"Building Docker image for agent: {agent_name} ({image}) on {host.name}")
+        with tracing.span("image.build", image=image, host=host.name):
+            await host.client.build_image(os.path.join(AGENTS_DIR, agent_name), image)
+
+        # Keep :latest pointing at the current build for scripts and manual runs
+        repository = image.rsplit(":", 1)[0]
+        await host.client.tag_image(image, repository, "latest")
+
+    known_images.add((host.name, image))
+
+
+async def prebuild_agent_images():
+    """Build the image of every Docker agent on every host, bounded by the build worker pool"""
+    if not os.path.isdir(AGENTS_DIR):
+        return
+
+    builds = [
+        (name, host) for name in sorted(os.listdir(AGENTS_DIR))
+        if os.path.exists(os.path.join(AGENTS_DIR, name, "Dockerfile"))
+        for host in docker_hosts
+    ]
+    results = await asyncio.gather(
+        *[ensure_agent_image(name, host) for name, host in builds],
+        return_exceptions=True
+    )
+    for (name, host), result in zip(builds, results):
+        if isinstance(result, Exception):
+            logger.error(f"Error prebuilding image for agent {name} on {host.name}: {str(result)}")
@@ -0,0 +1,218 @@
+# backend/llm_gateway.py
+
+import asyncio
+import hashlib
+import logging
+import httpx
+from config import (
+    API_BASE_URL, AUTH_TOKEN, GATEWAY_HTTP2, GATEWAY_MAX_CONNECTIONS, GATEWAY_KEEPALIVE_CONNECTIONS, GATEWAY_TIMEOUT
+)
+from metrics import registry, Gauge, Counter
+
+# HTTP/2 needs the optional h2 package; without it the pool speaks HTTP/1.1 keep-alive
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Headers that describe one hop, never forwarded in either direction
+HOP_HEADERS = {
+    "host", "connection", "keep-alive", "proxy-connection", "transfer-encoding", "te", "trailer",
+    "upgrade", "content-length", "accept-encoding", "content-encoding",
+}
+
+# Trace context differs per caller; forwarded, but not part of what makes requests identical
+TRACE_HEADERS = {"traceparent", "tracestate"}
+
+
+class SharedResponse:
+    """One upstream response, replayed to every caller that sent the same request
+
+    Chunks are kept until the response is complete, so a caller joining late
+    still gets the whole body from the start.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.status = None
+        self.headers = {}
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.task = None
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait_started(self):
+        """Wait for the upstream status and headers"""
+        while self.status is None and not self.done:
+            await self._changed.wait()
+        if self.status is None:
+            raise self.error
+
+    async def iter_chunks(self):
+        index = 0
+        while True:
+            changed = self._changed
+            while index < len(self.chunks):
+                yield self.chunks[index]
+                index += 1
+            if self.done:
+                if self.error:
+                    raise self.error
+                return
+            await changed.wait()
+
+
+class LLMGateway:
+    """OpenAI-compatible proxy in front of API_BASE_URL
+
+    Requests go upstream over one pooled keep-alive (HTTP/2 when available)
+    client instead of a fresh connection per agent run. Requests that are
+    byte-identical (method, path, headers and body, trace context aside) while
+    one is in flight share that upstream response, streamed to all of them.
+    """
+
+    def __init__(self, base_url=API_BASE_URL, auth_token=AUTH_TOKEN):
+        self.base_url = (base_url or "").rstrip("/")
+        self.auth_token = auth_token
+        self.in_flight = {}
+        self.requests = 0
+        self.upstream_requests = 0
+        self.coalesced = 0
+        self.upstream_errors = 0
+        self.bytes_sent = 0
+        self._client = None
+
+    @property
+    def client(self):
+        # Created on first use, inside the running event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=GATEWAY_HTTP2 and HTTP2_AVAILABLE,
+                limits=httpx.Limits(
+                    max_connections=GATEWAY_MAX_CONNECTIONS,
+                    max_keepalive_connections=GATEWAY_KEEPALIVE_CONNECTIONS,
+                ),
+                timeout=httpx.Timeout(GATEWAY_TIMEOUT, connect=10.0),
+            )
+        return self._client
+
+    async def forward(self, method, path, query, headers, body):
+        """Send a request upstream, or join an identical one in flight; returns a started SharedResponse"""
+        if not self.base_url:
+            raise RuntimeError("API_BASE_URL is not set")
+
+        headers = {k.lower(): v for k, v in headers.items() if k.lower() not in HOP_HEADERS}
+        # Callers authenticate with the gateway key, upstream gets the real credential
+        headers["authorization"] = f"Bearer {self.auth_token}"
+        digest = hashlib.sha256()
+        for part in (method, path, query, *sorted(f"{k}:{v}" for k, v in headers.items() if k not in TRACE_HEADERS)):
+            digest.update(part.encode('utf-8') + b"\0")
+        digest.update(body)
+        key = digest.hexdigest()
+
+        self.requests += 1
+        shared = self.in_flight.get(key)
+        if shared is not None:
+            self.coalesced += 1
+        else:
+            shared = SharedResponse(key)
+            self.in_flight[key] = shared
+            url = f"{self.base_url}/{path.lstrip('/')}" + (f"?{query}" if query else "")
+            shared.task = asyncio.create_task(self._pump(shared, method, url, headers, body))
+
+        shared.subscribers += 1
+        try:
+            await shared.wait_started()
+        except BaseException:
+            self._unsubscribe(shared)
+            raise
+        return shared
+
+    async def _pump(self, shared, method, url, headers, body):
+        self.upstream_requests += 1
+        try:
+            request = self.client.build_request(method, url, headers=headers, content=body)
+            response = await self.client.send(request, stream=True)
+            try:
+                shared.status = response.status_code
+                shared.headers = {k: v for k, v in response.headers.items() if k.lower() not in HOP_HEADERS}
+                shared._notify()
+                async for chunk in response.aiter_bytes():
+                    shared.chunks.append(chunk)
+                    shared._notify()
+            finally:
+                await response.aclose()
+        except BaseException as e:
+            self.upstream_errors += 1
+            if not isinstance(e, asyncio.CancelledError):
+                logger.error(f"LLM gateway upstream error for {url}: {str(e)}")
+            shared.error = e if isinstance(e, Exception) else RuntimeError("Upstream request cancelled")
+        finally:
+            shared.done = True
+            # Later identical requests go upstream again
+            if self.in_flight.get(shared.key) is shared:
+                del self.in_flight[shared.key]
+            shared._notify()
+
+    def _unsubscribe(self, shared):
+        shared.subscribers -= 1
+        # Nobody is reading anymore, stop paying for the upstream stream
+        if shared.subscribers <= 0 and not shared.done and shared.task:
+            shared.task.cancel()
+
+    async def relay(self, shared):
+        """Body of one caller's response"""
+        try:
+            async for chunk in shared.iter_chunks():
+                self.bytes_sent += len(chunk)
+                yield chunk
+        finally:
+            self._unsubscribe(shared)
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "upstream_requests": self.upstream_requests,
+            "coalesced": self.coalesced,
+            "in_flight": len(self.in_flight),
+            "upstream_errors": self.upstream_errors,
+            "bytes_sent": self.bytes_sent,
+            "http2": GATEWAY_HTTP2 and HTTP2_AVAILABLE,
+        }
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# Gateway shared by every agent
+llm_gateway = LLMGateway()
+
+
+# Gateway counters as seen at scrape time
+@registry.collector
+def gateway_metrics():
+    metrics = []
+    for name, help in (
+        ("requests", "Requests received by the LLM gateway"),
+        ("upstream_requests", "Requests the LLM gateway sent upstream"),
+        ("coalesced", "Requests served from an identical request in flight"),
+        ("upstream_errors", "Upstream requests that failed"),
+        ("bytes_sent", "Response bytes relayed to callers"),
+    ):
+        counter = Counter(f"llm_gateway_{name}_total", help)
+        counter.inc(getattr(llm_gateway, name))
+        metrics.append(counter)
+    in_flight = Gauge("llm_gateway_in_flight", "Distinct upstream requests in flight")
+    in_flight.set(len(llm_gateway.in_flight))
+    return metrics + [in_flight]
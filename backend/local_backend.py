@@ -0,0 +1,176 @@
+# backend/local_backend.py
+
+import os
+import sys
+import json
+import signal
+import socket
+import asyncio
+import logging
+from config import FORK_SERVER_SOCKET, READY_TIMEOUT
+from agent_worker import AgentWorker
+from agent_runtime.protocol import SERVER_READY
+
+logger = logging.getLogger(__name__)
+
+# Directory containing the agent_runtime package
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Generous reader limit, agent output lines can be long
+READER_LIMIT = 2 ** 20
+
+
+# Function to build the environment of the fork server and the workers it forks
+def worker_environment():
+    """Only what the runtime needs; TOKEN_SECRET, AUTH_TOKEN and other backend settings stay out"""
+    return {
+        "PATH": os.environ.get("PATH", "/usr/local/bin:/usr/bin:/bin"),
+        "HOME": os.environ.get("HOME", "/tmp"),
+        "PYTHONPATH": os.pathsep.join(filter(None, [BACKEND_DIR, os.environ.get("PYTHONPATH")])),
+        "PYTHONWARNINGS": "ignore",
+    }
+
+
+class LocalWorker(AgentWorker):
+    """An agent runtime forked from the fork server, talking over pipes"""
+
+    def __init__(self, name, pid, stdin_transport, stdout, stderr):
+        super().__init__(name)
+        self.pid = pid
+        self._stdin = stdin_transport
+        self.stdout = stdout
+        self.stderr = stderr
+
+    def is_alive(self):
+        # The worker's end of stdout closes when it exits
+        return not self.stdout.at_eof()
+
+    async def write(self, data):
+        if self._stdin.is_closing():
+            raise ConnectionError(f"Worker {self.name} stdin is closed")
+        self._stdin.write(data)
+
+    async def destroy(self):
+        """Kill the worker process"""
+        try:
+            # An exited worker's pid may already belong to another process
+            if self.is_alive():
+                os.kill(self.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        finally:
+            self._stdin.close()
+
+
+class ForkServer:
+    """Long-lived process that imports the runtime once and forks a worker per request"""
+
+    def __init__(self, socket_path=FORK_SERVER_SOCKET):
+        self.socket_path = socket_path
+        self.process = None
+        # Created on first use, inside the running event loop
+        self._lock = None
+
+    async def ensure_started(self):
+        """Start the fork server unless it is already running"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self.process is not None and self.process.returncode is None:
+                return
+
+            logger.info(f"Starting agent fork server on {self.socket_path}")
+            self.process = await asyncio.create_subprocess_exec(
+                sys.executable, "-u", "-m", "agent_runtime.fork_server", self.socket_path,
+                # The server exits when its stdin closes, i.e. when the backend goes away
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                env=worker_environment(),
+                # Keep terminal signals meant for the backend away from the workers
+                start_new_session=True,
+            )
+
+            try:
+                line_bytes = await asyncio.wait_for(self.process.stdout.readline(), READY_TIMEOUT)
+            except asyncio.TimeoutError:
+                line_bytes = b""
+            if line_bytes.decode('utf-8').strip() != SERVER_READY:
+                self.process.kill()
+                await self.process.wait()
+                raise RuntimeError("Agent fork server failed to start")
+
+    async def spawn(self, agent_name, agent_path):
+        """Fork a worker for the agent and return it once it reported READY"""
+        await self.ensure_started()
+        loop = asyncio.get_running_loop()
+
+        stdin_r, stdin_w = os.pipe()
+        stdout_r, stdout_w = os.pipe()
+        stderr_r, stderr_w = os.pipe()
+        try:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            with sock:
+                sock.setblocking(False)
+                await loop.sock_connect(sock, self.socket_path)
+                request = json.dumps({"agent_path": agent_path}).encode('utf-8')
+                await loop.run_in_executor(None, socket.send_fds, sock, [request], [stdin_r, stdout_w, stderr_w])
+                reply = b""
+                while not reply.endswith(b"\n"):
+                    data = await loop.sock_recv(sock, 4096)
+                    if not data:
+                        break
+                    reply += data
+        except BaseException:
+            for fd in (stdin_w, stdout_r, stderr_r):
+                os.close(fd)
+            raise
+        finally:
+            # The worker holds its own copies now
+            for fd in (stdin_r, stdout_w, stderr_w):
+                os.close(fd)
+
+        # From here on the pipe ends are owned by file objects
+        stdin_file = os.fdopen(stdin_w, 'wb', 0)
+        stdout_file = os.fdopen(stdout_r, 'rb', 0)
+        stderr_file = os.fdopen(stderr_r, 'rb', 0)
+        try:
+            result = json.loads(reply or b"{}")
+            if "pid" not in result:
+                raise RuntimeError(f"Fork server could not start {agent_name}: {result.get('error', 'no reply')}")
+
+            stdin_transport, _ = await loop.connect_write_pipe(asyncio.BaseProtocol, stdin_file)
+            stdout = await self._reader(loop, stdout_file)
+            stderr = await self._reader(loop, stderr_file)
+        except BaseException:
+            for pipe_file in (stdin_file, stdout_file, stderr_file):
+                pipe_file.close()
+            raise
+
+        worker = LocalWorker(f"local-{agent_name}-{result['pid']}", result["pid"], stdin_transport, stdout, stderr)
+        try:
+            await worker.wait_until_ready()
+        except BaseException:
+            await worker.destroy()
+            raise
+        return worker
+
+    @staticmethod
+    async def _reader(loop, pipe_file):
+        reader = asyncio.StreamReader(limit=READER_LIMIT)
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe_file)
+        return reader
+
+    async def close(self):
+        """Stop the fork server; workers still serving sessions keep running until destroyed"""
+        if self.process is None or self.process.returncode is not None:
+            return
+        self.process.stdin.close()
+        try:
+            await asyncio.wait_for(self.process.wait(), 5)
+        except asyncio.TimeoutError:
+            self.process.kill()
+            await self.process.wait()
+
+
+# Shared fork server for agents without a Dockerfile
+fork_server = ForkServer()
@@ -0,0 +1,241 @@
+# backend/metrics.py
+
+import bisect
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Exposition format version understood by every Prometheus scraper
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# Latency buckets in seconds, from a warm worker handoff to a cold image build
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+# Streaming rate buckets in tokens per second
+RATE_BUCKETS = (1, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs):
+    pairs = list(pairs)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A metric family: one series per combination of label values
+
+    Recording is a dict lookup and an addition, done on the event loop
+    without locks; the text exposition is only built when scraped.
+    """
+
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.series = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self):
+        lines = self.header()
+        for key, value in self.series.items():
+            lines.append(f"{self.name}{_labels(zip(self.labelnames, key))} {_number(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self.series[key] = self.series.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        self.series[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self.series[key] = self.series.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        series = self.series.get(key)
+        if series is None:
+            # Per-bucket counts (the last one is +Inf), sum and count
+            series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = self.header()
+        bounds = self.buckets + (float("inf"),)
+        for key, (counts, total, count) in self.series.items():
+            pairs = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_labels(pairs + [('le', _number(float(bound)))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(pairs)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(pairs)} {count}")
+        return lines
+
+
+class Registry:
+    """Metrics of this process, plus collectors that report state owned elsewhere
+
+    A collector is called at scrape time and returns metrics (usually gauges)
+    filled from a live structure, e.g. the session map or the scheduler, so
+    nothing has to be kept in sync on the hot path.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()):
+        return self.register(Gauge(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def collector(self, collect):
+        """Register a function returning a list of metrics, called on every scrape"""
+        self.collectors.append(collect)
+        return collect
+
+    def render(self):
+        """Text exposition of every metric"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collect in self.collectors:
+            try:
+                for metric in collect():
+                    lines.extend(metric.render())
+            except Exception as e:
+                # A failing collector must not take the whole scrape down
+                logger.error(f"Metrics collector {collect.__name__} failed: {str(e)}")
+        lines.append("")
+        return "\n".join(lines)
+
+
+# Registry served on /metrics
+registry = Registry()
+
+# Agent runs, labeled by agent name and execution backend
+agent_start_seconds = registry.histogram(
+    "agent_start_seconds",
+    "Time from request to job dispatched to a worker, by whether a live session was reused",
+    ("agent", "backend", "session"),
+)
+agent_worker_acquire_seconds = registry.histogram(
+    "agent_worker_acquire_seconds",
+    "Time to take a worker from the backend (a warm pool hit or a cold start)",
+    ("agent", "backend"),
+)
+agent_start_failures = registry.counter(
+    "agent_start_failures_total",
+    "Runs that failed before the job reached a worker",
+    ("agent", "backend"),
+)
+agent_first_token_seconds = registry.histogram(
+    "agent_time_to_first_token_seconds",
+    "Time from request to the first streamed token",
+    ("agent", "backend"),
+)
+agent_turn_seconds = registry.histogram(
+    "agent_turn_seconds",
+    "Duration of agent turns by outcome: complete, error, budget or disconnected",
+    ("agent", "backend", "outcome"),
+)
+agent_tokens_per_second = registry.histogram(
+    "agent_tokens_per_second",
+    "Completion tokens per second, from the first streamed token to the end of the turn",
+    ("agent", "backend"),
+    buckets=RATE_BUCKETS,
+)
+agent_prompt_tokens = registry.counter(
+    "agent_prompt_tokens_total",
+    "Prompt tokens sent to agents",
+    ("agent", "backend"),
+)
+agent_completion_tokens = registry.counter(
+    "agent_completion_tokens_total",
+    "Completion tokens streamed by agents",
+    ("agent", "backend"),
+)
+
+# Sessions
+sessions_reaped = registry.counter(
+    "agent_sessions_reaped_total",
+    "Sessions torn down in the background: idle past their TTL, evicted over the cap or moved to another process",
+    ("reason",),
+)
+
+# Docker containers, labeled by Docker host
+container_start_seconds = registry.histogram(
+    "docker_container_start_seconds",
+    "Time from container create to the runtime reporting READY",
+    ("host",),
+)
+container_attach_seconds = registry.histogram(
+    "docker_attach_seconds",
+    "Time to attach to a created container's output streams",
+    ("host",),
+)
+
+# Login and admission
+logins = registry.counter(
+    "login_attempts_total",
+    "Login attempts by result",
+    ("result",),
+)
+login_seconds = registry.histogram(
+    "login_seconds",
+    "Time to handle a login request",
+)
+queue_wait_seconds = registry.histogram(
+    "scheduler_queue_wait_seconds",
+    "Time requests waited for a run slot",
+)
@@ -0,0 +1,198 @@
+# backend/placement.py
+
+import os
+import re
+import glob
+import math
+import fcntl
+import logging
+import tempfile
+from collections import defaultdict
+from config import PLACEMENT_OVERCOMMIT, BACKEND_WORKERS
+
+logger = logging.getLogger(__name__)
+
+NODE_DIR = "/sys/devices/system/node"
+
+# Slot of this backend worker among BACKEND_WORKERS, and the lock file descriptor holding it
+_worker_slot = None
+
+
+def parse_cpulist(text):
+    """CPU ids in a list like "0-3,8,10-11" """
+    cpus = []
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-")
+            cpus.extend(range(int(start), int(end) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def format_cpulist(cpus):
+    return ",".join(str(cpu) for cpu in sorted(cpus))
+
+
+def read_topology():
+    """NUMA nodes of this host as {node: (cpus, memory bytes or None)}, limited to usable CPUs"""
+    allowed = os.sched_getaffinity(0) if hasattr(os, "sched_getaffinity") else set(range(os.cpu_count() or 1))
+    nodes = {}
+    for node_dir in glob.glob(os.path.join(NODE_DIR, "node[0-9]*")):
+        node = int(os.path.basename(node_dir)[4:])
+        try:
+            with open(os.path.join(node_dir, "cpulist")) as f:
+                cpus = [cpu for cpu in parse_cpulist(f.read()) if cpu in allowed]
+        except OSError:
+            continue
+
+        memory = None
+        try:
+            with open(os.path.join(node_dir, "meminfo")) as f:
+                match = re.search(r"MemTotal:\s+(\d+) kB", f.read())
+            if match:
+                memory = int(match.group(1)) * 1024
+        except OSError:
+            pass
+
+        if cpus:
+            nodes[node] = (cpus, memory)
+
+    # No NUMA information, treat the machine as a single node
+    return nodes or {0: (sorted(allowed), None)}
+
+
+# Function to claim this process's slot among the backend workers of one server
+def worker_slot():
+    """Index of the first slot whose lock file no sibling worker holds; kept until the process exits"""
+    global _worker_slot
+    if BACKEND_WORKERS == 1:
+        return 0
+    if _worker_slot is None:
+        # Workers are children of one server process, so its pid keeps their slots apart from other servers
+        prefix = os.path.join(tempfile.gettempdir(), f"agent-runner-{os.getppid()}-worker")
+        for slot in range(BACKEND_WORKERS):
+            fd = os.open(f"{prefix}-{slot}.lock", os.O_CREAT | os.O_RDWR, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue
+            _worker_slot = (slot, fd)
+            break
+        else:
+            raise RuntimeError(f"All {BACKEND_WORKERS} worker slots are taken")
+        logger.info(f"Placing containers on CPU slice {_worker_slot[0]} of {BACKEND_WORKERS}")
+    return _worker_slot[0]
+
+
+# Function to give one backend worker its own CPUs of every node
+def worker_topology(topology, slot=None, workers=BACKEND_WORKERS):
+    """The node CPUs at positions slot, slot + workers, ... and an even share of the node's memory"""
+    if workers == 1:
+        return topology
+    slot = worker_slot() if slot is None else slot
+    nodes = {}
+    for node, (cpus, memory) in topology.items():
+        share = cpus[slot::workers]
+        if share:
+            nodes[node] = (share, memory // workers if memory else memory)
+    if not nodes:
+        raise RuntimeError(f"Not enough CPUs to give each of {workers} backend workers its own")
+    return nodes
+
+
+class Placement:
+    """CPUs and NUMA node reserved for one worker"""
+
+    def __init__(self, node, cpus, share, memory):
+        self.node = node
+        self.cpus = cpus
+        # Fraction of each CPU reserved
+        self.share = share
+        self.memory = memory
+
+    @property
+    def cpuset(self):
+        return format_cpulist(self.cpus)
+
+
+class CpuPlacer:
+    """Bin-packs workers onto CPU sets within a single NUMA node
+
+    Every CPU has a capacity of PLACEMENT_OVERCOMMIT; a worker asking for c
+    CPUs reserves c / ceil(c) on each of ceil(c) CPUs of one node. Among the
+    nodes that fit, the fullest one is chosen (best fit), and within it the
+    most loaded CPUs that still have room, so whole CPUs and nodes stay free
+    for large workers.
+    """
+
+    def __init__(self, topology=None, overcommit=PLACEMENT_OVERCOMMIT):
+        self.topology = worker_topology(topology or read_topology())
+        self.capacity = overcommit
+        self.cpu_load = defaultdict(float)
+        self.node_memory = defaultdict(int)
+
+    def _node_fit(self, node, count, share, memory):
+        cpus, total_memory = self.topology[node]
+        if memory and total_memory and self.node_memory[node] + memory > total_memory:
+            return None
+        free = [cpu for cpu in cpus if self.cpu_load[cpu] + share <= self.capacity + 1e-9]
+        if len(free) < count:
+            return None
+        # Most loaded first, CPU id for a stable order
+        free.sort(key=lambda cpu: (-self.cpu_load[cpu], cpu))
+        return free[:count]
+
+    def place(self, cpus, memory=None):
+        """Reserve CPUs for a worker; None when no node has room"""
+        count = max(1, math.ceil(cpus))
+        share = cpus / count
+
+        best = None
+        for node, (node_cpus, _) in self.topology.items():
+            chosen = self._node_fit(node, count, share, memory)
+            if chosen is None:
+                continue
+            remaining = sum(self.capacity - self.cpu_load[cpu] for cpu in node_cpus)
+            if best is None or remaining < best[0]:
+                best = (remaining, node, chosen)
+
+        if best is None:
+            return None
+
+        _, node, chosen = best
+        for cpu in chosen:
+            self.cpu_load[cpu] += share
+        if memory:
+            self.node_memory[node] += memory
+        return Placement(node, chosen, share, memory)
+
+    def release(self, placement):
+        for cpu in placement.cpus:
+            self.cpu_load[cpu] = max(0.0, self.cpu_load[cpu] - placement.share)
+        if placement.memory:
+            self.node_memory[placement.node] = max(0, self.node_memory[placement.node] - placement.memory)
+
+    def reservations(self):
+        """Reserved share per CPU, for inspection"""
+        return {cpu: round(load, 3) for cpu, load in sorted(self.cpu_load.items()) if load}
+
+
+def docker_resource_config(profile, placement=None):
+    """HostConfig fields applying a resource profile and placement to a container"""
+    host_config = {}
+    if profile.cpus:
+        host_config["NanoCpus"] = int(profile.cpus * 1e9)
+    if profile.memory:
+        host_config["Memory"] = profile.memory
+        # No swap on top of the memory limit
+        host_config["MemorySwap"] = profile.memory
+    if profile.pids:
+        host_config["PidsLimit"] = profile.pids
+    if placement:
+        host_config["CpusetCpus"] = placement.cpuset
+        host_config["CpusetMems"] = str(placement.node)
+    return host_config
@@ -0,0 +1,62 @@
+# backend/resources.py
+
+import logging
+from config import AGENT_DEFAULT_CPUS, AGENT_DEFAULT_MEMORY, AGENT_DEFAULT_PIDS
+from agent_settings import agent_settings
+
+logger = logging.getLogger(__name__)
+
+# Binary suffixes accepted in memory sizes, as in `docker run --memory`
+MEMORY_UNITS = {"": 1, "b": 1, "k": 2 ** 10, "m": 2 ** 20, "g": 2 ** 30, "t": 2 ** 40}
+
+
+def parse_memory(value):
+    """Bytes for a size like 536870912, "512m" or "2G"; None for no limit"""
+    if value in (None, "", 0):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+
+    text = str(value).strip().lower().rstrip("ib")
+    number, unit = text, ""
+    if text and text[-1] in MEMORY_UNITS:
+        number, unit = text[:-1], text[-1]
+    return int(float(number) * MEMORY_UNITS[unit])
+
+
+class ResourceProfile:
+    """CPU, memory and process limits of one agent worker; None means unlimited"""
+
+    def __init__(self, cpus=None, memory=None, pids=None):
+        self.cpus = float(cpus) if cpus else None
+        self.memory = parse_memory(memory)
+        self.pids = int(pids) if pids else None
+
+    def __eq__(self, other):
+        return isinstance(other, ResourceProfile) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def key(self):
+        return (self.cpus, self.memory, self.pids)
+
+    def __repr__(self):
+        return f"ResourceProfile(cpus={self.cpus}, memory={self.memory}, pids={self.pids})"
+
+
+def agent_resources(agent_name):
+    """The agent's "resources" from agent.json, with the configured defaults filled in
+
+    Example: {"resources": {"cpus": 1.5, "memory": "512m", "pids": 128}}
+    """
+    resources = agent_settings(agent_name).get("resources") or {}
+    try:
+        return ResourceProfile(
+            cpus=resources.get("cpus", AGENT_DEFAULT_CPUS),
+            memory=resources.get("memory", AGENT_DEFAULT_MEMORY),
+            pids=resources.get("pids", AGENT_DEFAULT_PIDS),
+        )
+    except (TypeError, ValueError, KeyError) as e:
+        logger.error(f"Invalid resources for agent {agent_name}: {str(e)}")
+        return ResourceProfile(AGENT_DEFAULT_CPUS, AGENT_DEFAULT_MEMORY, AGENT_DEFAULT_PIDS)
@@ -0,0 +1,190 @@
+# backend/sandbox_backend.py
+
+import os
+import sys
+import uuid
+import shutil
+import asyncio
+import compileall
+import logging
+from config import (
+    SANDBOX_LAUNCHER, SANDBOX_CGROUP_ROOT, SANDBOX_MEMORY_LIMIT, SANDBOX_CPUS, SANDBOX_PIDS_LIMIT,
+    COMPLETION_CACHE, COMPLETION_CACHE_DIR
+)
+from agent_worker import AgentWorker
+from resources import ResourceProfile, parse_memory
+
+logger = logging.getLogger(__name__)
+
+# Runtime package bound read-only into every sandbox, at the same path as in containers
+RUNTIME_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "agent_runtime")
+RUNTIME_MOUNT = "/opt/agent-runtime"
+
+# Host directories the sandboxed interpreter needs; everything else is absent
+SYSTEM_DIRS = ["/usr", "/lib", "/lib64", "/lib32", "/bin", "/sbin", "/etc"]
+
+# Generous reader limit, agent output lines can be long
+READER_LIMIT = 2 ** 20
+
+# cpu.max period in microseconds
+CPU_PERIOD = 100000
+
+# Set once the runtime's bytecode was written for this interpreter
+runtime_compiled = False
+
+
+class SandboxWorker(AgentWorker):
+    """An agent runtime running under the namespace launcher"""
+
+    def __init__(self, name, process, cgroup_dir=None):
+        super().__init__(name)
+        self.process = process
+        self.cgroup_dir = cgroup_dir
+
+    @property
+    def stdout(self):
+        return self.process.stdout
+
+    @property
+    def stderr(self):
+        return self.process.stderr
+
+    def is_alive(self):
+        return self.process.returncode is None
+
+    async def write(self, data):
+        self.process.stdin.write(data)
+        await self.process.stdin.drain()
+
+    async def destroy(self):
+        """Kill the sandbox and remove its cgroup"""
+        try:
+            if self.is_alive():
+                self.process.kill()
+            await self.process.wait()
+        finally:
+            if self.cgroup_dir:
+                try:
+                    os.rmdir(self.cgroup_dir)
+                except OSError as e:
+                    logger.warning(f"Could not remove cgroup {self.cgroup_dir}: {str(e)}")
+
+
+def _interpreter_dirs():
+    """Directories holding the host interpreter and its site-packages"""
+    dirs = {sys.prefix, sys.base_prefix, sys.exec_prefix, os.path.dirname(os.path.realpath(sys.executable))}
+    for path in sys.path:
+        # Only installed packages, never the backend's own sources and secrets
+        if os.path.isabs(path) and os.path.isdir(path) and os.path.basename(path) in ("site-packages", "dist-packages"):
+            dirs.add(path)
+    # Nested entries are covered by their parents
+    return [d for d in sorted(dirs) if not any(d != p and d.startswith(p + os.sep) for p in dirs)]
+
+
+def sandbox_command(entrypoint_path):
+    """Launcher arguments for a fresh set of namespaces with a read-only root"""
+    cmd = [
+        SANDBOX_LAUNCHER,
+        # New user, pid, ipc, uts, mount and cgroup namespaces; unprivileged via the user namespace
+        "--unshare-all",
+        # Agents still have to reach the LLM API
+        "--share-net",
+        "--die-with-parent",
+        "--new-session",
+        "--proc", "/proc",
+        "--dev", "/dev",
+    ]
+    for path in SYSTEM_DIRS + _interpreter_dirs():
+        cmd += ["--ro-bind-try", path, path]
+    cmd += [
+        "--ro-bind", RUNTIME_DIR, f"{RUNTIME_MOUNT}/agent_runtime",
+        "--ro-bind", entrypoint_path, "/app/entrypoint.py",
+        # The only writable places: /tmp, gone with the sandbox, and the shared completion cache
+        "--tmpfs", "/tmp",
+    ]
+    if COMPLETION_CACHE:
+        cmd += ["--bind", COMPLETION_CACHE_DIR, COMPLETION_CACHE_DIR]
+    cmd += [
+        "--remount-ro", "/",
+        "--chdir", "/app",
+        "--",
+        sys.executable, "-u", "-m", "agent_runtime.runner", "/app/entrypoint.py",
+    ]
+    return cmd
+
+
+def _create_cgroup(name, resources):
+    """Create a cgroup v2 group under the delegated root, limited by the agent's profile
+    or the sandbox defaults"""
+    cgroup_dir = os.path.join(SANDBOX_CGROUP_ROOT, name)
+    os.mkdir(cgroup_dir)
+    memory = resources.memory or parse_memory(SANDBOX_MEMORY_LIMIT)
+    cpus = resources.cpus or SANDBOX_CPUS
+    pids = resources.pids or SANDBOX_PIDS_LIMIT
+    limits = {
+        "memory.max": str(memory) if memory else None,
+        "cpu.max": f"{int(cpus * CPU_PERIOD)} {CPU_PERIOD}" if cpus > 0 else None,
+        "pids.max": str(pids) if pids > 0 else None,
+    }
+    for key, value in limits.items():
+        if value:
+            with open(os.path.join(cgroup_dir, key), 'w') as f:
+                f.write(value)
+    return cgroup_dir
+
+
+# Function to compile the runtime once, so sandboxes load its bytecode from the read-only bind
+def compile_runtime():
+    """Write the runtime's bytecode next to its sources for the interpreter sandboxes run"""
+    global runtime_compiled
+    if not runtime_compiled:
+        if not compileall.compile_dir(RUNTIME_DIR, quiet=2):
+            logger.warning(f"Could not compile {RUNTIME_DIR}, sandboxes compile the runtime on every start")
+        runtime_compiled = True
+
+
+async def launch_sandbox(agent_name, entrypoint_path, resources=None):
+    """Start the runtime for an agent in a sandbox and return it once it reported READY"""
+    if shutil.which(SANDBOX_LAUNCHER) is None:
+        raise RuntimeError(f"Sandbox launcher not found: {SANDBOX_LAUNCHER}")
+
+    if not runtime_compiled:
+        await asyncio.get_running_loop().run_in_executor(None, compile_runtime)
+
+    name = f"sandbox-{agent_name}-{uuid.uuid4().hex[:8]}"
+    cgroup_dir = _create_cgroup(name, resources or ResourceProfile()) if SANDBOX_CGROUP_ROOT else None
+
+    def join_cgroup():
+        # Runs in the child before exec, so the launcher and all it starts are limited
+        with open(os.path.join(cgroup_dir, "cgroup.procs"), 'w') as f:
+            f.write("0")
+
+    logger.info(f"Starting sandbox: {name}")
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *sandbox_command(entrypoint_path),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            # Nothing from the backend's environment leaks into the agent
+            env={
+                "PATH": "/usr/local/bin:/usr/bin:/bin",
+                "HOME": "/tmp",
+                "PYTHONPATH": RUNTIME_MOUNT,
+                "PYTHONWARNINGS": "ignore",
+            },
+            preexec_fn=join_cgroup if cgroup_dir else None,
+            limit=READER_LIMIT,
+        )
+    except BaseException:
+        if cgroup_dir:
+            os.rmdir(cgroup_dir)
+        raise
+
+    worker = SandboxWorker(name, process, cgroup_dir)
+    try:
+        await worker.wait_until_ready()
+    except BaseException:
+        await worker.destroy()
+        raise
+    return worker
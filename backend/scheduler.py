@@ -0,0 +1,290 @@
+# backend/scheduler.py
+
+import math
+import time
+import heapq
+import weakref
+import asyncio
+import logging
+import itertools
+from collections import defaultdict, deque
+from fastapi import HTTPException
+from config import (
+    SCHED_MAX_CONCURRENT, SCHED_MAX_PER_USER, SCHED_MAX_PER_AGENT, SCHED_MAX_QUEUE,
+    SCHED_QUEUE_TIMEOUT, SCHED_USER_RATE, SCHED_USER_BURST
+)
+from metrics import registry, Gauge, Counter, queue_wait_seconds
+
+logger = logging.getLogger(__name__)
+
+# Lower value is served first; within a class users share by weight
+PRIORITY_CLASSES = {"interactive": 0, "standard": 1, "batch": 2}
+DEFAULT_PRIORITY = "standard"
+
+# Recent queue waits kept for percentiles
+WAIT_SAMPLES = 1000
+
+# Admissions between sweeps of the per-user state of idle users
+PRUNE_EVERY = 1024
+
+
+class TokenBucket:
+    """Per-user request rate limit with bursts; a rate of 0 or less is unlimited"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = None
+
+    def take(self, now):
+        """Take a token, or return the seconds until one is available"""
+        if self.rate <= 0:
+            return 0
+        if self.updated is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def full(self, now):
+        """Whether the bucket has refilled, i.e. forgetting it changes nothing"""
+        return (self.rate <= 0 or self.updated is None
+                or self.tokens + (now - self.updated) * self.rate >= self.burst)
+
+
+class Slot:
+    """A granted run; released exactly once when the stream ends"""
+
+    def __init__(self, scheduler, user, agent_name, admitted_at):
+        self.scheduler = scheduler
+        self.user = user
+        self.agent_name = agent_name
+        self.admitted_at = admitted_at
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.scheduler._release(self)
+
+
+class AdmissionScheduler:
+    """Admission control in front of agent runs
+
+    Runs are capped globally, per user and per agent. Requests over a cap
+    queue and are dispatched by priority class, then by weighted fair queuing
+    across users (start-time fair queuing with one unit of cost per run).
+    """
+
+    def __init__(self, max_concurrent=SCHED_MAX_CONCURRENT, max_per_user=SCHED_MAX_PER_USER,
+                 max_per_agent=SCHED_MAX_PER_AGENT, max_queue=SCHED_MAX_QUEUE,
+                 queue_timeout=SCHED_QUEUE_TIMEOUT, user_rate=SCHED_USER_RATE, user_burst=SCHED_USER_BURST):
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.max_per_agent = max_per_agent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+
+        self.running = 0
+        self.running_per_user = defaultdict(int)
+        self.running_per_agent = defaultdict(int)
+        self.buckets = {}
+
+        # Waiters as (priority rank, virtual start, seq, user, agent, enqueued at, future)
+        self.queue = []
+        self.queued = 0
+        self.virtual_time = 0.0
+        self.last_finish = {}
+        self._seq = itertools.count()
+        self._admissions = 0
+
+        # Smoothed run duration, used to estimate Retry-After
+        self.avg_run_seconds = 1.0
+        self.wait_count = 0
+        self.wait_sum = 0.0
+        self.recent_waits = deque(maxlen=WAIT_SAMPLES)
+        self.rejected = defaultdict(int)
+
+    def _allowed(self, user, agent_name):
+        return (
+            self.running < self.max_concurrent
+            and self.running_per_user.get(user, 0) < self.max_per_user
+            and self.running_per_agent.get(agent_name, 0) < self.max_per_agent
+        )
+
+    def _reject(self, reason, retry_after, detail):
+        self.rejected[reason] += 1
+        raise HTTPException(
+            status_code=429,
+            detail=detail,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+
+    def _estimated_wait(self):
+        return (self.queued + 1) * self.avg_run_seconds / max(self.max_concurrent, 1)
+
+    async def admit(self, user, agent_name, priority=DEFAULT_PRIORITY, weight=1.0):
+        """Wait for a run slot, or raise a 429 HTTPException with Retry-After"""
+        loop = asyncio.get_running_loop()
+        now = time.monotonic()
+        self._admissions += 1
+        if self._admissions % PRUNE_EVERY == 0:
+            self._prune(now)
+
+        bucket = self.buckets.get(user)
+        if bucket is None:
+            bucket = self.buckets[user] = TokenBucket(self.user_rate, self.user_burst)
+        wait = bucket.take(now)
+        if wait:
+            self._reject("rate_limited", wait, "Too many requests, slow down")
+
+        if not self.queue and self._allowed(user, agent_name):
+            return self._grant(user, agent_name, now, now)
+
+        if self.queued >= self.max_queue:
+            self._reject("queue_full", self._estimated_wait(), "Server busy, try again later")
+
+        # Start-time fair queuing: a user's runs are spaced 1/weight apart in virtual time
+        start = max(self.virtual_time, self.last_finish.get(user, 0.0))
+        finish = start + 1.0 / max(weight, 1e-6)
+        self.last_finish[user] = finish
+
+        future = loop.create_future()
+        rank = PRIORITY_CLASSES.get(priority, PRIORITY_CLASSES[DEFAULT_PRIORITY])
+        heapq.heappush(self.queue, (rank, start, next(self._seq), user, agent_name, now, future))
+        self.queued += 1
+        # Waiters ahead of us may all be held back by their own caps
+        self._dispatch(now)
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._abandon(future)
+            self._reject("queue_timeout", self._estimated_wait(), "Timed out waiting for capacity")
+        except asyncio.CancelledError:
+            # Client went away while queued
+            self._abandon(future)
+            raise
+
+    def _abandon(self, future):
+        if future.done() and not future.cancelled():
+            # Granted in the same tick the caller gave up, hand the slot back
+            future.result().release()
+        else:
+            # Dropped from the heap lazily by _dispatch
+            future.cancel()
+            self.queued -= 1
+
+    def _grant(self, user, agent_name, enqueued_at, now):
+        self.running += 1
+        self.running_per_user[user] += 1
+        self.running_per_agent[agent_name] += 1
+
+        wait_seconds = now - enqueued_at
+        self.wait_count += 1
+        self.wait_sum += wait_seconds
+        self.recent_waits.append(wait_seconds)
+        queue_wait_seconds.observe(wait_seconds)
+        return Slot(self, user, agent_name, now)
+
+    def _release(self, slot):
+        now = time.monotonic()
+        self.running -= 1
+        self.running_per_user[slot.user] -= 1
+        self.running_per_agent[slot.agent_name] -= 1
+        if not self.running_per_user[slot.user]:
+            del self.running_per_user[slot.user]
+        if not self.running_per_agent[slot.agent_name]:
+            del self.running_per_agent[slot.agent_name]
+
+        self.avg_run_seconds = 0.9 * self.avg_run_seconds + 0.1 * (now - slot.admitted_at)
+        self._dispatch(now)
+
+    def _prune(self, now):
+        """Forget the buckets and fair queuing state of users with nothing running or queued"""
+        queued_users = {entry[3] for entry in self.queue if not entry[-1].cancelled()}
+        for user in [u for u, bucket in self.buckets.items() if bucket.full(now)]:
+            if user not in self.running_per_user and user not in queued_users:
+                del self.buckets[user]
+        if not queued_users:
+            # Nobody waits: moving the virtual clock past every finish tag keeps their order
+            self.virtual_time = max(self.virtual_time, *self.last_finish.values(), 0.0)
+            self.last_finish.clear()
+            return
+        # A finish tag behind the virtual clock no longer delays the user's next run
+        for user in [u for u, finish in self.last_finish.items() if finish <= self.virtual_time]:
+            if user not in queued_users:
+                del self.last_finish[user]
+
+    def _dispatch(self, now):
+        """Grant queued requests in order, skipping those still over a per-user or per-agent cap"""
+        skipped = []
+        while self.queue and self.running < self.max_concurrent:
+            entry = heapq.heappop(self.queue)
+            rank, start, seq, user, agent_name, enqueued_at, future = entry
+            if future.cancelled():
+                continue
+            if not self._allowed(user, agent_name):
+                skipped.append(entry)
+                continue
+
+            self.queued -= 1
+            self.virtual_time = max(self.virtual_time, start)
+            future.set_result(self._grant(user, agent_name, enqueued_at, now))
+
+        for entry in skipped:
+            heapq.heappush(self.queue, entry)
+
+    def stats(self):
+        """Current load and queue wait figures"""
+        waits = sorted(self.recent_waits)
+
+        def percentile(p):
+            return waits[min(len(waits) - 1, int(p * len(waits)))] if waits else 0.0
+
+        return {
+            "running": self.running,
+            "queued": self.queued,
+            "queue_wait_count": self.wait_count,
+            "queue_wait_seconds_sum": round(self.wait_sum, 6),
+            "queue_wait_seconds_p50": round(percentile(0.5), 6),
+            "queue_wait_seconds_p95": round(percentile(0.95), 6),
+            "rejected": dict(self.rejected),
+        }
+
+
+def run_with_slot(slot, stream):
+    """Pass a stream through, releasing the run slot when it ends or the client disconnects"""
+    async def relay():
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            slot.release()
+
+    generator = relay()
+    # A response dropped before streaming started never runs the finally block
+    weakref.finalize(generator, slot.release)
+    return generator
+
+
+# Shared scheduler for all agent runs
+scheduler = AdmissionScheduler()
+
+
+# Scheduler load as seen at scrape time
+@registry.collector
+def scheduler_metrics():
+    running = Gauge("scheduler_running", "Agent runs holding a slot")
+    running.set(scheduler.running)
+    queued = Gauge("scheduler_queued", "Requests waiting for a slot")
+    queued.set(scheduler.queued)
+    rejected = Counter("scheduler_rejected_total", "Requests rejected with 429, by reason", ("reason",))
+    for reason, count in scheduler.rejected.items():
+        rejected.inc(count, reason=reason)
+    return [running, queued, rejected]
@@ -0,0 +1,133 @@
+# backend/session_reaper.py
+
+import heapq
+import asyncio
+import logging
+import itertools
+from datetime import datetime
+from config import SESSION_IDLE_TTL, SESSION_MAX_LIVE
+from metrics import sessions_reaped
+
+logger = logging.getLogger(__name__)
+
+
+class SessionReaper:
+    """Tears down idle sessions and keeps the number of live sessions bounded
+
+    Sessions live in an OrderedDict kept in least-recently-used order. One
+    heap entry per session is keyed on its expiry; an entry whose session was
+    used since it was pushed is pushed again with the new expiry instead of
+    reaping the session, so turns never touch the heap.
+    """
+
+    def __init__(self, sessions, stop_session, idle_ttl=SESSION_IDLE_TTL, max_sessions=SESSION_MAX_LIVE):
+        self.sessions = sessions
+        # Coroutine function releasing a session's worker once it is out of the map
+        self.stop_session = stop_session
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        # (expires at, seq, process key, session)
+        self.heap = []
+        self._seq = itertools.count()
+        self._task = None
+        self._wakeup = None
+
+    def _expiry(self, session):
+        return session["last_message_time"].timestamp() + self.idle_ttl
+
+    def _push(self, process_key, session, expires_at=None):
+        expires_at = expires_at or self._expiry(session)
+        heapq.heappush(self.heap, (expires_at, next(self._seq), process_key, session))
+        if self._wakeup:
+            self._wakeup.set()
+
+    def track(self, process_key, session):
+        """Register a new session, evicting the least recently used idle ones over the cap"""
+        previous = self.sessions.get(process_key)
+        if previous is not None and previous is not session:
+            # Never orphan a worker: a session replaced under its key is stopped
+            logger.warning(f"Replacing a live session under the same key: {process_key}")
+            self._teardown(process_key)
+        self.sessions[process_key] = session
+        self.sessions.move_to_end(process_key)
+        self._push(process_key, session)
+
+        excess = len(self.sessions) - self.max_sessions
+        for key in list(self.sessions):
+            if excess <= 0:
+                break
+            candidate = self.sessions[key]
+            # Sessions in the middle of a turn are never evicted
+            if candidate is session or candidate["lock"].locked():
+                continue
+            logger.info(f"Evicting least recently used session: {key}")
+            sessions_reaped.inc(reason="evicted")
+            self._teardown(key)
+            excess -= 1
+
+    def touch(self, process_key):
+        """Mark a session as most recently used"""
+        if process_key in self.sessions:
+            self.sessions[process_key]["last_message_time"] = datetime.now()
+            self.sessions.move_to_end(process_key)
+
+    def _teardown(self, process_key):
+        # Taken out of the map right away, stopped in the background
+        session = self.sessions.pop(process_key)
+        asyncio.create_task(self._close(process_key, session))
+
+    async def _close(self, process_key, session):
+        try:
+            await self.stop_session(session)
+        except Exception as e:
+            logger.error(f"Error tearing down session {process_key}: {str(e)}")
+
+    async def _run(self):
+        while True:
+            if not self.heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            expires_at, _, process_key, session = self.heap[0]
+            delay = expires_at - datetime.now().timestamp()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self.heap)
+            if self.sessions.get(process_key) is not session:
+                # Closed or replaced since the entry was pushed
+                continue
+            if session["lock"].locked():
+                # In the middle of a (long) turn, look again one TTL from now
+                self._push(process_key, session, datetime.now().timestamp() + self.idle_ttl)
+                continue
+            if self._expiry(session) > expires_at:
+                # Used since the entry was pushed
+                self._push(process_key, session)
+                continue
+
+            logger.info(f"Reaping idle session: {process_key}")
+            sessions_reaped.inc(reason="idle")
+            self._teardown(process_key)
+
+    def start(self):
+        """Start the reaper task"""
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the reaper task and close every remaining session"""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        while self.sessions:
+            process_key, session = self.sessions.popitem(last=False)
+            await self._close(process_key, session)
+        self.heap.clear()
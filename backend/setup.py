@@ -10,6 +10,7 @@ setup(
         "pydantic==2.3.0",
         "openai==1.2.0",
         "httpx==0.27.2",
+        "h2==4.1.0",
         "python-dotenv==1.0.0",
         "python-multipart==0.0.6",
         "docker==6.1.3",
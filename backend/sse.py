@@ -0,0 +1,134 @@
+# backend/sse.py
+
+import json
+import time
+from json.encoder import encode_basestring_ascii
+from config import SSE_COALESCE_MS, SSE_COALESCE_CHARS
+
+# Fixed parts of the content events; only the JSON string in between varies.
+# encode_basestring_ascii is the C string encoder behind json.dumps, so the
+# events are byte-for-byte what json.dumps({'content': ...}) would give.
+DATA_PREFIX = 'data: {"content": '
+NEW_MESSAGE_PREFIX = 'event: new_message\ndata: {"content": '
+CONTENT_SUFFIX = '}\n\n'
+
+
+def data_event(content):
+    """SSE event appending content to the message being streamed"""
+    return DATA_PREFIX + encode_basestring_ascii(content) + CONTENT_SUFFIX
+
+
+def new_message_event(content):
+    """SSE event starting a separate chat message"""
+    return NEW_MESSAGE_PREFIX + encode_basestring_ascii(content) + CONTENT_SUFFIX
+
+
+class TokenCoalescer:
+    """Batches streamed tokens into data events
+
+    Tokens are held for at most `window_ms` after the first one of a batch,
+    or until `max_chars` have piled up. The stream flushes whenever the worker
+    has nothing more buffered and the window ran out, and before any other
+    event, so event order is kept and latency grows by at most the window.
+    """
+
+    def __init__(self, window_ms=SSE_COALESCE_MS, max_chars=SSE_COALESCE_CHARS):
+        self.window = window_ms / 1000
+        self.max_chars = max_chars
+        self.tokens = []
+        self.chars = 0
+        self.started = 0.0
+
+    def add(self, content):
+        """Queue a token; returns an event when the batch is full or coalescing is off"""
+        if not self.tokens:
+            self.started = time.monotonic()
+        self.tokens.append(content)
+        self.chars += len(content)
+        if self.chars >= self.max_chars or self.remaining() <= 0:
+            return self.flush()
+        return None
+
+    def remaining(self):
+        """Seconds left before the pending batch must go out"""
+        return self.window - (time.monotonic() - self.started)
+
+    def flush(self):
+        """Event for every pending token, or None when nothing is pending"""
+        if not self.tokens:
+            return None
+        content = self.tokens[0] if len(self.tokens) == 1 else "".join(self.tokens)
+        self.tokens.clear()
+        self.chars = 0
+        return data_event(content)
+
+
+def parse_event(text):
+    """(event name, data) of one SSE event as produced here; data is decoded from JSON when it is JSON"""
+    event, data = "message", []
+    for line in text.split("\n"):
+        if line.startswith("event: "):
+            event = line[7:]
+        elif line.startswith("data: "):
+            data.append(line[6:])
+
+    data = "\n".join(data)
+    try:
+        return event, json.loads(data)
+    except ValueError:
+        return event, data
+
+
+async def collect_events(events):
+    """Consume a stream of SSE events and aggregate it into one response body"""
+    started = time.monotonic()
+    first_output = None
+    content = []
+    messages = []
+    tool_events = []
+    errors = []
+    data_events = 0
+    total_chars = 0
+    usage = {}
+
+    async for text in events:
+        event, data = parse_event(text)
+        if event == "message":
+            content.append(data["content"])
+            data_events += 1
+        elif event == "new_message":
+            messages.append({"role": "assistant", "content": data["content"]})
+        elif event == "tool":
+            tool_events.append(data)
+        elif event == "error":
+            errors.append(data["error"] if isinstance(data, dict) else data)
+            continue
+        elif event == "completion":
+            total_chars = max(total_chars, data.get("total_chars", 0))
+            usage = data.get("usage") or usage
+            continue
+        else:
+            continue
+
+        if first_output is None:
+            first_output = time.monotonic()
+
+    finished = time.monotonic()
+    return {
+        # Streamed reply, i.e. everything sent as data events
+        "content": "".join(content),
+        # Separate messages, in the order the agent sent them
+        "messages": messages,
+        "tool_events": tool_events,
+        "errors": errors,
+        "usage": {
+            **usage,
+            "total_chars": total_chars,
+            "data_events": data_events,
+            "messages": len(messages),
+        },
+        "timings": {
+            "first_output_ms": round((first_output - started) * 1000, 1) if first_output else None,
+            "total_ms": round((finished - started) * 1000, 1),
+        },
+    }
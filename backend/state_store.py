@@ -0,0 +1,328 @@
+# backend/state_store.py
+
+import os
+import json
+import time
+import asyncio
+import sqlite3
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, unquote
+from config import STATE_STORE
+
+# Prefix of every key, so the store can share a Redis database with other applications
+KEY_PREFIX = "agent-runner:"
+
+# Writes between purges of expired entries in the memory and SQLite stores
+PURGE_EVERY = 1024
+
+
+class StateStoreError(Exception):
+    """The state store could not be reached or refused a command"""
+
+
+class MemoryStore:
+    """Key-value state in this process, for a single backend worker
+
+    Values are kept as given; callers must not modify what get() returns.
+    """
+
+    kind = "memory"
+    shared = False
+
+    def __init__(self):
+        # key -> (value, expires at or None)
+        self.data = {}
+        # set key -> {member: expires at}
+        self.sets = {}
+        self._writes = 0
+
+    def _live(self, key, now):
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= now:
+            del self.data[key]
+            return None
+        return entry[0]
+
+    async def get(self, key):
+        return self._live(key, time.time())
+
+    async def get_many(self, keys):
+        now = time.time()
+        return [self._live(key, now) for key in keys]
+
+    async def set(self, key, value, ttl=None):
+        self.data[key] = (value, time.time() + ttl if ttl else None)
+        self._writes += 1
+        if self._writes % PURGE_EVERY == 0:
+            now = time.time()
+            for expired in [k for k, (_, expires_at) in self.data.items() if expires_at and expires_at <= now]:
+                del self.data[expired]
+
+    async def delete(self, key):
+        self.data.pop(key, None)
+
+    async def add_member(self, key, member, ttl):
+        """Add a member to a set; every member expires on its own"""
+        self.sets.setdefault(key, {})[member] = time.time() + ttl
+
+    async def members(self, key):
+        now = time.time()
+        members = self.sets.get(key, {})
+        for expired in [m for m, expires_at in members.items() if expires_at <= now]:
+            del members[expired]
+        return set(members)
+
+    async def close(self):
+        pass
+
+    def stats(self):
+        return {"kind": self.kind, "keys": len(self.data)}
+
+
+class SQLiteStore:
+    """Key-value state in a SQLite database in WAL mode, shared by the backend processes of one host
+
+    Every call runs on one dedicated thread holding the connection, so the
+    event loop never waits on disk.
+    """
+
+    kind = "sqlite"
+    shared = True
+
+    def __init__(self, path):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state-store")
+        self._db = None
+        self._writes = 0
+
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS members"
+                " (key TEXT NOT NULL, member TEXT NOT NULL, expires_at REAL NOT NULL, PRIMARY KEY (key, member))"
+            )
+        return self._db
+
+    async def _call(self, fn, *args):
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        except sqlite3.Error as e:
+            raise StateStoreError(f"SQLite state store {self.path}: {str(e)}") from e
+
+    def _get_many(self, keys):
+        if not keys:
+            return []
+        rows = dict(self._connect().execute(
+            f"SELECT key, value FROM state WHERE key IN ({','.join('?' * len(keys))})"
+            " AND (expires_at IS NULL OR expires_at > ?)",
+            (*keys, time.time())
+        ).fetchall())
+        return [json.loads(rows[key]) if key in rows else None for key in keys]
+
+    def _set(self, key, value, ttl):
+        db = self._connect()
+        now = time.time()
+        db.execute(
+            "INSERT OR REPLACE INTO state (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, now + ttl if ttl else None)
+        )
+        self._writes += 1
+        if self._writes % PURGE_EVERY == 0:
+            db.execute("DELETE FROM state WHERE expires_at <= ?", (now,))
+
+    def _delete(self, key):
+        self._connect().execute("DELETE FROM state WHERE key = ?", (key,))
+
+    def _add_member(self, key, member, ttl):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO members (key, member, expires_at) VALUES (?, ?, ?)",
+            (key, member, time.time() + ttl)
+        )
+
+    def _members(self, key):
+        db = self._connect()
+        db.execute("DELETE FROM members WHERE key = ? AND expires_at <= ?", (key, time.time()))
+        return {row[0] for row in db.execute("SELECT member FROM members WHERE key = ?", (key,))}
+
+    async def get(self, key):
+        return (await self._call(self._get_many, [key]))[0]
+
+    async def get_many(self, keys):
+        return await self._call(self._get_many, list(keys))
+
+    async def set(self, key, value, ttl=None):
+        await self._call(self._set, key, json.dumps(value), ttl)
+
+    async def delete(self, key):
+        await self._call(self._delete, key)
+
+    async def add_member(self, key, member, ttl):
+        await self._call(self._add_member, key, member, ttl)
+
+    async def members(self, key):
+        return await self._call(self._members, key)
+
+    async def close(self):
+        def close_db():
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+        await self._call(close_db)
+        self._executor.shutdown(wait=False)
+
+    def stats(self):
+        return {"kind": self.kind, "path": self.path}
+
+
+class RedisStore:
+    """Key-value state in Redis, or any server speaking its protocol, shared by every backend replica
+
+    A small pool of plain RESP connections; redis://[:password@]host:port/db.
+    """
+
+    kind = "redis"
+    shared = True
+
+    def __init__(self, url, max_idle=16):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or 6379
+        self.password = unquote(parts.password) if parts.password else None
+        self.db = int(parts.path.strip("/") or 0)
+        self.max_idle = max_idle
+        self._idle = deque()
+
+    async def _open(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        connection = (reader, writer)
+        try:
+            if self.password:
+                await self._command(connection, "AUTH", self.password)
+            if self.db:
+                await self._command(connection, "SELECT", self.db)
+        except BaseException:
+            writer.close()
+            raise
+        return connection
+
+    @staticmethod
+    async def _read(reader):
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by the state store")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise StateStoreError(f"Redis error: {rest.decode()}")
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            size = int(rest)
+            return None if size < 0 else (await reader.readexactly(size + 2))[:-2]
+        if kind == b"*":
+            size = int(rest)
+            return None if size < 0 else [await RedisStore._read(reader) for _ in range(size)]
+        # Out of sync with the server, the connection is dropped
+        raise ConnectionError(f"Unexpected reply from the state store: {line[:40]!r}")
+
+    @staticmethod
+    async def _command(connection, *args):
+        reader, writer = connection
+        encoded = [arg if isinstance(arg, bytes) else str(arg).encode() for arg in args]
+        writer.write(b"*%d\r\n" % len(encoded) + b"".join(b"$%d\r\n%s\r\n" % (len(a), a) for a in encoded))
+        await writer.drain()
+        return await RedisStore._read(reader)
+
+    async def execute(self, *args):
+        """Run one command on a pooled connection"""
+        connection = None
+        try:
+            connection = self._idle.popleft() if self._idle else await self._open()
+            reply = await self._command(connection, *args)
+        except StateStoreError:
+            # The server answered, the connection is still good
+            if connection is not None:
+                self._release(connection)
+            raise
+        except (OSError, asyncio.IncompleteReadError) as e:
+            if connection is not None:
+                connection[1].close()
+            raise StateStoreError(f"Redis state store {self.host}:{self.port}: {str(e)}") from e
+        except BaseException:
+            # Cancelled mid-command, the reply may still arrive on this connection
+            if connection is not None:
+                connection[1].close()
+            raise
+        self._release(connection)
+        return reply
+
+    def _release(self, connection):
+        if len(self._idle) < self.max_idle:
+            self._idle.append(connection)
+        else:
+            connection[1].close()
+
+    async def get(self, key):
+        value = await self.execute("GET", KEY_PREFIX + key)
+        return None if value is None else json.loads(value)
+
+    async def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return []
+        values = await self.execute("MGET", *[KEY_PREFIX + key for key in keys])
+        return [None if value is None else json.loads(value) for value in values]
+
+    async def set(self, key, value, ttl=None):
+        args = ["SET", KEY_PREFIX + key, json.dumps(value)]
+        if ttl:
+            args += ["PX", max(1, int(ttl * 1000))]
+        await self.execute(*args)
+
+    async def delete(self, key):
+        await self.execute("DEL", KEY_PREFIX + key)
+
+    async def add_member(self, key, member, ttl):
+        # A sorted set scored by expiry time
+        await self.execute("ZADD", KEY_PREFIX + key, repr(time.time() + ttl), member)
+
+    async def members(self, key):
+        now = repr(time.time())
+        await self.execute("ZREMRANGEBYSCORE", KEY_PREFIX + key, "-inf", now)
+        return {member.decode() for member in await self.execute("ZRANGEBYSCORE", KEY_PREFIX + key, now, "+inf")}
+
+    async def close(self):
+        while self._idle:
+            self._idle.popleft()[1].close()
+
+    def stats(self):
+        return {"kind": self.kind, "endpoint": f"{self.host}:{self.port}/{self.db}", "idle_connections": len(self._idle)}
+
+
+# Function to open the store named by a STATE_STORE value
+def open_store(url):
+    """memory, sqlite:path/to/state.db (sqlite:///absolute/path) or redis://[:password@]host:port/db"""
+    if not url or url == "memory":
+        return MemoryStore()
+    if url.startswith("sqlite:"):
+        path = url[len("sqlite:"):]
+        if path.startswith("//"):
+            path = path[2:]
+        return SQLiteStore(os.path.abspath(path))
+    if url.startswith("redis://"):
+        return RedisStore(url)
+    raise ValueError(f"Unknown STATE_STORE: {url}")
+
+
+# Revoked tokens, session metadata and session ownership, shared by every backend process when the store is
+store = open_store(STATE_STORE)
@@ -0,0 +1,18 @@
+# backend/tests/conftest.py
+
+import os
+import sys
+
+# The backend modules are imported flat, as when the app runs from backend/
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+# The benchmark's fake Docker daemon doubles as the daemon of container tests
+sys.path.insert(0, os.path.join(BACKEND_DIR, "bench"))
+
+# config refuses to load without these; tests never reach a real LLM
+os.environ.setdefault("API_BASE_URL", "http://127.0.0.1:9/v1")
+os.environ.setdefault("AUTH_TOKEN", "test")
+os.environ.setdefault("DEFAULT_MODEL", "test-model")
+os.environ.setdefault("TOKENIZER", "approx")
+os.environ["STATE_STORE"] = "memory"
+os.environ.pop("WEB_CONCURRENCY", None)
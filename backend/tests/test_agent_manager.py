@@ -0,0 +1,160 @@
+# backend/tests/test_agent_manager.py
+
+import json
+import asyncio
+import pytest
+import agent_manager
+from agent_worker import AgentWorker
+from agent_runtime import protocol
+from tokenizer import TokenCounter
+from sse import TokenCoalescer, data_event, new_message_event
+from agent_manager import start_agent_process, finish_turn, stream_from_agent, user_agent_processes
+
+
+class FakeWorker:
+    def __init__(self, name):
+        self.name = name
+        self.jobs = []
+        self.alive = True
+
+    def is_alive(self):
+        return self.alive
+
+    async def send_job(self, job):
+        self.jobs.append(job)
+
+
+class FrameWorker(AgentWorker):
+    """Worker answering every job with a fixed list of frames"""
+
+    def __init__(self, name, frames):
+        super().__init__(name)
+        self.stdout = asyncio.StreamReader()
+        self.replies = frames
+
+    def is_alive(self):
+        return True
+
+    async def send_job(self, job):
+        self.stdout.feed_data(b"".join(protocol.encode_frame(*frame) for frame in self.replies))
+
+
+class SlowBackend:
+    """Backend whose workers take a while to start, so concurrent first turns overlap"""
+
+    name = "fake"
+
+    def __init__(self):
+        self.acquired = []
+        self.released = []
+
+    async def version(self, agent_name):
+        return "v1"
+
+    async def acquire(self, agent_name, version, dedicated=False, affinity=None):
+        await asyncio.sleep(0.05)
+        worker = FakeWorker(f"w{len(self.acquired) + 1}")
+        self.acquired.append(worker)
+        return worker
+
+    async def release(self, worker):
+        self.released.append(worker)
+
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    (tmp_path / "agents" / "echo").mkdir(parents=True)
+    (tmp_path / "agents" / "echo" / "agent.py").write_text("")
+    monkeypatch.chdir(tmp_path)
+    backend = SlowBackend()
+    monkeypatch.setattr(agent_manager, "backend_for_agent", lambda agent_name: backend)
+    yield backend
+    user_agent_processes.clear()
+    agent_manager.session_reaper.heap.clear()
+
+
+def test_concurrent_first_turns_share_one_worker(backend):
+    messages = [{"role": "user", "content": "hi"}]
+
+    async def main():
+        first = asyncio.create_task(start_agent_process("echo", messages, 100, "tok"))
+        second = asyncio.create_task(start_agent_process("echo", messages, 100, "tok"))
+        session = await first
+        await asyncio.sleep(0.1)
+        # The second turn waits for the first to finish rather than starting its own worker
+        assert not second.done()
+        await finish_turn(session["process_key"], session, True)
+        assert await second is session
+        await finish_turn(session["process_key"], session, True)
+
+        assert [w.name for w in backend.acquired] == ["w1"]
+        assert user_agent_processes == {"tok_echo": session}
+        assert not agent_manager._creating
+    asyncio.run(main())
+
+
+def test_interrupted_turn_closes_only_its_own_session(backend):
+    messages = [{"role": "user", "content": "hi"}]
+
+    async def main():
+        session = await start_agent_process("echo", messages, 100, "tok")
+        await finish_turn(session["process_key"], session, False)
+        assert backend.released == [session["worker"]]
+        assert not user_agent_processes
+
+        # A newer session under the same key is left alone when a stale one is closed
+        newer = await start_agent_process("echo", messages, 100, "tok")
+        await agent_manager.close_session(session["process_key"], session)
+        assert user_agent_processes == {"tok_echo": newer}
+        await finish_turn(newer["process_key"], newer, False)
+    asyncio.run(main())
+
+
+def run_stream(*args, **kwargs):
+    async def main():
+        return [event async for event in stream_from_agent(*args, **kwargs)]
+    return asyncio.run(main())
+
+
+def events_of(stream, name):
+    return [json.loads(e.split("data: ", 1)[1]) for e in stream if e.startswith(f"event: {name}\n")]
+
+
+def test_turn_without_token_reports_usage():
+    stream = run_stream("echo", [{"role": "user", "content": "hi"}], 100, None)
+    [completion] = events_of(stream, "completion")
+    assert completion["usage"]["completion_tokens"] == 0
+    assert completion["usage"]["prompt_tokens"] > 0
+    assert not events_of(stream, "error")
+
+
+def test_generated_frames_count_against_the_budget(backend, monkeypatch):
+    frames = [(protocol.MESSAGE, "hello there"), (protocol.GENERATED, "hello there"), (protocol.READY,)]
+    monkeypatch.setattr(backend, "acquire", lambda *args, **kwargs: asyncio.sleep(0, FrameWorker("w1", frames)))
+
+    stream = run_stream("echo", [{"role": "user", "content": "hi"}], 100, "tok")
+    [completion] = events_of(stream, "completion")
+    # The message text is counted once, from its GENERATED frame
+    assert completion["usage"]["completion_tokens"] == TokenCounter().add_complete("hello there") > 0
+    assert not backend.released
+
+    # Past the budget of max_tokens * AGENT_TOKEN_BUDGET_FACTOR the turn stops and the worker goes
+    user_agent_processes.clear()
+    frames[1] = (protocol.GENERATED, "word " * 100)
+    stream = run_stream("echo", [{"role": "user", "content": "hi"}], 1, "tok")
+    [error] = events_of(stream, "error")
+    assert "budget" in error["error"]
+    assert len(backend.released) == 1
+    assert not user_agent_processes
+
+
+def test_tokens_are_coalesced_and_flushed_before_other_events(backend, monkeypatch):
+    frames = [(protocol.TOKEN, "Hel"), (protocol.TOKEN, "lo"), (protocol.MESSAGE, "aside"),
+              (protocol.TOKEN, "!"), (protocol.READY,)]
+    monkeypatch.setattr(backend, "acquire", lambda *args, **kwargs: asyncio.sleep(0, FrameWorker("w1", frames)))
+    monkeypatch.setattr(agent_manager, "TokenCoalescer", lambda: TokenCoalescer(window_ms=10000, max_chars=100))
+
+    stream = run_stream("echo", [{"role": "user", "content": "hi"}], 100, "tok")
+    content = [e for e in stream if e.startswith(("data: ", "event: new_message"))]
+    # One event per batch, in order, and the last batch goes out when the turn ends
+    assert content == [data_event("Hello"), new_message_event("aside"), data_event("!")]
@@ -0,0 +1,73 @@
+# backend/tests/test_auth.py
+
+import time
+import asyncio
+import logging
+import auth
+from auth import issue_token, verify_token, handle_logout, quota, client_id, QUOTA_TIERS
+from auth import gateway_key, verify_gateway_key
+
+logger = logging.getLogger(__name__)
+
+
+def test_issued_token_verifies():
+    token, claims = issue_token("alice", "pro", 60)
+    assert verify_token(token) == claims
+    assert claims["sub"] == "alice" and claims["tier"] == "pro"
+    assert quota(claims) == QUOTA_TIERS["pro"]
+
+
+def test_tampered_and_malformed_tokens_are_rejected():
+    token, claims = issue_token("alice", "free", 60)
+    payload, _, signature = token.partition(".")
+    forged, _ = issue_token("mallory", "pro", 60)
+    assert verify_token(forged.partition(".")[0] + "." + signature) is None
+    assert verify_token(payload + "." + signature[:-1] + ("A" if signature[-1] != "A" else "B")) is None
+    for garbage in ("", "abc", ".", "abc.def", payload, "é.ü"):
+        assert verify_token(garbage) is None
+
+
+def test_expired_token_is_rejected():
+    token, _ = issue_token("alice", "standard", -1)
+    assert verify_token(token) is None
+
+
+def test_unknown_tier_gets_standard_quota():
+    assert quota({"tier": "platinum"}) == QUOTA_TIERS["standard"]
+
+
+def test_each_login_is_its_own_client():
+    _, first = issue_token("user", "standard", 60)
+    _, second = issue_token("user", "standard", 60)
+    assert client_id(first) != client_id(second)
+    assert client_id(first) == client_id(dict(first))
+
+
+def test_gateway_key_is_checked():
+    assert verify_gateway_key(f"Bearer {gateway_key()}")
+    token, _ = issue_token("user", "standard", 60)
+    for header in (None, "", f"Bearer {token}", f"Basic {gateway_key()}", "Bearer " + gateway_key()[:-1]):
+        assert not verify_gateway_key(header)
+
+
+def test_logout_revokes_only_that_token():
+    token, claims = issue_token("alice", "standard", 60)
+    other, _ = issue_token("alice", "standard", 60)
+    asyncio.run(handle_logout(claims, logger))
+    assert verify_token(token) is None
+    assert verify_token(other) is not None
+
+
+def test_revocations_synced_from_the_store_apply():
+    token, claims = issue_token("alice", "standard", 60)
+    auth._revoked_shared = {claims["jti"]}
+    try:
+        assert verify_token(token) is None
+    finally:
+        auth._revoked_shared = set()
+
+
+def test_expired_revocations_are_forgotten():
+    auth._revoked_here["old"] = time.time() - 1
+    auth.forget_expired(time.time())
+    assert "old" not in auth._revoked_here
@@ -0,0 +1,110 @@
+# backend/tests/test_completion_cache.py
+
+import os
+import time
+import threading
+from agent_runtime import completion_cache
+from agent_runtime.completion_cache import CompletionCache, completion_key, get_cache, is_deterministic
+
+
+def age(cache, key, seconds):
+    """Pretend the entry was last used that long ago"""
+    past = time.time() - seconds
+    os.utime(cache._path(key), (past, past))
+
+
+def put_and_wait(cache, key):
+    """Put an entry and wait for the sweep it may have started in a thread of its own"""
+    before = set(threading.enumerate())
+    cache.put(key, [])
+    for thread in set(threading.enumerate()) - before:
+        thread.join(5)
+
+
+def test_only_greedy_single_completions_are_cached():
+    assert is_deterministic(0, 1) and is_deterministic(None, 1)
+    assert not is_deterministic(0.7, 1) and not is_deterministic(0, 2)
+    assert completion_key(model="m", messages=[1]) == completion_key(messages=[1], model="m")
+    assert completion_key(model="m", messages=[1]) != completion_key(model="m", messages=[2])
+
+
+def test_memory_tier_evicts_the_least_recently_used():
+    cache = CompletionCache(max_entries=2)
+    cache.put("a", ["A"])
+    cache.put("b", ["B"])
+    assert cache.get("a") == ["A"]
+    cache.put("c", ["C"])
+    assert list(cache.entries) == ["a", "c"]
+    assert cache.get("b") is None and cache.get("c") == ["C"]
+
+
+def test_disk_tier_is_shared_between_processes(tmp_path):
+    writer = CompletionCache(str(tmp_path))
+    writer.put("ab12", ["Hel", "lo"])
+    assert (tmp_path / "ab" / "ab12.json").exists()
+    assert not [name for name in os.listdir(tmp_path / "ab") if name.endswith(".tmp")]
+
+    # A worker that never saw the entry reads it from disk and keeps it in memory
+    reader = CompletionCache(str(tmp_path))
+    assert reader.get("ab12") == ["Hel", "lo"]
+    assert list(reader.entries) == ["ab12"]
+    assert reader.get("cd34") is None
+
+    # A corrupt file is a miss, not an error
+    (tmp_path / "cd").mkdir()
+    (tmp_path / "cd" / "cd34.json").write_text("{")
+    assert reader.get("cd34") is None
+
+
+def test_sweep_drops_entries_unused_for_the_ttl(tmp_path):
+    cache = CompletionCache(str(tmp_path), ttl=3600)
+    for key in ("aa01", "aa02", "aa03"):
+        cache.put(key, [key])
+    age(cache, "aa01", 7200)
+    age(cache, "aa02", 7200)
+    # Reading an entry counts as using it
+    CompletionCache(str(tmp_path)).get("aa02")
+    (tmp_path / "aa" / "left.tmp").write_text("")
+    os.utime(tmp_path / "aa" / "left.tmp", (0, 0))
+
+    cache.sweep()
+    assert sorted(os.listdir(tmp_path / "aa")) == ["aa02.json", "aa03.json"]
+
+
+def test_sweep_keeps_the_disk_tier_under_its_byte_cap(tmp_path):
+    cache = CompletionCache(str(tmp_path), max_bytes=0)
+    for i, key in enumerate(("bb01", "bb02", "bb03", "bb04")):
+        cache.put(key, ["x" * 100])
+        age(cache, key, 100 - i)
+    size = os.path.getsize(cache._path("bb01"))
+
+    cache.max_bytes = 2 * size
+    cache.sweep()
+    assert sorted(os.listdir(tmp_path / "bb")) == ["bb03.json", "bb04.json"]
+
+
+def test_one_sweep_per_interval_across_writers(tmp_path, monkeypatch):
+    swept = []
+    monkeypatch.setattr(CompletionCache, "sweep", lambda self: swept.append(self))
+    first, second = CompletionCache(str(tmp_path), ttl=60), CompletionCache(str(tmp_path), ttl=60)
+    put_and_wait(first, "cc01")
+    put_and_wait(second, "cc02")
+    assert swept == [first]
+
+    os.utime(tmp_path / completion_cache.SWEEP_MARKER, (0, 0))
+    put_and_wait(second, "cc03")
+    assert swept == [first, second]
+
+    # Without limits the directory is never swept
+    put_and_wait(CompletionCache(str(tmp_path)), "cc04")
+    assert len(swept) == 2
+
+
+def test_caches_are_shared_per_settings(monkeypatch, tmp_path):
+    monkeypatch.setattr(completion_cache, "_caches", {})
+    settings = {"dir": str(tmp_path), "entries": 8, "max_bytes": 2 ** 20, "ttl": 60}
+    cache = get_cache(settings)
+    assert get_cache(dict(settings)) is cache
+    assert (cache.max_entries, cache.max_bytes, cache.ttl) == (8, 2 ** 20, 60)
+    assert get_cache({**settings, "ttl": 0}) is not cache
+    assert get_cache(None) is None
@@ -0,0 +1,72 @@
+# backend/tests/test_container_pool.py
+
+import asyncio
+import pytest
+from docker_hosts import DockerHost
+from container_pool import ContainerPool
+from placement import CpuPlacer
+from resources import ResourceProfile
+from fake_docker import FakeDocker
+
+AGENT = "env.mark_done()\n"
+
+
+@pytest.fixture
+def files(tmp_path):
+    entrypoint = tmp_path / "echo.py"
+    entrypoint.write_text(AGENT)
+    (tmp_path / "deps" / "site").mkdir(parents=True)
+    return str(tmp_path / "deps"), str(entrypoint)
+
+
+def run_with_pool(tmp_path, files, test, **options):
+    async def main():
+        docker = FakeDocker(volume_dir=str(tmp_path / "volumes"))
+        socket_path = str(tmp_path / "docker.sock")
+        server = await asyncio.start_unix_server(docker.handle, socket_path)
+        host = DockerHost(f"unix://{socket_path}")
+        host.placer = CpuPlacer({0: ([0, 1], None)}, overcommit=1.0)
+        deps_dir, entrypoint = files
+        pool = ContainerPool(host, "echo", "python:3.9-slim", deps_dir, entrypoint,
+                             ResourceProfile(cpus=1), **options)
+        async with server:
+            try:
+                await asyncio.wait_for(test(docker, host, pool), 30)
+            finally:
+                await pool.close()
+    asyncio.run(main())
+
+
+async def exit_container(docker, container):
+    """Make the agent exit on its own, as a single-use worker does"""
+    docker.containers[container.id]["process"].kill()
+    await asyncio.wait_for(container.stream.closed.wait(), 10)
+
+
+def test_exited_container_gives_back_its_cpus(tmp_path, files):
+    async def test(docker, host, pool):
+        for _ in range(4):
+            container = await pool.acquire()
+            assert host.containers == 1 and host.placer.reservations() == {0: 1.0}
+            await exit_container(docker, container)
+            await pool.release(container)
+            assert host.containers == 0 and host.reserved_cpus == 0
+            assert host.placer.reservations() == {}
+            assert pool.live == 0
+    run_with_pool(tmp_path, files, test, min_size=0, max_size=1)
+
+
+def test_container_dead_while_idle_gives_back_its_cpus(tmp_path, files):
+    async def test(docker, host, pool):
+        pool.schedule_refill()
+        while not pool.idle:
+            await asyncio.sleep(0.01)
+        await exit_container(docker, pool.idle[0])
+
+        container = await pool.acquire()
+        # Only the replacement holds a CPU
+        assert host.containers == 1
+        assert sum(host.placer.reservations().values()) == 1.0
+        assert container.is_alive()
+        await pool.release(container)
+    run_with_pool(tmp_path, files, test, min_size=1, max_size=1)
@@ -0,0 +1,100 @@
+# backend/tests/test_dependency_cache.py
+
+import os
+import sys
+import asyncio
+import subprocess
+import importlib.util
+import pytest
+import dependency_cache
+from dependency_cache import (
+    _build_cache_entry, _run_dependency_build, ensure_runtime_bytecode, published_dependency_dir,
+    COMPLETE_MARKER, RUNTIME_DIR
+)
+
+
+class FakeBuildClient:
+    """Stands in for the build container: installs nothing, slowly, and compiles with this interpreter"""
+
+    def __init__(self):
+        self.builds = 0
+        self.python_version = "3.9.18"
+
+    async def inspect_image(self, image):
+        return {"Id": "sha256:abc", "Config": {"Env": [f"PYTHON_VERSION={self.python_version}"]}}
+
+    async def run_container(self, config):
+        self.builds += 1
+        staging_dir = config["HostConfig"]["Binds"][0].split(":")[0]
+        await asyncio.sleep(0.05)
+        if config["Cmd"][0] == "python":
+            args = [arg.replace("/deps", staging_dir) for arg in config["Cmd"][1:]]
+            result = subprocess.run([sys.executable, *args], capture_output=True, text=True)
+            return result.returncode, result.stdout + result.stderr
+        os.makedirs(os.path.join(staging_dir, "site"))
+        return 0, ""
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    client = FakeBuildClient()
+    monkeypatch.setattr(dependency_cache, "DEPS_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(dependency_cache, "build_host", lambda: type("Host", (), {"client": client}))
+    monkeypatch.setattr(dependency_cache, "ready_dependency_dirs", {})
+    monkeypatch.setattr(dependency_cache, "image_python_versions", {})
+    return client
+
+
+def build(key):
+    return _build_cache_entry(key, lambda: _run_dependency_build(key, ["pkg==1"], "image"))
+
+
+def test_concurrent_builds_of_a_key_run_once(tmp_path, client):
+    async def main():
+        # Two processes would each run their own build task; the lock file serializes them
+        return await asyncio.gather(*[build("k1") for _ in range(2)])
+
+    first, second = asyncio.run(main())
+    assert first == second
+    assert client.builds == 1
+    assert os.path.basename(first).startswith("k1.")
+    assert os.path.islink(tmp_path / "k1")
+    assert published_dependency_dir("k1") == first
+    assert os.path.exists(os.path.join(first, COMPLETE_MARKER))
+
+
+def test_rebuild_never_removes_a_directory_in_use(tmp_path, client):
+    # Left incomplete in place, possibly mounted by a running container
+    legacy = tmp_path / "k2"
+    (legacy / "site").mkdir(parents=True)
+    (legacy / "site" / "module.py").write_text("")
+    assert published_dependency_dir("k2") is None
+
+    cache_dir = asyncio.run(build("k2"))
+    assert published_dependency_dir("k2") == cache_dir
+    moved = [name for name in os.listdir(tmp_path) if name.startswith(".k2.replaced.")]
+    assert len(moved) == 1
+    assert (tmp_path / moved[0] / "site" / "module.py").exists()
+
+
+def test_runtime_is_compiled_once_per_interpreter(client):
+    async def main():
+        return await asyncio.gather(*[ensure_runtime_bytecode("image") for _ in range(3)])
+
+    first, second, third = asyncio.run(main())
+    assert first == second == third
+    assert client.builds == 1
+    assert os.path.basename(first).startswith("runtime-")
+
+    # Every runtime module has bytecode next to the copy containers mount read-only
+    sources = [name for name in os.listdir(RUNTIME_DIR) if name.endswith(".py")]
+    assert sources
+    for name in sources:
+        source = os.path.join(first, "agent_runtime", name)
+        assert os.path.exists(importlib.util.cache_from_source(source))
+
+    # Another interpreter gets its own entry
+    client.python_version = "3.11.9"
+    dependency_cache.image_python_versions.clear()
+    other = asyncio.run(ensure_runtime_bytecode("image"))
+    assert other != first and client.builds == 2
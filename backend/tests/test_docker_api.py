@@ -0,0 +1,131 @@
+# backend/tests/test_docker_api.py
+
+import json
+import struct
+import asyncio
+import pytest
+from docker_api import DockerClient, DockerAPIError, STREAM_STDOUT, STREAM_STDERR
+
+
+class FakeEngine:
+    """Scripted Engine API on a unix socket: one request per connection, like DockerClient sends"""
+
+    def __init__(self):
+        self.requests = []
+        self.stdin = asyncio.Queue()
+
+    async def handle(self, reader, writer):
+        method, target, _ = (await reader.readline()).decode().split(" ", 2)
+        headers = {}
+        while (line := await reader.readline()) not in (b"\r\n", b""):
+            name, _, value = line.decode().partition(":")
+            headers[name.strip().lower()] = value.strip()
+        body = await reader.readexactly(int(headers.get("content-length", 0)))
+        self.requests.append((method, target, headers, body))
+        path = target.split("?")[0]
+
+        if path == "/containers/create":
+            self.respond(writer, 201, json.dumps({"Id": "c1", "Warnings": []}).encode())
+        elif path == "/containers/c1/attach":
+            await self.attach(reader, writer)
+            return
+        elif path == "/info":
+            # Chunked, with a chunk extension and the JSON split mid-token
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nTransfer-Encoding: chunked\r\n\r\n")
+            for chunk in (b'{"NCPU": ', b'8, "MemTotal"', b': 1024}'):
+                writer.write(b"%x;ext=1\r\n%s\r\n" % (len(chunk), chunk))
+            writer.write(b"0\r\n\r\n")
+        elif path == "/containers/gone":
+            self.respond(writer, 404, b'{"message": "No such container: gone"}')
+        else:
+            self.respond(writer, 500, b'{"message": "boom"}')
+        await writer.drain()
+        writer.close()
+
+    @staticmethod
+    def respond(writer, status, body):
+        writer.write(b"HTTP/1.1 %d X\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n%s"
+                     % (status, len(body), body))
+
+    async def attach(self, reader, writer):
+        writer.write(b"HTTP/1.1 101 UPGRADED\r\nContent-Type: application/vnd.docker.raw-stream\r\n"
+                     b"Connection: Upgrade\r\nUpgrade: tcp\r\n\r\n")
+        # Multiplexed frames: 8-byte header (stream, 0, 0, 0, size), the first one split across writes
+        out = struct.pack(">BxxxI", STREAM_STDOUT, 6) + b"hello\n"
+        writer.write(out[:5])
+        await writer.drain()
+        writer.write(out[5:])
+        writer.write(struct.pack(">BxxxI", STREAM_STDERR, 5) + b"oops\n")
+        writer.write(struct.pack(">BxxxI", STREAM_STDOUT, 0))
+        await writer.drain()
+        # Echo stdin back on stdout, then hang up
+        line = await reader.readline()
+        await self.stdin.put(line)
+        writer.write(struct.pack(">BxxxI", STREAM_STDOUT, len(line)) + line)
+        await writer.drain()
+        writer.close()
+
+
+def run_with_engine(tmp_path, test):
+    async def main():
+        engine = FakeEngine()
+        path = str(tmp_path / "docker.sock")
+        server = await asyncio.start_unix_server(engine.handle, path)
+        async with server:
+            await test(engine, DockerClient(f"unix://{path}"))
+    asyncio.run(main())
+
+
+def test_create_container_sends_json_body(tmp_path):
+    async def test(engine, client):
+        assert client.is_local
+        assert await client.create_container({"Image": "agent"}, name="agent-1") == "c1"
+        method, target, headers, body = engine.requests[0]
+        assert (method, target) == ("POST", "/containers/create?name=agent-1")
+        assert headers["content-type"] == "application/json"
+        assert json.loads(body) == {"Image": "agent"}
+    run_with_engine(tmp_path, test)
+
+
+def test_attach_upgrades_and_demultiplexes(tmp_path):
+    async def test(engine, client):
+        stream = await client.attach("c1")
+        _, target, headers, _ = engine.requests[0]
+        assert target.startswith("/containers/c1/attach?")
+        assert "stdin=1" in target and "stream=1" in target
+        assert headers["upgrade"] == "tcp"
+        assert await stream.stdout.readline() == b"hello\n"
+        assert await stream.stderr.readline() == b"oops\n"
+
+        await stream.write(b"ping\n")
+        assert await engine.stdin.get() == b"ping\n"
+        assert await stream.stdout.readline() == b"ping\n"
+        # Daemon hung up: both streams end
+        await asyncio.wait_for(stream.closed.wait(), 5)
+        assert await stream.stdout.read() == b""
+        assert await stream.stderr.read() == b""
+        await stream.close()
+    run_with_engine(tmp_path, test)
+
+
+def test_chunked_body_is_reassembled(tmp_path):
+    async def test(engine, client):
+        assert await client.info() == {"NCPU": 8, "MemTotal": 1024}
+    run_with_engine(tmp_path, test)
+
+
+def test_errors_carry_status_and_message(tmp_path):
+    async def test(engine, client):
+        with pytest.raises(DockerAPIError) as error:
+            await client.start_container("c2")
+        assert error.value.status == 500
+        assert error.value.message == "boom"
+        # Removing a container that is already gone is not an error
+        await client.remove_container("gone")
+    run_with_engine(tmp_path, test)
+
+
+def test_tcp_endpoint_parsing():
+    client = DockerClient("tcp://10.0.0.2:2375")
+    assert client.address == ("10.0.0.2", 2375)
+    assert not client.is_local
@@ -0,0 +1,52 @@
+# backend/tests/test_docker_hosts.py
+
+import asyncio
+from agent_runtime import protocol
+from docker_hosts import DockerHost
+from container_pool import ContainerPool, ENTRYPOINT_MOUNT
+from fake_docker import FakeDocker
+
+AGENT = """
+env.add_reply("pong " + env.list_messages()[-1]["content"])
+env.mark_done()
+"""
+
+
+def test_session_on_a_remote_host(tmp_path):
+    """Files reach a tcp:// daemon through volumes and the runtime finds the agent where it expects it"""
+    entrypoint = tmp_path / "entrypoint_cache" / "echo-0123456789abcdef.py"
+    entrypoint.parent.mkdir()
+    entrypoint.write_text(AGENT)
+    (tmp_path / "deps" / "site").mkdir(parents=True)
+
+    async def main():
+        docker = FakeDocker(volume_dir=str(tmp_path / "volumes"))
+        server = await asyncio.start_server(docker.handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        host = DockerHost(f"tcp://127.0.0.1:{port}")
+        assert not host.is_local
+
+        pool = ContainerPool(host, "echo", "python:3.9-slim", str(tmp_path / "deps"), str(entrypoint), min_size=0)
+        async with server:
+            worker = await pool.acquire()
+            config = next(iter(docker.containers.values()))["config"]
+            assert config["Cmd"][-1] == ENTRYPOINT_MOUNT
+            # The agent gets a directory of its own, the image's /app is not hidden
+            assert not any(bind.split(":")[1] == "/app" for bind in config["HostConfig"]["Binds"])
+            assert any(bind.endswith(":/opt/agent-entrypoint:ro") for bind in config["HostConfig"]["Binds"])
+
+            await worker.send_job({"messages": [{"role": "user", "content": "ping"}],
+                                   "config": {"api_base_url": "http://127.0.0.1:9/v1"}})
+            frames = []
+            while True:
+                kind, payload = await asyncio.wait_for(worker.read_frame(), 30)
+                if kind == protocol.READY:
+                    break
+                frames.append((kind, payload))
+            assert (protocol.MESSAGE, b"pong ping") in frames
+            assert (protocol.DONE, b"") in frames
+
+            await pool.release(worker)
+            assert host.containers == 0
+            assert not docker.containers
+    asyncio.run(main())
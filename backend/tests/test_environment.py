@@ -0,0 +1,86 @@
+# backend/tests/test_environment.py
+
+import asyncio
+from agent_runtime.environment import Environment
+from fake_llm import FakeLLM
+
+
+class RecordingChannel:
+    """Collects what the Environment would send as frames"""
+
+    def __init__(self):
+        self.frames = []
+        # Completions the backend counts without seeing them as tokens
+        self.counted = []
+
+    def token(self, text):
+        self.frames.append(("token", text))
+
+    def message(self, text):
+        self.frames.append(("message", text))
+
+    def generated(self, text):
+        self.counted.append(text)
+
+    def log(self, text):
+        pass
+
+
+def run_with_llm(test):
+    async def main():
+        server = await asyncio.start_server(FakeLLM(tokens=64, token_rate=500).handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        channel = RecordingChannel()
+        env = Environment(api_base_url=f"http://127.0.0.1:{port}/v1", auth_token="test", default_model="fake",
+                          channel=channel)
+        async with server:
+            await test(env, channel)
+    asyncio.run(main())
+
+
+def test_single_call_streams_into_the_reply():
+    async def test(env, channel):
+        reply = await env.acompletion([{"role": "user", "content": "hi"}], max_tokens=4)
+        assert reply == " tok0 tok1 tok2 tok3"
+        assert channel.frames == [("token", f" tok{i}") for i in range(4)]
+        assert env.current_reply == reply
+    run_with_llm(test)
+
+
+def test_concurrent_calls_get_their_own_bubbles():
+    async def test(env, channel):
+        messages = [{"role": "user", "content": "hi"}]
+        # The short call finishes while the long one is still streaming
+        long_reply, short_reply = await asyncio.gather(
+            env.acompletion(messages, max_tokens=20), env.acompletion(messages, max_tokens=3)
+        )
+        tokens = [text for kind, text in channel.frames if kind == "token"]
+        assert "".join(tokens) == long_reply
+        # Sent as a separate message once the streamed reply is complete
+        assert channel.frames[-1] == ("message", short_reply)
+        assert channel.frames[:-1] == [("token", text) for text in tokens]
+        assert env.current_reply == long_reply
+        assert channel.counted == [short_reply]
+
+        # With nothing in flight any more, the next call streams again
+        channel.frames.clear()
+        await env.acompletion(messages, max_tokens=2)
+        assert channel.frames == [("token", " tok0"), ("token", " tok1")]
+    run_with_llm(test)
+
+
+def test_several_choices_are_separate_messages():
+    async def test(env, channel):
+        replies = await env.acompletion([{"role": "user", "content": "hi"}], n=3, max_tokens=2)
+        assert replies == [" tok0 tok1"] * 3
+        assert channel.frames == [("message", " tok0 tok1")] * 3
+        assert channel.counted == [" tok0 tok1"] * 3
+    run_with_llm(test)
+
+
+def test_returned_only_calls_are_reported_as_generated():
+    async def test(env, channel):
+        reply = await env.acompletion([{"role": "user", "content": "hi"}], stream=False, max_tokens=3)
+        assert channel.frames == []
+        assert channel.counted == [reply]
+    run_with_llm(test)
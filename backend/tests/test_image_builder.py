@@ -0,0 +1,82 @@
+# backend/tests/test_image_builder.py
+
+import asyncio
+import pytest
+import image_builder
+from docker_hosts import DockerHost
+from image_builder import ensure_agent_image, agent_image_tag, prebuild_agent_images
+from fake_docker import FakeDocker
+
+
+class CountingDocker(FakeDocker):
+    """Fake daemon that remembers how many builds ran at the same time"""
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.building = 0
+        self.max_building = 0
+
+    async def _route(self, method, parts, query, body):
+        if parts[0] != "build":
+            return await super()._route(method, parts, query, body)
+        self.building += 1
+        self.max_building = max(self.max_building, self.building)
+        try:
+            return await super()._route(method, parts, query, body)
+        finally:
+            self.building -= 1
+
+
+@pytest.fixture
+def agents(tmp_path, monkeypatch):
+    for name in ("a", "b", "c", "d"):
+        (tmp_path / "agents" / name).mkdir(parents=True)
+        (tmp_path / "agents" / name / "Dockerfile").write_text("FROM python:3.9-slim\n")
+        (tmp_path / "agents" / name / "agent.py").write_text(f"env.add_reply('{name}')\n")
+    monkeypatch.setattr(image_builder, "AGENTS_DIR", str(tmp_path / "agents"))
+    monkeypatch.setattr(image_builder, "known_images", set())
+    monkeypatch.setattr(image_builder, "pending_builds", {})
+    monkeypatch.setattr(image_builder, "context_hashes", {})
+    monkeypatch.setattr(image_builder, "_build_slots", None)
+    return tmp_path / "agents"
+
+
+def run_with_docker(tmp_path, test, **options):
+    async def main():
+        docker = CountingDocker(**options)
+        socket_path = str(tmp_path / "docker.sock")
+        server = await asyncio.start_unix_server(docker.handle, socket_path)
+        async with server:
+            await asyncio.wait_for(test(docker, DockerHost(f"unix://{socket_path}")), 30)
+    asyncio.run(main())
+
+
+def test_concurrent_requests_for_a_tag_share_one_build(tmp_path, agents):
+    async def test(docker, host):
+        images = await asyncio.gather(*[ensure_agent_image("a", host) for _ in range(5)])
+        assert set(images) == {agent_image_tag("a")}
+        assert docker.stats["builds"] == 1
+        assert {images[0], "agent-a:latest"} <= docker.images
+        assert not image_builder.pending_builds
+
+        # Known afterwards, nothing is asked of the daemon again
+        await ensure_agent_image("a", host)
+        assert docker.stats["builds"] == 1
+
+        # New contents are a new tag and a new build
+        (agents / "a" / "agent.py").write_text("env.add_reply('changed')\n")
+        assert await ensure_agent_image("a", host) != images[0]
+        assert docker.stats["builds"] == 2
+    run_with_docker(tmp_path, test, build_ms=100)
+
+
+def test_builds_are_bounded_by_the_worker_pool(tmp_path, agents, monkeypatch):
+    monkeypatch.setattr(image_builder, "IMAGE_BUILD_WORKERS", 2)
+
+    async def test(docker, host):
+        monkeypatch.setattr(image_builder, "docker_hosts", [host])
+        await prebuild_agent_images()
+        assert docker.stats["builds"] == 4
+        assert docker.max_building == 2
+        assert all(image_builder.has_agent_image(host, agent_image_tag(name)) for name in "abcd")
+    run_with_docker(tmp_path, test, build_ms=100)
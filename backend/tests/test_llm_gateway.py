@@ -0,0 +1,67 @@
+# backend/tests/test_llm_gateway.py
+
+import json
+import asyncio
+from fake_llm import FakeLLM
+from llm_gateway import LLMGateway
+
+
+def run_with_upstream(test, **options):
+    async def main():
+        llm = FakeLLM(**options)
+        server = await asyncio.start_server(llm.handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        gateway = LLMGateway(f"http://127.0.0.1:{port}/v1", auth_token="upstream-key")
+        sent = []
+        send = gateway.client.send
+
+        async def recording_send(request, **kwargs):
+            sent.append(request)
+            return await send(request, **kwargs)
+        gateway.client.send = recording_send
+        try:
+            await test(gateway, llm, sent)
+        finally:
+            await gateway.close()
+            server.close()
+    asyncio.run(main())
+
+
+async def call(gateway, body, traceparent):
+    headers = {"Authorization": "Bearer gateway-key", "Content-Type": "application/json", "traceparent": traceparent}
+    shared = await gateway.forward("POST", "chat/completions", "", headers, body)
+    return shared.status, b"".join([chunk async for chunk in gateway.relay(shared)])
+
+
+def test_identical_requests_in_flight_share_one_upstream_call():
+    body = json.dumps({"model": "m", "messages": [{"role": "user", "content": "hi"}], "max_tokens": 4}).encode()
+
+    async def test(gateway, llm, sent):
+        # Trace context differs per caller and does not keep requests apart
+        results = await asyncio.gather(*(call(gateway, body, f"00-{i:032x}-{i:016x}-01") for i in range(1, 4)))
+        assert llm.stats["completions"] == 1
+        assert gateway.upstream_requests == 1 and gateway.coalesced == 2
+        assert len({content for _, content in results}) == 1
+        assert results[0][0] == 200 and b"tok3" in results[0][1]
+        assert not gateway.in_flight
+
+        # Once the first is complete, the same request goes upstream again
+        await call(gateway, body, "00-" + "f" * 32 + "-" + "f" * 16 + "-01")
+        assert llm.stats["completions"] == 2
+    run_with_upstream(test, latency_ms=100)
+
+
+def test_different_requests_are_not_coalesced():
+    async def test(gateway, llm, sent):
+        bodies = [json.dumps({"model": "m", "messages": [], "max_tokens": n}).encode() for n in (1, 2)]
+        await asyncio.gather(*(call(gateway, body, "") for body in bodies))
+        assert llm.stats["completions"] == 2 and gateway.coalesced == 0
+    run_with_upstream(test, latency_ms=50)
+
+
+def test_upstream_gets_the_real_credential():
+    async def test(gateway, llm, sent):
+        await call(gateway, b'{"messages": []}', "")
+        [request] = sent
+        assert request.headers["authorization"] == "Bearer upstream-key"
+    run_with_upstream(test)
@@ -0,0 +1,109 @@
+# backend/tests/test_local_backend.py
+
+import os
+import asyncio
+import pytest
+from agent_runtime import protocol
+from local_backend import ForkServer
+
+
+def write_agent(tmp_path, code):
+    agent_path = tmp_path / "agent.py"
+    agent_path.write_text(code)
+    return str(agent_path)
+
+
+async def run_turn(worker, content="hi"):
+    """Send one job and collect its frames up to READY, or up to EOF if the worker dies"""
+    await worker.send_job({"messages": [{"role": "user", "content": content}]})
+    frames = []
+    while True:
+        frame = await asyncio.wait_for(worker.read_frame(), 10)
+        if frame is None or frame[0] == protocol.READY:
+            return frames, frame is not None
+        frames.append(frame)
+
+
+def run_with_server(tmp_path, test):
+    async def main():
+        server = ForkServer(str(tmp_path / "fork.sock"))
+        try:
+            await test(server)
+        finally:
+            await server.close()
+    asyncio.run(main())
+
+
+def test_backend_secrets_do_not_reach_agents(tmp_path, monkeypatch):
+    monkeypatch.setenv("TOKEN_SECRET", "signing-key")
+    monkeypatch.setenv("AUTH_TOKEN", "llm-key")
+    agent_path = write_agent(tmp_path, (
+        "import os\n"
+        "env.add_reply(','.join(sorted(os.environ)))\n"
+    ))
+
+    async def test(server):
+        worker = await server.spawn("env", agent_path)
+        frames, _ = await run_turn(worker)
+        [names] = [payload.decode().split(",") for kind, payload in frames if kind == protocol.MESSAGE]
+        assert "TOKEN_SECRET" not in names and "AUTH_TOKEN" not in names
+        # LC_CTYPE is set by the interpreter itself when it coerces the C locale
+        assert set(names) - {"LC_CTYPE"} == {"PATH", "HOME", "PYTHONPATH", "PYTHONWARNINGS"}
+        await worker.destroy()
+    run_with_server(tmp_path, test)
+
+
+def test_forked_worker_streams_turns_and_is_reaped(tmp_path):
+    agent_path = write_agent(tmp_path, (
+        "env.add_reply('seen ' + str(len(env.list_messages())))\n"
+        "env.mark_done()\n"
+    ))
+
+    async def test(server):
+        worker = await server.spawn("echo", agent_path)
+        assert worker.is_alive()
+
+        # The forked child keeps its history across turns
+        for expected in (b"seen 1", b"seen 2"):
+            frames, ready = await run_turn(worker)
+            assert ready
+            assert (protocol.MESSAGE, expected) in frames
+            assert (protocol.DONE, b"") in frames
+
+        await worker.destroy()
+        assert await asyncio.wait_for(worker.stdout.read(), 10) == b""
+        assert not worker.is_alive()
+        # SIGCHLD is ignored in the server, so the kernel reaps the child at once
+        await asyncio.sleep(0.1)
+        assert not os.path.exists(f"/proc/{worker.pid}")
+    run_with_server(tmp_path, test)
+
+
+def test_crashed_worker_reports_its_stderr(tmp_path):
+    agent_path = write_agent(tmp_path, (
+        "import os, sys\n"
+        "print('about to crash', file=sys.stderr, flush=True)\n"
+        "os._exit(3)\n"
+    ))
+
+    async def test(server):
+        worker = await server.spawn("crash", agent_path)
+        frames, ready = await run_turn(worker)
+        assert not ready and not worker.is_alive()
+        assert "about to crash" in await worker.stderr_output()
+
+        # The server is unaffected and forks the next worker
+        other = await server.spawn("echo", write_agent(tmp_path, "env.add_reply('ok')\n"))
+        frames, ready = await run_turn(other)
+        assert ready and (protocol.MESSAGE, b"ok") in frames
+        await other.destroy()
+    run_with_server(tmp_path, test)
+
+
+def test_agent_that_fails_to_compile_is_refused(tmp_path):
+    agent_path = write_agent(tmp_path, "def broken(:\n")
+
+    async def test(server):
+        with pytest.raises(RuntimeError, match="could not start"):
+            await server.spawn("broken", agent_path)
+    run_with_server(tmp_path, test)
@@ -0,0 +1,82 @@
+# backend/tests/test_placement.py
+
+import os
+import sys
+import subprocess
+from placement import CpuPlacer, parse_cpulist, format_cpulist, worker_topology
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+GiB = 2 ** 30
+
+# Two NUMA nodes of four CPUs and 4 GiB each
+TOPOLOGY = {0: ([0, 1, 2, 3], 4 * GiB), 1: ([4, 5, 6, 7], 4 * GiB)}
+
+
+def test_cpulist_round_trip():
+    assert parse_cpulist("0-3,8,10-11\n") == [0, 1, 2, 3, 8, 10, 11]
+    assert format_cpulist([3, 1, 2]) == "1,2,3"
+
+
+def test_fractional_workers_pack_onto_one_cpu():
+    placer = CpuPlacer(TOPOLOGY, overcommit=1.0)
+    first = placer.place(0.5)
+    second = placer.place(0.5)
+    assert first.cpus == second.cpus == [0]
+    assert first.node == 0 and first.share == 0.5
+    assert placer.place(0.5).cpus == [1]
+
+
+def test_worker_stays_within_one_node():
+    placer = CpuPlacer(TOPOLOGY, overcommit=1.0)
+    placer.place(3)
+    # Three CPUs do not fit next to the first worker on node 0
+    placement = placer.place(3)
+    assert placement.node == 1
+    assert all(cpu >= 4 for cpu in placement.cpus)
+    assert placement.cpuset == "4,5,6"
+    assert placer.place(2) is None
+
+
+def test_memory_limits_the_node():
+    placer = CpuPlacer(TOPOLOGY, overcommit=1.0)
+    assert placer.place(1, memory=3 * GiB).node == 0
+    assert placer.place(1, memory=3 * GiB).node == 1
+    assert placer.place(1, memory=3 * GiB) is None
+
+
+def test_release_frees_the_reservation():
+    placer = CpuPlacer(TOPOLOGY, overcommit=1.0)
+    placements = [placer.place(4) for _ in range(2)]
+    assert placer.place(1) is None
+    placer.release(placements[0])
+    assert placer.place(1).node == 0
+    placer.release(placements[1])
+    assert placer.reservations() == {0: 1.0}
+
+
+def test_overcommit_allows_more_shares():
+    placer = CpuPlacer({0: ([0], None)}, overcommit=2.0)
+    assert placer.place(1) and placer.place(1)
+    assert placer.place(1) is None
+
+
+def test_workers_get_disjoint_cpu_slices():
+    slices = [worker_topology(TOPOLOGY, slot, workers=3) for slot in range(3)]
+    assert slices[0] == {0: ([0, 3], 4 * GiB // 3), 1: ([4, 7], 4 * GiB // 3)}
+    assert slices[2] == {0: ([2], 4 * GiB // 3), 1: ([6], 4 * GiB // 3)}
+    cpus = [cpu for nodes in slices for node_cpus, _ in nodes.values() for cpu in node_cpus]
+    assert sorted(cpus) == list(range(8))
+    assert worker_topology(TOPOLOGY, 0, workers=1) is TOPOLOGY
+
+
+def test_sibling_workers_claim_different_slots(tmp_path):
+    env = dict(os.environ, WEB_CONCURRENCY="2", STATE_STORE=f"sqlite:{tmp_path / 'state.db'}", TOKEN_SECRET="s")
+    code = "import sys, placement; print(placement.worker_slot(), flush=True); sys.stdin.read()"
+    workers = [subprocess.Popen([sys.executable, "-c", code], cwd=BACKEND_DIR, env=env, text=True,
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE) for _ in range(2)]
+    try:
+        assert sorted(int(worker.stdout.readline()) for worker in workers) == [0, 1]
+    finally:
+        for worker in workers:
+            worker.communicate("")
@@ -0,0 +1,52 @@
+# backend/tests/test_protocol.py
+
+import pytest
+from agent_runtime.protocol import (
+    FrameDecoder, ProtocolError, encode_frame, HEADER, MAX_FRAME_SIZE, TOKEN, MESSAGE, READY, SPAN
+)
+
+
+def frames(decoder):
+    result = []
+    while True:
+        frame = decoder.next_frame()
+        if frame is None:
+            return result
+        result.append(frame)
+
+
+def test_decodes_frames_split_at_every_byte():
+    data = encode_frame(TOKEN, "héllo") + encode_frame(READY) + encode_frame(MESSAGE, "a\nb")
+    decoder = FrameDecoder()
+    decoded = []
+    for i in range(len(data)):
+        decoder.feed(data[i:i + 1])
+        decoded += frames(decoder)
+    assert decoded == [(TOKEN, "héllo".encode()), (READY, b""), (MESSAGE, b"a\nb")]
+    assert decoder.pending() == 0
+
+
+def test_many_frames_in_one_chunk_and_compaction():
+    decoder = FrameDecoder()
+    for round_ in range(50):
+        decoder.feed(b"".join(encode_frame(TOKEN, f"{round_}-{i}") for i in range(20)))
+        assert [payload for _, payload in frames(decoder)] == [f"{round_}-{i}".encode() for i in range(20)]
+    # Consumed frames do not pile up in the buffer
+    assert len(decoder.buffer) < 20 * 2 * (HEADER.size + 6)
+
+
+def test_partial_frame_waits_for_the_rest():
+    decoder = FrameDecoder()
+    data = encode_frame(SPAN, '{"name": "x"}')
+    decoder.feed(data[:HEADER.size + 3])
+    assert decoder.next_frame() is None
+    assert decoder.pending() == HEADER.size + 3
+    decoder.feed(data[HEADER.size + 3:])
+    assert decoder.next_frame() == (SPAN, b'{"name": "x"}')
+
+
+def test_oversized_length_is_a_protocol_error():
+    decoder = FrameDecoder()
+    decoder.feed(HEADER.pack(TOKEN, MAX_FRAME_SIZE + 1))
+    with pytest.raises(ProtocolError):
+        decoder.next_frame()
@@ -0,0 +1,118 @@
+# backend/tests/test_sandbox_backend.py
+
+import os
+import sys
+import shutil
+import asyncio
+import importlib.util
+import pytest
+import sandbox_backend
+from agent_runtime import protocol
+from resources import ResourceProfile
+from sandbox_backend import sandbox_command, launch_sandbox, RUNTIME_DIR, RUNTIME_MOUNT, CPU_PERIOD
+
+BACKEND_DIR = os.path.dirname(RUNTIME_DIR)
+
+
+def pairs(cmd, flag):
+    return [(cmd[i + 1], cmd[i + 2]) for i, arg in enumerate(cmd) if arg == flag]
+
+
+def test_sandbox_command_binds_only_the_runtime_and_the_agent(monkeypatch):
+    monkeypatch.setattr(sandbox_backend, "COMPLETION_CACHE", False)
+    cmd = sandbox_command("/cache/abc/agent.py")
+    assert cmd[0] == sandbox_backend.SANDBOX_LAUNCHER
+    for flag in ("--unshare-all", "--share-net", "--die-with-parent", "--new-session"):
+        assert flag in cmd
+
+    # Read-only binds: system and interpreter directories, the runtime and the agent, nothing writable
+    assert pairs(cmd, "--ro-bind") == [
+        (RUNTIME_DIR, f"{RUNTIME_MOUNT}/agent_runtime"),
+        ("/cache/abc/agent.py", "/app/entrypoint.py"),
+    ]
+    assert not pairs(cmd, "--bind")
+    assert ("/usr", "/usr") in pairs(cmd, "--ro-bind-try")
+    # The backend's own directory (sources, env file, state) is never visible
+    assert not any(BACKEND_DIR == source or BACKEND_DIR.startswith(source + os.sep)
+                   for source, _ in pairs(cmd, "--ro-bind-try"))
+
+    # Root goes read-only after the binds, then the runtime runs the agent
+    separator = cmd.index("--")
+    assert cmd[separator - 4:separator] == ["--remount-ro", "/", "--chdir", "/app"]
+    assert cmd.index("--remount-ro") > max(i for i, arg in enumerate(cmd) if arg in ("--ro-bind", "--tmpfs"))
+    assert cmd[separator + 1:] == [sys.executable, "-u", "-m", "agent_runtime.runner", "/app/entrypoint.py"]
+
+
+def test_completion_cache_is_the_only_writable_bind(monkeypatch, tmp_path):
+    monkeypatch.setattr(sandbox_backend, "COMPLETION_CACHE", True)
+    monkeypatch.setattr(sandbox_backend, "COMPLETION_CACHE_DIR", str(tmp_path))
+    assert pairs(sandbox_command("/agent.py"), "--bind") == [(str(tmp_path), str(tmp_path))]
+
+
+def test_cgroup_limits_follow_the_profile(monkeypatch, tmp_path):
+    monkeypatch.setattr(sandbox_backend, "SANDBOX_CGROUP_ROOT", str(tmp_path))
+    cgroup_dir = sandbox_backend._create_cgroup("sb-1", ResourceProfile(cpus=1.5, memory=256 * 2 ** 20, pids=32))
+    assert cgroup_dir == str(tmp_path / "sb-1")
+    limits = {name: (tmp_path / "sb-1" / name).read_text() for name in os.listdir(cgroup_dir)}
+    assert limits == {
+        "memory.max": str(256 * 2 ** 20),
+        "cpu.max": f"{int(1.5 * CPU_PERIOD)} {CPU_PERIOD}",
+        "pids.max": "32",
+    }
+
+
+def test_cgroup_falls_back_to_the_sandbox_defaults(monkeypatch, tmp_path):
+    monkeypatch.setattr(sandbox_backend, "SANDBOX_CGROUP_ROOT", str(tmp_path))
+    monkeypatch.setattr(sandbox_backend, "SANDBOX_MEMORY_LIMIT", "")
+    monkeypatch.setattr(sandbox_backend, "SANDBOX_CPUS", 2)
+    monkeypatch.setattr(sandbox_backend, "SANDBOX_PIDS_LIMIT", 0)
+    cgroup_dir = sandbox_backend._create_cgroup("sb-2", ResourceProfile())
+    # Unlimited memory and pids are left at the kernel's default
+    assert os.listdir(cgroup_dir) == ["cpu.max"]
+    assert (tmp_path / "sb-2" / "cpu.max").read_text() == f"{2 * CPU_PERIOD} {CPU_PERIOD}"
+
+
+def test_runtime_is_compiled_once(monkeypatch, tmp_path):
+    runtime_dir = tmp_path / "agent_runtime"
+    shutil.copytree(RUNTIME_DIR, runtime_dir, ignore=shutil.ignore_patterns("__pycache__"))
+    monkeypatch.setattr(sandbox_backend, "RUNTIME_DIR", str(runtime_dir))
+    monkeypatch.setattr(sandbox_backend, "runtime_compiled", False)
+    sandbox_backend.compile_runtime()
+    for source in runtime_dir.glob("*.py"):
+        assert os.path.exists(importlib.util.cache_from_source(str(source)))
+
+    # Later launches do not walk the sources again
+    shutil.rmtree(runtime_dir / "__pycache__")
+    sandbox_backend.compile_runtime()
+    assert not (runtime_dir / "__pycache__").exists()
+
+
+def test_missing_launcher_is_an_error(monkeypatch):
+    monkeypatch.setattr(sandbox_backend, "SANDBOX_LAUNCHER", "no-such-launcher")
+    with pytest.raises(RuntimeError, match="not found"):
+        asyncio.run(launch_sandbox("echo", "/agent.py"))
+
+
+@pytest.mark.skipif(shutil.which(sandbox_backend.SANDBOX_LAUNCHER) is None, reason="bwrap is not installed")
+def test_agent_runs_in_the_sandbox(tmp_path, monkeypatch):
+    monkeypatch.setattr(sandbox_backend, "SANDBOX_CGROUP_ROOT", "")
+    agent_path = tmp_path / "agent.py"
+    agent_path.write_text(
+        "import os\n"
+        "env.add_reply(f\"{os.getcwd()} {os.path.exists('" + BACKEND_DIR + "/config.py')}\")\n"
+    )
+
+    async def main():
+        worker = await launch_sandbox("probe", str(agent_path))
+        try:
+            await worker.send_job({"messages": [{"role": "user", "content": "hi"}]})
+            frames = []
+            while True:
+                frame = await asyncio.wait_for(worker.read_frame(), 10)
+                if frame is None or frame[0] == protocol.READY:
+                    break
+                frames.append(frame)
+            assert (protocol.MESSAGE, b"/app False") in frames
+        finally:
+            await worker.destroy()
+    asyncio.run(main())
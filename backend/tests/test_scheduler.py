@@ -0,0 +1,157 @@
+# backend/tests/test_scheduler.py
+
+import time
+import asyncio
+import pytest
+from fastapi import HTTPException
+from scheduler import AdmissionScheduler, TokenBucket
+
+
+def make_scheduler(**overrides):
+    settings = dict(max_concurrent=1, max_per_user=10, max_per_agent=10, max_queue=100,
+                    queue_timeout=5, user_rate=1000, user_burst=1000)
+    settings.update(overrides)
+    return AdmissionScheduler(**settings)
+
+
+def test_token_bucket_refills_at_rate():
+    bucket = TokenBucket(rate=2, burst=2)
+    assert bucket.take(0.0) == 0
+    assert bucket.take(0.0) == 0
+    assert bucket.take(0.0) == pytest.approx(0.5)
+    # Half a second later one token is back
+    assert bucket.take(0.5) == 0
+    assert bucket.take(0.5) > 0
+
+
+def test_rate_limited_request_gets_429_with_retry_after():
+    async def main():
+        scheduler = make_scheduler(user_rate=0.1, user_burst=1)
+        (await scheduler.admit("alice", "agent")).release()
+        with pytest.raises(HTTPException) as error:
+            await scheduler.admit("alice", "agent")
+        assert error.value.status_code == 429
+        assert error.value.headers["Retry-After"] == "10"
+        # Other users have their own bucket
+        (await scheduler.admit("bob", "agent")).release()
+        assert scheduler.rejected == {"rate_limited": 1}
+    asyncio.run(main())
+
+
+def test_full_queue_is_rejected():
+    async def main():
+        scheduler = make_scheduler(max_queue=1)
+        slot = await scheduler.admit("alice", "agent")
+        waiter = asyncio.create_task(scheduler.admit("bob", "agent"))
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as error:
+            await scheduler.admit("carol", "agent")
+        assert error.value.status_code == 429
+        assert int(error.value.headers["Retry-After"]) >= 1
+        slot.release()
+        (await waiter).release()
+        assert scheduler.running == 0
+    asyncio.run(main())
+
+
+def test_queue_timeout_is_rejected():
+    async def main():
+        scheduler = make_scheduler(queue_timeout=0.01)
+        slot = await scheduler.admit("alice", "agent")
+        with pytest.raises(HTTPException) as error:
+            await scheduler.admit("bob", "agent")
+        assert error.value.status_code == 429
+        assert scheduler.queued == 0
+        slot.release()
+    asyncio.run(main())
+
+
+async def drain_order(scheduler, requests):
+    """Queue requests behind a held slot, then release one at a time and record who ran"""
+    order = []
+    holder = await scheduler.admit("holder", "agent")
+
+    async def run(user, priority, weight):
+        slot = await scheduler.admit(user, "agent", priority=priority, weight=weight)
+        order.append(user)
+        await asyncio.sleep(0)
+        slot.release()
+
+    tasks = []
+    for request in requests:
+        tasks.append(asyncio.create_task(run(*request)))
+        await asyncio.sleep(0)
+    holder.release()
+    await asyncio.gather(*tasks)
+    return order
+
+
+def test_fair_queuing_interleaves_users():
+    async def main():
+        requests = [("alice", "standard", 1.0)] * 3 + [("bob", "standard", 1.0)] * 3
+        return await drain_order(make_scheduler(), requests)
+    assert asyncio.run(main()) == ["alice", "bob"] * 3
+
+
+def test_weight_gives_a_larger_share():
+    async def main():
+        requests = [("alice", "standard", 2.0)] * 4 + [("bob", "standard", 1.0)] * 2
+        return await drain_order(make_scheduler(), requests)
+    # Virtual start times: alice 0, 0.5, 1, 1.5 and bob 0, 1; ties go to the earlier request
+    assert asyncio.run(main()) == ["alice", "bob", "alice", "alice", "bob", "alice"]
+
+
+def test_priority_class_goes_first():
+    async def main():
+        requests = [("alice", "batch", 1.0), ("bob", "standard", 1.0), ("carol", "interactive", 1.0)]
+        return await drain_order(make_scheduler(), requests)
+    assert asyncio.run(main()) == ["carol", "bob", "alice"]
+
+
+def test_per_user_cap_does_not_block_others():
+    async def main():
+        scheduler = make_scheduler(max_concurrent=2, max_per_user=1)
+        alice = await scheduler.admit("alice", "agent")
+        queued = asyncio.create_task(scheduler.admit("alice", "agent"))
+        await asyncio.sleep(0)
+        # alice's second request waits on her own cap, bob goes past it
+        bob = await asyncio.wait_for(scheduler.admit("bob", "agent"), 1)
+        assert not queued.done()
+        alice.release()
+        (await queued).release()
+        bob.release()
+        assert scheduler.running == 0 and scheduler.queued == 0
+    asyncio.run(main())
+
+
+def test_zero_rate_is_unlimited():
+    async def main():
+        scheduler = make_scheduler(user_rate=0, user_burst=1)
+        for _ in range(5):
+            (await scheduler.admit("alice", "agent")).release()
+        assert not scheduler.rejected
+    asyncio.run(main())
+
+
+def test_idle_users_are_forgotten():
+    async def main():
+        scheduler = make_scheduler(user_rate=1, user_burst=2)
+        slot = await scheduler.admit("alice", "agent")
+        # bob queues behind alice's run and gets a finish tag
+        waiter = asyncio.create_task(scheduler.admit("bob", "agent"))
+        await asyncio.sleep(0)
+        later = time.monotonic() + 10
+
+        # Nothing is dropped while a user is running or queued
+        scheduler._prune(later)
+        assert set(scheduler.buckets) == {"alice", "bob"}
+        assert "bob" in scheduler.last_finish
+
+        slot.release()
+        (await waiter).release()
+        # bob's bucket has not refilled yet
+        scheduler._prune(time.monotonic())
+        assert "bob" in scheduler.buckets
+        scheduler._prune(later)
+        assert not scheduler.buckets and not scheduler.last_finish
+    asyncio.run(main())
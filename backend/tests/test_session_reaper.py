@@ -0,0 +1,92 @@
+# backend/tests/test_session_reaper.py
+
+import asyncio
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from session_reaper import SessionReaper
+
+
+def new_session(name, idle_seconds=0.0):
+    return {"name": name, "lock": asyncio.Lock(),
+            "last_message_time": datetime.now() - timedelta(seconds=idle_seconds)}
+
+
+def make_reaper(idle_ttl=3600, max_sessions=100):
+    stopped = []
+
+    async def stop_session(session):
+        stopped.append(session["name"])
+
+    return SessionReaper(OrderedDict(), stop_session, idle_ttl=idle_ttl, max_sessions=max_sessions), stopped
+
+
+def test_evicts_least_recently_used_idle_session():
+    async def main():
+        reaper, stopped = make_reaper(max_sessions=2)
+        reaper.track("a", new_session("a"))
+        reaper.track("b", new_session("b"))
+        reaper.touch("a")
+        reaper.track("c", new_session("c"))
+        await asyncio.sleep(0)
+        assert list(reaper.sessions) == ["a", "c"]
+        assert stopped == ["b"]
+    asyncio.run(main())
+
+
+def test_never_evicts_a_session_mid_turn():
+    async def main():
+        reaper, stopped = make_reaper(max_sessions=1)
+        busy = new_session("busy")
+        await busy["lock"].acquire()
+        reaper.track("busy", busy)
+        reaper.track("new", new_session("new"))
+        await asyncio.sleep(0)
+        # Over the cap until the turn ends, rather than cutting it off
+        assert list(reaper.sessions) == ["busy", "new"]
+        assert stopped == []
+    asyncio.run(main())
+
+
+def test_reaps_idle_sessions_and_keeps_used_ones():
+    async def main():
+        reaper, stopped = make_reaper(idle_ttl=0.05)
+        reaper.start()
+        reaper.track("idle", new_session("idle"))
+        reaper.track("used", new_session("used"))
+        for _ in range(4):
+            await asyncio.sleep(0.02)
+            reaper.touch("used")
+        await asyncio.sleep(0.02)
+        assert list(reaper.sessions) == ["used"]
+        assert stopped == ["idle"]
+
+        await asyncio.sleep(0.1)
+        assert stopped == ["idle", "used"]
+        await reaper.stop()
+    asyncio.run(main())
+
+
+def test_locked_session_is_not_reaped():
+    async def main():
+        reaper, stopped = make_reaper(idle_ttl=0.01)
+        reaper.start()
+        session = new_session("busy", idle_seconds=10)
+        await session["lock"].acquire()
+        reaper.track("busy", session)
+        await asyncio.sleep(0.05)
+        assert "busy" in reaper.sessions
+        await reaper.stop()
+        # Stopping closes whatever is left
+        assert stopped == ["busy"] and not reaper.sessions
+    asyncio.run(main())
+
+
+def test_replaced_session_is_stopped_not_orphaned():
+    async def main():
+        reaper, stopped = make_reaper()
+        reaper.track("a", new_session("first"))
+        reaper.track("a", new_session("second"))
+        await asyncio.sleep(0)
+        assert reaper.sessions["a"]["name"] == "second"
+        assert stopped == ["first"]
+    asyncio.run(main())
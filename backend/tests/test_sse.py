@@ -0,0 +1,141 @@
+# backend/tests/test_sse.py
+
+import json
+import asyncio
+import pytest
+from types import SimpleNamespace
+from fastapi.testclient import TestClient
+import app
+import sse
+from auth import issue_token
+from sse import collect_events, data_event, new_message_event, parse_event, TokenCoalescer
+
+
+def completion_event(total_chars, usage):
+    return f"event: completion\ndata: {json.dumps({'status': 'complete', 'total_chars': total_chars, 'usage': usage})}\n\n"
+
+
+def error_event(message):
+    return f"event: error\ndata: {json.dumps({'error': message})}\n\n"
+
+
+async def stream(*events):
+    for event in events:
+        yield event
+
+
+def collect(*events):
+    return asyncio.run(collect_events(stream(*events)))
+
+
+def test_events_are_aggregated_in_order():
+    usage = {"prompt_tokens": 5, "completion_tokens": 3, "total_tokens": 8}
+    result = collect(
+        "event: debug\ndata: Starting agent echo with 1 messages\n\n",
+        data_event("Hello"),
+        data_event(", world\n"),
+        new_message_event("second"),
+        'event: tool\ndata: {"name": "search", "data": {"q": "x"}}\n\n',
+        new_message_event("third"),
+        # The agent's DONE and the end of the stream both report completion
+        completion_event(20, usage),
+        completion_event(26, usage),
+    )
+    assert result["content"] == "Hello, world\n"
+    assert result["messages"] == [{"role": "assistant", "content": "second"},
+                                  {"role": "assistant", "content": "third"}]
+    assert result["tool_events"] == [{"name": "search", "data": {"q": "x"}}]
+    assert result["errors"] == []
+    assert result["usage"] == {**usage, "total_chars": 26, "data_events": 2, "messages": 2}
+    assert result["timings"]["first_output_ms"] is not None
+
+
+def test_errors_are_collected_and_do_not_count_as_output():
+    result = collect(error_event("Agent error: boom"), "event: error\ndata: plain text\n\n")
+    assert result["errors"] == ["Agent error: boom", "plain text"]
+    assert result["content"] == "" and result["messages"] == []
+    assert result["timings"]["first_output_ms"] is None
+    assert result["usage"] == {"total_chars": 0, "data_events": 0, "messages": 0}
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    (tmp_path / "agents" / "echo").mkdir(parents=True)
+    (tmp_path / "agents" / "echo" / "agent.py").write_text("")
+    monkeypatch.chdir(tmp_path)
+    token, _ = issue_token("user", "standard", 60)
+
+    def post(events):
+        async def fake_stream(agent_name, messages, max_tokens=4000, token=None, trace=None):
+            for event in events:
+                yield event
+        monkeypatch.setattr(app, "stream_from_agent", fake_stream)
+        return TestClient(app.app).post(
+            "/chat/completions",
+            json={"agent_name": "echo", "messages": [{"role": "user", "content": "hi"}], "stream": False},
+            headers={"Authorization": f"Bearer {token}"},
+        )
+    return post
+
+
+def test_non_streaming_request_returns_one_body(client):
+    usage = {"prompt_tokens": 2, "completion_tokens": 1, "total_tokens": 3}
+    response = client([data_event("hi there"), error_event("tool failed"), completion_event(8, usage)])
+    assert response.status_code == 200
+    body = response.json()
+    assert body["agent_name"] == "echo"
+    assert body["content"] == "hi there"
+    # An error next to output is reported in the body, not as a failed request
+    assert body["errors"] == ["tool failed"]
+    assert body["usage"]["total_tokens"] == 3
+    assert body["timings"]["queued_ms"] >= 0
+
+
+def test_non_streaming_request_with_only_errors_is_a_502(client):
+    response = client([error_event("Agent worker exited: killed"), completion_event(0, {})])
+    assert response.status_code == 502
+    assert response.json()["detail"] == "Agent worker exited: killed"
+
+
+def test_content_events_match_json_dumps():
+    for text in ("plain", 'quote " and \\ backslash', "line\nbreak\ttab", "ünïcödé ✓ \U0001f600"):
+        assert data_event(text) == f"data: {json.dumps({'content': text})}\n\n"
+        assert new_message_event(text) == f"event: new_message\ndata: {json.dumps({'content': text})}\n\n"
+        assert parse_event(data_event(text)) == ("message", {"content": text})
+
+
+def test_tokens_are_held_within_the_window():
+    coalescer = TokenCoalescer(window_ms=10000, max_chars=100)
+    assert coalescer.flush() is None
+    assert coalescer.add("Hel") is None
+    assert coalescer.add("lo") is None
+    assert 0 < coalescer.remaining() <= 10
+    assert coalescer.flush() == data_event("Hello")
+    # Nothing left for the final flush
+    assert coalescer.flush() is None and coalescer.chars == 0
+
+
+def test_batch_goes_out_once_it_reaches_max_chars():
+    coalescer = TokenCoalescer(window_ms=10000, max_chars=5)
+    assert coalescer.add("abc") is None
+    assert coalescer.add("de") == data_event("abcde")
+    # The next batch starts empty, with a fresh window
+    assert coalescer.add("f") is None
+    assert coalescer.flush() == data_event("f")
+
+
+def test_batch_goes_out_once_its_window_ran_out(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(sse, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    coalescer = TokenCoalescer(window_ms=20, max_chars=100)
+    assert coalescer.add("a") is None
+    now[0] += 0.015
+    assert coalescer.add("b") is None
+    assert coalescer.remaining() == pytest.approx(0.005)
+    now[0] += 0.006
+    assert coalescer.add("c") == data_event("abc")
+
+
+def test_zero_window_sends_every_token():
+    coalescer = TokenCoalescer(window_ms=0, max_chars=100)
+    assert [coalescer.add(token) for token in ("a", "b")] == [data_event("a"), data_event("b")]
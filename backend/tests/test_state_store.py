@@ -0,0 +1,177 @@
+# backend/tests/test_state_store.py
+
+import time
+import asyncio
+import logging
+import pytest
+import auth
+from auth import issue_token, verify_token, handle_logout
+from state_store import MemoryStore, SQLiteStore, RedisStore, StateStoreError, open_store
+
+logger = logging.getLogger(__name__)
+
+
+class FakeRedis:
+    """The RESP commands RedisStore uses, with PX expiry and sorted sets"""
+
+    def __init__(self, password=None):
+        self.password = password
+        self.data = {}
+        self.sorted_sets = {}
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                args = []
+                for _ in range(int(line[1:-2])):
+                    size = int((await reader.readline())[1:-2])
+                    args.append((await reader.readexactly(size + 2))[:-2])
+                writer.write(self.command(args[0].upper().decode(), args[1:]))
+                await writer.drain()
+        finally:
+            writer.close()
+
+    def _get(self, key):
+        value, expires_at = self.data.get(key, (None, None))
+        if expires_at is not None and expires_at <= time.time():
+            del self.data[key]
+            return None
+        return value
+
+    @staticmethod
+    def _bulk(value):
+        return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def command(self, name, args):
+        if name == "AUTH":
+            return b"+OK\r\n" if args[0].decode() == self.password else b"-WRONGPASS invalid password\r\n"
+        if name == "GET":
+            return self._bulk(self._get(args[0]))
+        if name == "MGET":
+            return b"*%d\r\n" % len(args) + b"".join(self._bulk(self._get(key)) for key in args)
+        if name == "SET":
+            expires_at = time.time() + int(args[3]) / 1000 if len(args) > 3 else None
+            self.data[args[0]] = (args[1], expires_at)
+            return b"+OK\r\n"
+        if name == "DEL":
+            return b":%d\r\n" % (self.data.pop(args[0], None) is not None)
+        if name == "ZADD":
+            self.sorted_sets.setdefault(args[0], {})[args[2]] = float(args[1])
+            return b":1\r\n"
+        if name == "ZREMRANGEBYSCORE":
+            members = self.sorted_sets.get(args[0], {})
+            gone = [m for m, score in members.items() if score <= float(args[2])]
+            for member in gone:
+                del members[member]
+            return b":%d\r\n" % len(gone)
+        if name == "ZRANGEBYSCORE":
+            members = [m for m, score in self.sorted_sets.get(args[0], {}).items() if score >= float(args[1])]
+            return b"*%d\r\n" % len(members) + b"".join(self._bulk(m) for m in members)
+        return b"-ERR unknown command\r\n"
+
+
+def run_with_stores(kind, tmp_path, test):
+    """Run test(first, second) with two stores sharing one backing store, as two processes would"""
+    async def main():
+        server = None
+        if kind == "memory":
+            first = second = MemoryStore()
+        elif kind == "sqlite":
+            first, second = (SQLiteStore(str(tmp_path / "state.db")) for _ in range(2))
+        else:
+            server = await asyncio.start_server(FakeRedis("secret").handle, "127.0.0.1", 0)
+            url = f"redis://:secret@127.0.0.1:{server.sockets[0].getsockname()[1]}/0"
+            first, second = RedisStore(url), RedisStore(url)
+        try:
+            await test(first, second)
+        finally:
+            await first.close()
+            await second.close()
+            if server:
+                server.close()
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("kind", ["memory", "sqlite", "redis"])
+def test_set_get_delete(kind, tmp_path):
+    async def test(first, second):
+        assert await first.get("missing") is None
+        await first.set("session:a", {"owner": "w1", "messages": 3})
+        await first.set("session:b", ["x"])
+        assert await second.get("session:a") == {"owner": "w1", "messages": 3}
+        assert await second.get_many(["session:b", "missing", "session:a"]) == [["x"], None, {"owner": "w1", "messages": 3}]
+        assert await second.get_many([]) == []
+        await second.delete("session:a")
+        assert await first.get("session:a") is None
+    run_with_stores(kind, tmp_path, test)
+
+
+@pytest.mark.parametrize("kind", ["memory", "sqlite", "redis"])
+def test_entries_expire(kind, tmp_path):
+    async def test(first, second):
+        await first.set("short", 1, ttl=0.05)
+        await first.set("long", 2, ttl=60)
+        assert await second.get("short") == 1
+        await asyncio.sleep(0.1)
+        assert await second.get_many(["short", "long"]) == [None, 2]
+    run_with_stores(kind, tmp_path, test)
+
+
+@pytest.mark.parametrize("kind", ["memory", "sqlite", "redis"])
+def test_set_members_expire_on_their_own(kind, tmp_path):
+    async def test(first, second):
+        await first.add_member("revoked", "a", 0.05)
+        await first.add_member("revoked", "b", 60)
+        assert await second.members("revoked") == {"a", "b"}
+        await asyncio.sleep(0.1)
+        assert await second.members("revoked") == {"b"}
+        assert await second.members("other") == set()
+    run_with_stores(kind, tmp_path, test)
+
+
+@pytest.mark.parametrize("kind", ["sqlite", "redis"])
+def test_logout_reaches_other_processes(kind, tmp_path, monkeypatch):
+    token, claims = issue_token("user", "standard", 60)
+
+    async def test(first, second):
+        # This process revokes the token through its store
+        monkeypatch.setattr(auth, "store", first)
+        await handle_logout(claims, logger)
+
+        # Another process knows nothing of it until it syncs from its own store
+        monkeypatch.setattr(auth, "_revoked_here", {})
+        monkeypatch.setattr(auth, "_revoked_shared", set())
+        monkeypatch.setattr(auth, "store", second)
+        assert verify_token(token) is not None
+        sync = asyncio.create_task(auth.sync_revocations())
+        await asyncio.sleep(0.05)
+        sync.cancel()
+        assert verify_token(token) is None
+    run_with_stores(kind, tmp_path, test)
+
+
+def test_redis_errors_are_state_store_errors():
+    async def main():
+        server = await asyncio.start_server(FakeRedis("secret").handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        store = RedisStore(f"redis://:wrong@127.0.0.1:{port}/0")
+        with pytest.raises(StateStoreError):
+            await store.get("key")
+        server.close()
+        await server.wait_closed()
+        # Nothing listens any more
+        with pytest.raises(StateStoreError):
+            await RedisStore(f"redis://127.0.0.1:{port}/0").get("key")
+    asyncio.run(main())
+
+
+def test_open_store_parses_urls(tmp_path):
+    assert open_store("memory").kind == "memory"
+    assert open_store(f"sqlite://{tmp_path}/state.db").path == f"{tmp_path}/state.db"
+    redis = open_store("redis://:p%40ss@example.com:6380/2")
+    assert (redis.host, redis.port, redis.password, redis.db) == ("example.com", 6380, "p@ss", 2)
+    with pytest.raises(ValueError):
+        open_store("etcd://localhost")
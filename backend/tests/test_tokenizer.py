@@ -0,0 +1,37 @@
+# backend/tests/test_tokenizer.py
+
+from tokenizer import ApproxTokenizer, TokenCounter, MAX_TAIL
+
+TEXT = "The quick brown fox, it jumps over the lazy dog!\nUnbelievably, twice."
+
+
+def test_approx_counts_words_and_punctuation():
+    tokenizer = ApproxTokenizer()
+    # "Unbelievably" is 12 characters, three tokens
+    assert tokenizer.count("Unbelievably, twice.") == 3 + 1 + 2 + 1
+
+
+def test_chunked_count_matches_whole_text():
+    tokenizer = ApproxTokenizer()
+    expected = tokenizer.count(TEXT)
+    for size in (1, 2, 3, 5, 7, len(TEXT)):
+        counter = TokenCounter(tokenizer)
+        for i in range(0, len(TEXT), size):
+            counter.add(TEXT[i:i + size])
+        assert counter.total() == expected
+
+
+def test_total_includes_the_held_back_word():
+    counter = TokenCounter(ApproxTokenizer())
+    assert counter.add("the wor") == 2
+    assert counter.tokens == 1
+    # "world" is five characters, two tokens once it is complete
+    assert counter.add("ld") == 3
+
+
+def test_long_run_without_spaces_is_not_held_forever():
+    counter = TokenCounter(ApproxTokenizer())
+    for _ in range(MAX_TAIL):
+        counter.add("abcd")
+    assert len(counter._tail) <= MAX_TAIL
+    assert counter.total() == MAX_TAIL
@@ -0,0 +1,99 @@
+# backend/tokenizer.py
+
+import re
+import logging
+from config import TOKENIZER, TOKENIZER_ENCODING
+
+logger = logging.getLogger(__name__)
+
+# Words, numbers and single punctuation marks, roughly what BPE vocabularies split on
+PIECE_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+# Characters per token within a long word, typical of English BPE vocabularies
+CHARS_PER_TOKEN = 4
+# Longest run without whitespace held back between chunks
+MAX_TAIL = 256
+
+
+class ApproxTokenizer:
+    """Dependency-free estimate: one token per punctuation mark, one per started
+    four characters of a word"""
+
+    name = "approx"
+
+    def count(self, text):
+        return sum(-(-len(piece) // CHARS_PER_TOKEN) for piece in PIECE_RE.findall(text))
+
+
+class TiktokenTokenizer:
+    """Exact counts for OpenAI-style BPE vocabularies, needs the optional tiktoken package"""
+
+    name = "tiktoken"
+
+    def __init__(self, encoding=TOKENIZER_ENCODING):
+        import tiktoken
+        self.encoding = tiktoken.get_encoding(encoding)
+
+    def count(self, text):
+        return len(self.encoding.encode_ordinary(text))
+
+
+# Registered tokenizers by name, as used in TOKENIZER
+tokenizers = {"approx": ApproxTokenizer, "tiktoken": TiktokenTokenizer}
+_tokenizer = None
+
+
+def get_tokenizer():
+    """The configured tokenizer; "auto" uses tiktoken when it is installed"""
+    global _tokenizer
+    if _tokenizer is None:
+        name = TOKENIZER
+        if name == "auto":
+            try:
+                _tokenizer = TiktokenTokenizer()
+            except Exception:
+                _tokenizer = ApproxTokenizer()
+        else:
+            _tokenizer = tokenizers[name]()
+        logger.info(f"Counting tokens with the {_tokenizer.name} tokenizer")
+    return _tokenizer
+
+
+class TokenCounter:
+    """Counts tokens of a stream of text chunks
+
+    A chunk may end inside a word, which a tokenizer would count differently
+    once the rest arrives, so the trailing word is held back and counted with
+    the next chunk. Each character is tokenized once.
+    """
+
+    def __init__(self, tokenizer=None):
+        self.tokenizer = tokenizer or get_tokenizer()
+        self.tokens = 0
+        self._tail = ""
+
+    def add(self, text):
+        text = self._tail + text
+        # Everything up to the last whitespace is complete
+        cut = max(text.rfind(" "), text.rfind("\n")) + 1
+        if len(text) - cut > MAX_TAIL:
+            # No word is that long, count it rather than rescanning it on every chunk
+            cut = len(text)
+        self._tail = text[cut:]
+        if cut:
+            self.tokens += self.tokenizer.count(text[:cut])
+        return self.total()
+
+    def add_complete(self, text):
+        """Count a complete text on its own, such as a reply that was not streamed"""
+        self.tokens += self.tokenizer.count(text)
+        return self.total()
+
+    def total(self):
+        """Tokens so far, the held-back word included"""
+        return self.tokens + (self.tokenizer.count(self._tail) if self._tail else 0)
+
+
+def count_message_tokens(messages):
+    """Tokens of a chat history's contents"""
+    tokenizer = get_tokenizer()
+    return sum(tokenizer.count(str(message.get("content") or "")) for message in messages)
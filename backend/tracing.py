@@ -0,0 +1,220 @@
+# backend/tracing.py
+
+import json
+import random
+import asyncio
+import logging
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+import httpx
+from agent_runtime.tracing import Span, NOOP_SPAN, parse_traceparent, new_id
+from config import TRACE_EXPORTER, TRACE_FILE, TRACE_OTLP_ENDPOINT, TRACE_SAMPLE_RATE, TRACE_FLUSH_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# service.name of spans created here; the runtime reports its own
+SERVICE_NAME = "agent-runner"
+
+# Finished spans waiting for export; the oldest are dropped past this
+MAX_BUFFERED_SPANS = 10000
+
+# Span of the operation in progress in this task, NOOP_SPAN inside an unsampled trace
+_current = contextvars.ContextVar("current_span", default=None)
+
+# OTLP status codes and span kinds
+OTLP_STATUS = {"ok": 1, "error": 2}
+OTLP_KIND = {"internal": 1, "server": 2, "client": 3}
+
+
+def current_span():
+    return _current.get()
+
+
+def start_span(name, parent=None, kind="internal", **attributes):
+    """Start a span under `parent` (a span or a traceparent header), else under the
+    current span, else as the root of a new trace
+
+    Returns NOOP_SPAN when tracing is off or the trace is not sampled, so
+    callers never check.
+    """
+    if not TRACE_EXPORTER:
+        return NOOP_SPAN
+    if parent is None:
+        parent = _current.get()
+
+    if isinstance(parent, str):
+        context = parse_traceparent(parent)
+        if context is not None:
+            if not context[2]:
+                return NOOP_SPAN
+            return Span(name, context[0], context[1], attributes, SERVICE_NAME, kind, exporter.export)
+        parent = None
+
+    if parent is None:
+        if random.random() >= TRACE_SAMPLE_RATE:
+            return NOOP_SPAN
+        return Span(name, new_id(16), None, attributes, SERVICE_NAME, kind, exporter.export)
+    return parent.child(name, **attributes)
+
+
+@contextmanager
+def span(name, parent=None, **attributes):
+    """Run a block in a new span, current for everything awaited inside it
+
+    Not for blocks that yield from an async generator: the current span
+    belongs to the task and must be reset in the same one.
+    """
+    new_span = start_span(name, parent, **attributes)
+    token = _current.set(new_span)
+    try:
+        yield new_span
+    except BaseException as e:
+        new_span.record_error(e)
+        raise
+    finally:
+        _current.reset(token)
+        new_span.end()
+
+
+@contextmanager
+def use(active_span):
+    """Make a span current for a block without ending it"""
+    token = _current.set(active_span)
+    try:
+        yield active_span
+    finally:
+        _current.reset(token)
+
+
+def detach():
+    """Leave the current trace, for background tasks created from inside a request"""
+    _current.set(None)
+
+
+def annotate(**attributes):
+    """Add attributes to the current span, if there is one"""
+    active = _current.get()
+    if active:
+        active.set_attributes(**attributes)
+
+
+def traceparent():
+    """Header value for the current span, or None"""
+    active = _current.get()
+    return active.traceparent() if active else None
+
+
+async def traced_stream(stream_span, stream):
+    """Pass a stream through, ending the span when it ends or the client disconnects"""
+    try:
+        async for chunk in stream:
+            yield chunk
+    except BaseException as e:
+        stream_span.record_error(e)
+        raise
+    finally:
+        stream_span.end()
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(spans):
+    """OTLP/HTTP JSON body for span dicts, grouped by service"""
+    services = {}
+    for item in spans:
+        services.setdefault(item.get("service") or SERVICE_NAME, []).append({
+            "traceId": item["trace_id"],
+            "spanId": item["span_id"],
+            "parentSpanId": item.get("parent_span_id") or "",
+            "name": item["name"],
+            "kind": OTLP_KIND.get(item.get("kind"), 1),
+            "startTimeUnixNano": str(item["start_time_unix_nano"]),
+            "endTimeUnixNano": str(item["end_time_unix_nano"]),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in (item.get("attributes") or {}).items()],
+            "status": {"code": OTLP_STATUS.get(item.get("status"), 0), "message": item.get("status_message") or ""},
+        })
+    return {"resourceSpans": [
+        {
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service}}]},
+            "scopeSpans": [{"scope": {"name": "near-docker-runner"}, "spans": service_spans}],
+        }
+        for service, service_spans in services.items()
+    ]}
+
+
+class SpanExporter:
+    """Batches finished spans and writes them out in the background
+
+    export() only appends to a buffer, so recording a span never waits on
+    disk or network. Every TRACE_FLUSH_SECONDS the batch goes to TRACE_FILE
+    as JSON lines, or to an OTLP/HTTP collector as one JSON request.
+    """
+
+    def __init__(self, kind=TRACE_EXPORTER):
+        self.kind = kind
+        self.buffer = deque(maxlen=MAX_BUFFERED_SPANS)
+        self.exported = 0
+        self.failed = 0
+        self._task = None
+        self._client = None
+
+    def export(self, span_dict):
+        self.buffer.append(span_dict)
+        if self._task is None or self._task.done():
+            try:
+                self._task = asyncio.get_running_loop().create_task(self._run())
+            except RuntimeError:
+                # No loop yet, the first span recorded inside one starts the flusher
+                pass
+
+    async def _run(self):
+        while self.buffer:
+            await asyncio.sleep(TRACE_FLUSH_SECONDS)
+            await self.flush()
+
+    async def flush(self):
+        batch = list(self.buffer)
+        self.buffer.clear()
+        if not batch:
+            return
+        try:
+            if self.kind == "otlp":
+                if self._client is None:
+                    self._client = httpx.AsyncClient(timeout=10.0)
+                response = await self._client.post(TRACE_OTLP_ENDPOINT, json=to_otlp(batch))
+                response.raise_for_status()
+            else:
+                lines = "".join(json.dumps(item) + "\n" for item in batch)
+                await asyncio.get_running_loop().run_in_executor(None, self._append, lines)
+            self.exported += len(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            logger.error(f"Failed to export {len(batch)} spans: {str(e)}")
+
+    @staticmethod
+    def _append(lines):
+        with open(TRACE_FILE, 'a', encoding='utf-8') as f:
+            f.write(lines)
+
+    async def close(self):
+        """Export what is left, used on shutdown"""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        await self.flush()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# Exporter shared by every span of this process
+exporter = SpanExporter()